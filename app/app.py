@@ -1,8 +1,9 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 import endpoints
+import metrics
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 from db_init import init_db
@@ -78,6 +79,11 @@ def serve_index():
     
     return HTMLResponse("<h1>index.html no encontrado</h1>", status_code=404)
 
+# Métricas en formato de texto de Prometheus
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/docs", include_in_schema=False)
 async def custom_swagger_ui_html():
     return get_swagger_ui_html(
@@ -0,0 +1,137 @@
+"""
+Bulk import throughput on a generated plan.
+
+Writes a plan with `--lines` lines (1M by default) over `--models` SKUs as
+NDJSON, CSV and plan.json-style JSON, imports each file into a fresh
+database with the streaming bulk importer and reports lines per second and
+peak memory. The previous row-by-row import (one delete and one insert per
+plan line) is timed on the first `--baseline-lines` lines for comparison.
+
+Usage (from the app directory):
+    python -m benchmarks.bulk_import [--lines 1000000] [--models 500] [--formats ndjson csv json]
+"""
+import argparse
+import csv
+import json
+import resource
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(APP_DIR))
+
+from sqlalchemy import and_  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from bulk_import import import_file, read_plan  # noqa: E402
+from database import DailyPlan, create_db_engine  # noqa: E402
+from db_init import create_schema  # noqa: E402
+
+
+def generate_plan(workdir: Path, lines: int, models: int, formats: list[str]) -> dict[str, Path]:
+    names = [f"SKU-{i:05d}" for i in range(models)]
+    start = date(2025, 1, 1)
+    rows = ((start + timedelta(days=i // models), names[i % models], 1 + i % 10) for i in range(lines))
+
+    paths = {fmt: workdir / f"plan.{fmt}" for fmt in formats}
+    files = {fmt: open(path, "w", newline="") for fmt, path in paths.items()}
+    try:
+        writer = csv.writer(files["csv"]) if "csv" in files else None
+        if writer:
+            writer.writerow(["day", "model", "quantity"])
+        if "json" in files:
+            files["json"].write('{"models": {}, "plan": [')
+        current_day, orders, first_day = None, [], True
+
+        def flush_day():
+            nonlocal first_day
+            if "json" in files and orders:
+                files["json"].write(("" if first_day else ",") + json.dumps(
+                    {"day": current_day.strftime("%d/%m/%Y"), "orders": orders}))
+                first_day = False
+
+        for day, model, quantity in rows:
+            if "ndjson" in files:
+                files["ndjson"].write(json.dumps({"day": day.isoformat(), "model": model, "quantity": quantity}) + "\n")
+            if writer:
+                writer.writerow([day.isoformat(), model, quantity])
+            if day != current_day:
+                flush_day()
+                current_day, orders = day, []
+            orders.append({"model": model, "quantity": quantity})
+        flush_day()
+        if "json" in files:
+            files["json"].write("]}")
+    finally:
+        for f in files.values():
+            f.close()
+    return paths
+
+
+def fresh_session(db_path: Path):
+    db_engine = create_db_engine(str(db_path))
+    create_schema(db_engine)
+    return sessionmaker(bind=db_engine)()
+
+
+def run_bulk(path: Path, fmt: str, db_path: Path) -> dict:
+    session = fresh_session(db_path)
+    try:
+        started = time.perf_counter()
+        stats = import_file(str(path), session, "plan", fmt)
+        elapsed = time.perf_counter() - started
+        return {
+            "format": fmt,
+            "lines": stats["plan"],
+            "file_mb": round(path.stat().st_size / 1e6, 1),
+            "seconds": round(elapsed, 2),
+            "lines_per_second": round(stats["plan"] / elapsed),
+        }
+    finally:
+        session.close()
+
+
+def run_baseline(path: Path, lines: int, db_path: Path) -> dict:
+    """The previous plan import loop: one delete and one insert per line, one commit at the end"""
+    session = fresh_session(db_path)
+    try:
+        with open(path) as f:
+            plan = [row for _, row in zip(range(lines), read_plan(f, "ndjson"))]
+        started = time.perf_counter()
+        for day, model, quantity in plan:
+            session.query(DailyPlan).filter(and_(DailyPlan.day == day, DailyPlan.model == model)).delete()
+            session.add(DailyPlan(day=day, model=model, quantity=quantity, status="pending"))
+        session.commit()
+        elapsed = time.perf_counter() - started
+        return {
+            "format": "row-by-row",
+            "lines": len(plan),
+            "seconds": round(elapsed, 2),
+            "lines_per_second": round(len(plan) / elapsed),
+        }
+    finally:
+        session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--models", type=int, default=500)
+    parser.add_argument("--formats", nargs="+", default=["ndjson", "csv", "json"], choices=["ndjson", "csv", "json"])
+    parser.add_argument("--baseline-lines", type=int, default=20_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="sim-import-") as tmp:
+        workdir = Path(tmp)
+        paths = generate_plan(workdir, args.lines, args.models, sorted(set(args.formats) | {"ndjson"}))
+        for fmt in args.formats:
+            print(json.dumps(run_bulk(paths[fmt], fmt, workdir / f"bulk-{fmt}.db")))
+        if args.baseline_lines:
+            print(json.dumps(run_baseline(paths["ndjson"], args.baseline_lines, workdir / "baseline.db")))
+        print(json.dumps({"peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}))
+
+
+if __name__ == "__main__":
+    main()
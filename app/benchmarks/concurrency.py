@@ -0,0 +1,103 @@
+"""
+Dashboard read latency while the simulator writes.
+
+Runs `run_simulation` for several days in a background thread against a
+fresh database and measures, in parallel, the latency of the read
+endpoints the dashboard polls. Each journal mode runs in its own process
+on its own temporary copy of the seed data.
+
+Usage (from the app directory):
+    python -m benchmarks.concurrency [--days 200] [--modes wal delete]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent
+SEED_DIR = APP_DIR.parent / "data"
+SEED_FILES = ["plan.json", "providers.json", "inventory_init.json"]
+READ_PATHS = ["/app/inventory/", "/app/plan/", "/app/events/page?limit=100"]
+
+
+def run_mode(days: int) -> dict:
+    """Runs inside a child process whose cwd is a fresh data directory"""
+    sys.path.insert(0, str(APP_DIR))
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from db_init import init_db
+    import endpoints
+
+    init_db()
+    app = FastAPI()
+    app.include_router(endpoints.router)
+    client = TestClient(app)
+
+    latencies = []
+    done = threading.Event()
+
+    def writer():
+        try:
+            client.post(f"/app/simulator/run?days={days}")
+        finally:
+            done.set()
+
+    thread = threading.Thread(target=writer)
+    started = time.perf_counter()
+    thread.start()
+    while not done.is_set():
+        for path in READ_PATHS:
+            t0 = time.perf_counter()
+            client.get(path)
+            latencies.append((time.perf_counter() - t0) * 1000)
+    thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "journal_mode": os.environ["SIM_SQLITE_JOURNAL_MODE"],
+        "days": days,
+        "run_seconds": round(elapsed, 3),
+        "reads": len(latencies),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        "max_ms": round(latencies[-1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=200)
+    parser.add_argument("--modes", nargs="+", default=["wal", "delete"])
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_mode(args.days)))
+        return
+
+    for mode in args.modes:
+        workdir = Path(tempfile.mkdtemp(prefix="sim-bench-"))
+        try:
+            (workdir / "data").mkdir()
+            for name in SEED_FILES:
+                shutil.copy(SEED_DIR / name, workdir / "data" / name)
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.concurrency", "--child", "--days", str(args.days)],
+                cwd=workdir, capture_output=True, text=True, check=True,
+                env={**os.environ, "SIM_SQLITE_JOURNAL_MODE": mode, "PYTHONPATH": str(APP_DIR)},
+            ).stdout
+            print(output.strip().splitlines()[-1])
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
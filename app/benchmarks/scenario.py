@@ -0,0 +1,75 @@
+"""
+Synthetic scenario generator.
+
+Writes plan.json, providers.json and inventory_init.json in the layouts of
+the seed files under data/: `--products` finished products with random
+BOMs over `--materials` raw materials, one to three suppliers per material
+with random costs, lead times and capacities, an initial inventory and
+`--days` days of plan. The same seed always gives the same files.
+
+Usage (from the app directory):
+    python -m benchmarks.scenario --out /tmp/scenario/data [--products 50] [--materials 300] [--days 90] [--seed 1]
+"""
+import argparse
+import json
+import random
+from datetime import date, timedelta
+from pathlib import Path
+
+START = date(2025, 5, 18)  # first plan day, fixed so a seed always gives the same files
+
+
+def generate_scenario(data_dir: Path, products: int, materials: int, days: int, seed: int = 1,
+                      start: date = START) -> dict:
+    """Write the three seed files to `data_dir` and return their sizes"""
+    rng = random.Random(seed)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    material_names = [f"MAT-{i:05d}" for i in range(materials)]
+    model_names = [f"SKU-{i:04d}" for i in range(products)]
+
+    models = {
+        name: {"bom": {material: rng.randint(1, 3)
+                       for material in rng.sample(material_names, min(materials, rng.randint(3, 8)))}}
+        for name in model_names
+    }
+    lines_per_day = max(1, products // 5)
+    plan = []
+    for offset in range(days):
+        orders = [{"model": rng.choice(model_names), "quantity": rng.randint(1, 10)}
+                  for _ in range(rng.randint(1, 2 * lines_per_day))]
+        plan.append({"day": (start + timedelta(days=offset)).strftime("%d/%m/%Y"), "orders": orders})
+    with open(data_dir / "plan.json", "w") as f:
+        json.dump({"capacity_per_day": lines_per_day * 6, "models": models, "plan": plan}, f)
+
+    providers = [{"name": f"Supplier-{i:03d}", "materials": {}} for i in range(max(3, materials // 20))]
+    for material in material_names:
+        for provider in rng.sample(providers, rng.randint(1, 3)):
+            provider["materials"][material] = {
+                "unit_cost": round(rng.uniform(1, 100), 2),
+                "lead_time_days": rng.randint(1, 5),
+                "lead_time_std": rng.choice([0, 0, 0.5, 1]),
+                "capacity_per_day": rng.choice([None, None, 200, 500]),
+            }
+    with open(data_dir / "providers.json", "w") as f:
+        json.dump({"providers": providers}, f)
+
+    with open(data_dir / "inventory_init.json", "w") as f:
+        json.dump({material: rng.randint(200, 1000) for material in material_names}, f)
+
+    return {"products": products, "materials": materials, "plan_days": days,
+            "plan_lines": sum(len(day["orders"]) for day in plan)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--materials", type=int, default=300)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps(generate_scenario(args.out, args.products, args.materials, args.days, args.seed)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Benchmark suite over synthetic scenarios.
+
+For every scale point a scenario is generated with benchmarks.scenario
+(fixed seed) and measured in its own process on a fresh data directory:
+
+- import time of the seed files into a new database
+- run_one_day throughput of every engine mode, each on a copy of the import
+- add_to_production latency on the first pending plan lines
+- latency of the dashboard read endpoints through the FastAPI TestClient
+
+Results are written as JSON. With --baseline, every metric is compared
+with the baseline file and the run fails (exit status 1) when one is worse
+by more than --threshold.
+
+Usage (from the app directory):
+    python -m benchmarks.suite [--scales small medium] [--days 30] [--output benchmarks/results/latest.json]
+                               [--baseline benchmarks/results/baseline.json] [--threshold 0.25]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(APP_DIR))
+
+from benchmarks.scenario import generate_scenario  # noqa: E402
+
+SCALES = {
+    "small": {"products": 10, "materials": 40, "days": 60},
+    "medium": {"products": 50, "materials": 300, "days": 120},
+    "large": {"products": 200, "materials": 2000, "days": 240},
+}
+MODES = ["db", "sql", "memory"]
+READ_PATHS = ["/app/inventory/", "/app/plan/", "/app/events/page?limit=100", "/app/kpi", "/app/mrp",
+              "/app/production/orders/"]
+# Differences below these are noise whatever the ratio
+ABSOLUTE_TOLERANCE = {"_ms": 0.5, "_seconds": 0.01, "_per_second": 0.0}
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))], 3)
+
+
+def run_scale(days: int, modes: list[str], samples: int) -> dict:
+    """Runs inside a child process whose cwd holds the generated data directory"""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from sqlalchemy import func
+    from sqlalchemy.orm import sessionmaker
+    from database import DB_PATH, DailyPlan, SimulationState, create_db_engine, get_session
+    from db_init import init_db
+    from memory_engine import InMemorySimulationEngine
+    from production import add_to_production
+    from scenarios import copy_database
+    from simulator import SimulationEngine
+    from sql_engine import SetBasedSimulationEngine
+    import endpoints
+
+    engines = {"db": SimulationEngine, "sql": SetBasedSimulationEngine, "memory": InMemorySimulationEngine}
+    metrics = {}
+
+    started = time.perf_counter()
+    init_db()
+    metrics["import_seconds"] = round(time.perf_counter() - started, 3)
+
+    # The import starts the simulation today; start it on the first plan day so every run simulates the same dates
+    session = get_session()
+    session.query(SimulationState).update({SimulationState.current_day: session.query(func.min(DailyPlan.day)).scalar()})
+    session.commit()
+    session.close()
+
+    # Engine throughput, each mode on its own copy of the imported database
+    for mode in modes:
+        path = f"data/bench-{mode}.db"
+        copy_database(DB_PATH, path)
+        db_engine = create_db_engine(path)
+        session = sessionmaker(bind=db_engine)()
+        engine = engines[mode](session, seed=1, verbose=False)
+        started = time.perf_counter()
+        for _ in range(days):
+            engine.run_one_day()
+        metrics[f"run_one_day.{mode}.days_per_second"] = round(days / (time.perf_counter() - started), 2)
+        session.close()
+        db_engine.dispose()
+
+    # The remaining measures run on a simulated history, so reads return real pages
+    copy_database(f"data/bench-{modes[0]}.db", DB_PATH)
+
+    session = get_session()
+    plan_ids = [plan_id for (plan_id,) in session.query(DailyPlan.id).filter(
+        DailyPlan.status == "pending"
+    ).order_by(DailyPlan.day, DailyPlan.id).limit(samples)]
+    latencies, released = [], 0
+    for plan_id in plan_ids:
+        started = time.perf_counter()
+        released += add_to_production(plan_id, session) == "ok"
+        latencies.append((time.perf_counter() - started) * 1000)
+    session.close()
+    if latencies:
+        metrics["add_to_production.p50_ms"] = _percentile(latencies, 0.5)
+        metrics["add_to_production.p95_ms"] = _percentile(latencies, 0.95)
+
+    app = FastAPI()
+    app.include_router(endpoints.router)
+    client = TestClient(app)
+    for path in READ_PATHS:
+        latencies = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            client.get(path).raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+        metrics[f"read.{path}.p50_ms"] = _percentile(latencies, 0.5)
+        metrics[f"read.{path}.p95_ms"] = _percentile(latencies, 0.95)
+
+    return {"metrics": metrics, "add_to_production_released": released}
+
+
+def measure(scale: str, days: int, modes: list[str], samples: int, seed: int) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix="sim-suite-"))
+    try:
+        scenario = generate_scenario(workdir / "data", seed=seed, **SCALES[scale])
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.suite", "--child", "--days", str(days),
+             "--modes", *modes, "--samples", str(samples)],
+            cwd=workdir, capture_output=True, text=True, check=True,
+            env={**os.environ, "PYTHONPATH": str(APP_DIR)},
+        ).stdout
+        return {"scenario": scenario, **json.loads(output.strip().splitlines()[-1])}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Metrics worse than the baseline by more than `threshold` (a fraction) and the absolute tolerance"""
+    regressions = []
+    for scale, current in results["scales"].items():
+        previous = baseline.get("scales", {}).get(scale, {}).get("metrics", {})
+        for name, value in current["metrics"].items():
+            old = previous.get(name)
+            if old is None:
+                continue
+            suffix = next(s for s in ABSOLUTE_TOLERANCE if name.endswith(s))
+            if suffix == "_per_second":
+                worse = value < old * (1 - threshold)
+            else:
+                worse = value > old * (1 + threshold) and value - old > ABSOLUTE_TOLERANCE[suffix]
+            if worse:
+                regressions.append(f"{scale} {name}: {old} -> {value}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", nargs="+", default=["small", "medium"], choices=list(SCALES))
+    parser.add_argument("--days", type=int, default=30, help="simulated days per engine mode")
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--samples", type=int, default=50, help="calls per latency measure")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, default=APP_DIR / "benchmarks" / "results" / "latest.json")
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_scale(args.days, args.modes, args.samples)))
+        return
+
+    results = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "days": args.days,
+        "seed": args.seed,
+        "scales": {},
+    }
+    for scale in args.scales:
+        results["scales"][scale] = measure(scale, args.days, args.modes, args.samples, args.seed)
+        print(json.dumps({"scale": scale, **results["scales"][scale]}))
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESIÓN {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
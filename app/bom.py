@@ -0,0 +1,168 @@
+import threading
+import weakref
+from collections import Counter
+from sqlalchemy.orm import Session
+from database import BOM
+
+
+class BOMCycleError(ValueError):
+    """A BOM line would make a product a component of itself"""
+
+
+class BOMGraph:
+    """
+    Multi-level BOM: a component may itself have BOM lines (a sub-assembly).
+    Products without BOM lines are raw materials. The flattened raw-material
+    explosion of every product is memoized; changing a line only drops the
+    explosions of that product and of its ancestors.
+    """
+
+    def __init__(self, lines=()):
+        self.children: dict[int, dict[int, int]] = {}  # product -> {component: quantity per unit}
+        self.parents: dict[int, set[int]] = {}  # component -> products that use it
+        self.lock = threading.RLock()
+        self.version = 0  # bumped on every change, for callers that derive data from the explosions
+        self._explosions: dict[int, dict[int, int]] = {}
+        for parent, component, quantity in lines:
+            self.children.setdefault(parent, {})[component] = quantity
+            self.parents.setdefault(component, set()).add(parent)
+        self.topological_order()  # raises BOMCycleError on a cyclic BOM
+
+    @classmethod
+    def load(cls, db: Session) -> "BOMGraph":
+        return cls(db.query(BOM.finished_product_id, BOM.material_id, BOM.quantity))
+
+    def path(self, start: int, target: int) -> list[int] | None:
+        """Products from `start` down to its component `target`, or None if it is not one"""
+        stack, seen = [(start, [start])], {start}
+        while stack:
+            product_id, path = stack.pop()
+            if product_id == target:
+                return path
+            for component in self.children.get(product_id, ()):
+                if component not in seen:
+                    seen.add(component)
+                    stack.append((component, path + [component]))
+        return None
+
+    def topological_order(self) -> list[int]:
+        """Products with BOM lines, every one after all of its sub-assemblies"""
+        pending = {product_id: sum(1 for c in components if c in self.children)
+                   for product_id, components in self.children.items()}
+        ready = [product_id for product_id, count in pending.items() if count == 0]
+        order = []
+        while ready:
+            product_id = ready.pop()
+            order.append(product_id)
+            for parent in self.parents.get(product_id, ()):
+                pending[parent] -= 1
+                if pending[parent] == 0:
+                    ready.append(parent)
+        if len(order) < len(self.children):
+            # Every product left over sits on a cycle or above one; follow components until one repeats
+            product_id = next(p for p, count in pending.items() if count > 0)
+            path = []
+            while product_id not in path:
+                path.append(product_id)
+                product_id = next(c for c in self.children[product_id] if pending.get(c, 0) > 0)
+            cycle = path[path.index(product_id):] + [product_id]
+            raise BOMCycleError(f"Ciclo en la BOM: {' -> '.join(map(str, cycle))}")
+        return order
+
+    def explode(self, product_id: int) -> dict[int, int]:
+        """Raw materials per unit of `product_id` through every BOM level (empty for a raw material)"""
+        with self.lock:
+            explosion = self._explosions.get(product_id)
+            if explosion is None and product_id in self.children:
+                # Post-order over the uncached sub-assemblies: components are exploded before their parents
+                stack = [(product_id, False)]
+                while stack:
+                    node, expanded = stack.pop()
+                    if node in self._explosions:
+                        continue
+                    if expanded:
+                        self._explosions[node] = self._flatten(node)
+                        continue
+                    stack.append((node, True))
+                    stack.extend((c, False) for c in self.children[node]
+                                 if c in self.children and c not in self._explosions)
+                explosion = self._explosions[product_id]
+            return explosion or {}
+
+    def _flatten(self, product_id: int) -> dict[int, int]:
+        flat = Counter()
+        for component, quantity in self.children[product_id].items():
+            sub = self._explosions.get(component)
+            if sub is None:
+                flat[component] += quantity
+            else:
+                for material_id, per_unit in sub.items():
+                    flat[material_id] += quantity * per_unit
+        return dict(flat)
+
+    def explode_all(self) -> dict[int, dict[int, int]]:
+        """Explosion of every product with BOM lines, computed in topological order"""
+        with self.lock:
+            for product_id in self.topological_order():
+                if product_id not in self._explosions:
+                    self._explosions[product_id] = self._flatten(product_id)
+            return dict(self._explosions)
+
+    def check_item(self, product_id: int, component_id: int):
+        """Raise BOMCycleError if `component_id` contains `product_id` at some level"""
+        path = self.path(component_id, product_id)
+        if path is not None:
+            raise BOMCycleError(f"Ciclo en la BOM: {' -> '.join(map(str, [product_id] + path))}")
+
+    def set_item(self, product_id: int, component_id: int, quantity: int):
+        with self.lock:
+            self.check_item(product_id, component_id)
+            self.children.setdefault(product_id, {})[component_id] = quantity
+            self.parents.setdefault(component_id, set()).add(product_id)
+            self.version += 1
+            self._invalidate(product_id)
+
+    def remove_item(self, product_id: int, component_id: int):
+        with self.lock:
+            components = self.children.get(product_id, {})
+            if components.pop(component_id, None) is None:
+                return
+            if not components:
+                del self.children[product_id]
+            self.parents[component_id].discard(product_id)
+            self.version += 1
+            self._invalidate(product_id)
+
+    def _invalidate(self, product_id: int):
+        # A cached explosion implies cached explosions below it, so the walk
+        # stops at the first ancestor that is not cached. The product itself
+        # may have been a raw material until now, so its parents are always visited.
+        self._explosions.pop(product_id, None)
+        stack = list(self.parents.get(product_id, ()))
+        while stack:
+            node = stack.pop()
+            if self._explosions.pop(node, None) is not None:
+                stack.extend(self.parents.get(node, ()))
+
+
+# One graph per database engine (i.e. per scenario), shared by every session on it
+_graphs: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_graphs_lock = threading.Lock()
+
+
+def bom_graph(db: Session) -> BOMGraph:
+    """The cached BOM graph of the database behind `db`, loaded on first use"""
+    bind = db.get_bind()
+    with _graphs_lock:
+        graph = _graphs.get(bind)
+    if graph is None:
+        graph = BOMGraph.load(db)
+        with _graphs_lock:
+            graph = _graphs.setdefault(bind, graph)
+    return graph
+
+
+def invalidate_bom_graph(bind):
+    """Drop the cached graph after the bom table was written outside set_item/remove_item"""
+    with _graphs_lock:
+        _graphs.pop(bind, None)
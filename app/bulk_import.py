@@ -0,0 +1,546 @@
+import csv
+import json
+import os
+from collections import Counter
+from datetime import date, datetime
+from itertools import islice
+from sqlalchemy import delete, insert, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from bom import BOMGraph, invalidate_bom_graph
+from database import BOM, DailyPlan, Inventory, Product, ProductionOrder, PurchaseOrder, SimulationState, Supplier
+from ledger import InventoryLedger
+
+# Rows written per executemany; the input is never held in memory as a whole
+CHUNK_SIZE = 5000
+READ_SIZE = 1 << 16
+
+FORMATS = {".json": "json", ".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv"}
+
+
+def detect_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError(f"Formato de importación no soportado: {ext or path}")
+    return FORMATS[ext]
+
+
+# --- Lectura en streaming ---
+
+class JSONStream:
+    """
+    Incremental reader for a JSON document: walks the top-level object key
+    by key and yields array items one at a time, so only the item being
+    parsed is in memory.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(READ_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def _expect(self, char: str):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"JSON no válido: se esperaba '{char}' y se encontró '{found}'")
+        self.pos += 1
+
+    def _separator(self, close: str) -> bool:
+        """Consume ',' (more items follow) or the closing bracket"""
+        found = self._peek()
+        self.pos += 1
+        if found == close:
+            return False
+        if found != ",":
+            raise ValueError(f"JSON no válido: se esperaba ',' o '{close}' y se encontró '{found}'")
+        return True
+
+    def value(self):
+        """Decode the next complete value"""
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def array(self):
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if not self._separator("]"):
+                return
+
+    def keys(self):
+        """Keys of the top-level object. Read each value with value() or array() before advancing."""
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self._expect(":")
+            yield key
+            if not self._separator("}"):
+                return
+
+
+def _parse_day(value, cache: dict) -> date:
+    day = cache.get(value)
+    if day is None:
+        if isinstance(value, date):
+            day = value
+        elif not isinstance(value, str):
+            raise ValueError(f"Fecha no válida: {value!r}")
+        elif "/" in value:
+            day = datetime.strptime(value, "%d/%m/%Y").date()
+        else:
+            day = date.fromisoformat(value)
+        cache[value] = day
+    return day
+
+
+def _lines(f, fmt: str):
+    """Flat records of an NDJSON or CSV file as dicts"""
+    if fmt == "ndjson":
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(f)
+
+
+def read_plan(f, fmt: str, models: dict = None, settings: dict = None):
+    """
+    (day, model, quantity) of every plan line. JSON files use the plan.json
+    layout; their "models" section is stored in `models` and their
+    "capacity_per_day" in `settings`, if given.
+    NDJSON lines are either {"day", "model", "quantity"} or {"day", "orders": [...]}.
+    """
+    days = {}
+    if fmt == "json":
+        stream = JSONStream(f)
+        for key in stream.keys():
+            if key == "plan":
+                for plan in stream.array():
+                    day = _parse_day(plan["day"], days)
+                    for order in plan["orders"]:
+                        yield day, order["model"], int(order["quantity"])
+            elif key == "models" and models is not None:
+                models.update(stream.value())
+            elif key == "capacity_per_day" and settings is not None:
+                settings[key] = int(stream.value())
+            else:
+                stream.value()
+        return
+    for record in _lines(f, fmt):
+        day = _parse_day(record["day"], days)
+        for order in record.get("orders") or [record]:
+            yield day, order["model"], int(order["quantity"])
+
+
+def read_bom(f, fmt: str):
+    """(model, material, quantity) from {"models": {model: {"bom": {...}}}} or flat records"""
+    if fmt == "json":
+        stream = JSONStream(f)
+        for key in stream.keys():
+            if key == "models":
+                yield from _bom_rows(stream.value())
+            else:
+                stream.value()
+        return
+    for record in _lines(f, fmt):
+        yield record["model"], record["material"], record["quantity"]
+
+
+def _bom_rows(models: dict):
+    for model, data in models.items():
+        for material, quantity in data["bom"].items():
+            yield model, material, quantity
+
+
+SUPPLIER_TERMS = ("unit_cost", "lead_time_days", "lead_time_std", "capacity_per_day")
+
+
+def _supplier_terms(info: dict, defaults: dict = None) -> tuple[float, int, float, int | None]:
+    """(unit_cost, lead_time_days, lead_time_std, capacity_per_day); a provider's values apply to all its materials"""
+    terms = {**(defaults or {}), **info}
+    capacity = terms.get("capacity_per_day")
+    return (float(terms["unit_cost"]), int(terms.get("lead_time_days") or 3), float(terms.get("lead_time_std") or 0),
+            int(capacity) if capacity not in (None, "") else None)
+
+
+def read_providers(f, fmt: str):
+    """(provider, material, terms) from the providers.json layout or flat records, see _supplier_terms"""
+    if fmt == "json":
+        stream = JSONStream(f)
+        for key in stream.keys():
+            if key == "providers":
+                for provider in stream.array():
+                    for material, info in provider["materials"].items():
+                        yield provider["name"], material, _supplier_terms(info, provider)
+            else:
+                stream.value()
+        return
+    for record in _lines(f, fmt):
+        yield record.get("provider") or record["name"], record["material"], _supplier_terms(record)
+
+
+def read_inventory(f, fmt: str):
+    """(material, quantity) from the inventory_init.json layout or flat records"""
+    if fmt == "json":
+        stream = JSONStream(f)
+        for material in stream.keys():
+            yield material, int(stream.value())
+        return
+    for record in _lines(f, fmt):
+        yield record["material"], int(record["quantity"])
+
+
+def _orders(f, fmt: str):
+    """Order records from the {"orders": [...]} layout or flat records"""
+    if fmt == "json":
+        stream = JSONStream(f)
+        for key in stream.keys():
+            if key == "orders":
+                yield from stream.array()
+            else:
+                stream.value()
+        return
+    yield from _lines(f, fmt)
+
+
+def read_production_orders(f, fmt: str):
+    """(product, quantity, status, creation_date, expected_completion_date, priority); the date is also the due date"""
+    days = {}
+    for order in _orders(f, fmt):
+        yield (order["product"], int(order["quantity"]), order.get("status") or "pending",
+               _parse_day(order["creation_date"], days), _parse_day(order["expected_completion_date"], days),
+               int(order.get("priority") or 0))
+
+
+def read_purchase_orders(f, fmt: str):
+    """(supplier, product, quantity, status, issue_date, expected_delivery_date)"""
+    days = {}
+    for order in _orders(f, fmt):
+        yield (order["supplier"], order["product"], int(order["quantity"]), order.get("status") or "pending",
+               _parse_day(order["issue_date"], days), _parse_day(order["expected_delivery_date"], days))
+
+
+READERS = {
+    "plan": read_plan,
+    "bom": read_bom,
+    "providers": read_providers,
+    "inventory": read_inventory,
+    "production_orders": read_production_orders,
+    "purchase_orders": read_purchase_orders,
+}
+
+
+def _chunks(rows, size: int):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+# --- Escritura por lotes ---
+
+class BulkImporter:
+    """
+    Writes imported rows in chunks with executemany and INSERT ... ON CONFLICT.
+    Product names are resolved from one map loaded up front; unknown names
+    are created once per chunk. Nothing is committed until commit(), unless
+    `on_chunk(kind, rows)` commits after each chunk.
+    """
+
+    def __init__(self, db: Session, chunk_size: int = CHUNK_SIZE, on_chunk=None):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.on_chunk = on_chunk
+        self.products: dict[str, int] = dict(db.query(Product.name, Product.id))
+        self.suppliers: dict[tuple[str, int], int] | None = None
+        self.stats = Counter()
+
+    def _chunk_done(self, kind: str, read: int, written: int):
+        self.stats[kind] += written
+        if self.on_chunk is not None:
+            self.on_chunk(kind, read)
+
+    def _known_product(self, name: str) -> int:
+        if name not in self.products:
+            raise ValueError(f"Producto no encontrado: {name}")
+        return self.products[name]
+
+    def product_ids(self, names: dict[str, str]) -> dict[str, int]:
+        """Ids of `names` (name -> type), creating the unknown products in the given order"""
+        missing = [name for name in names if name not in self.products]
+        if missing:
+            self.db.execute(
+                sqlite_insert(Product).on_conflict_do_nothing(index_elements=["name"]),
+                [{"name": name, "type": names[name]} for name in missing],
+            )
+            self.products.update(self.db.query(Product.name, Product.id).filter(Product.name.in_(missing)))
+            self.stats["products"] += len(missing)
+        return self.products
+
+    def plan(self, rows):
+        """A (day, model) pair is a single plan line: importing it again replaces the previous one"""
+        for chunk in _chunks(rows, self.chunk_size):
+            lines = {(day, model): quantity for day, model, quantity in chunk}
+            # The day filter lets SQLite search ix_daily_plan_day instead of scanning for the pairs
+            self.db.execute(
+                delete(DailyPlan).where(
+                    DailyPlan.day.in_({day for day, _ in lines}),
+                    tuple_(DailyPlan.day, DailyPlan.model).in_(list(lines)),
+                ),
+                execution_options={"synchronize_session": False},
+            )
+            self.db.execute(insert(DailyPlan), [
+                {"day": day, "model": model, "quantity": quantity, "status": "pending"}
+                for (day, model), quantity in lines.items()
+            ])
+            self._chunk_done("plan", len(chunk), len(lines))
+
+    def bom(self, rows):
+        """A material may itself be a model with BOM lines; lines that would close a cycle are rejected"""
+        graph = BOMGraph.load(self.db)
+        try:
+            self._bom(rows, graph)
+        finally:
+            # Written chunks may already be committed: the shared graph reloads on next use
+            invalidate_bom_graph(self.db.get_bind())
+
+    def _bom(self, rows, graph: BOMGraph):
+        for chunk in _chunks(rows, self.chunk_size):
+            valid = []
+            for model, material, quantity in chunk:
+                if not isinstance(quantity, int) and not str(quantity).isdigit():
+                    print(f"Ignorando '{material}': valor no entero ({quantity})")
+                    continue
+                valid.append((model, material, int(quantity)))
+            if not valid:
+                self._chunk_done("bom", len(chunk), 0)
+                continue
+            names = {}
+            for model, material, _ in valid:
+                names.setdefault(model, "finished")
+                names.setdefault(material, "raw")
+            ids = self.product_ids(names)
+            for model, material, quantity in valid:
+                graph.set_item(ids[model], ids[material], quantity)
+            statement = sqlite_insert(BOM)
+            self.db.execute(
+                statement.on_conflict_do_update(
+                    index_elements=["finished_product_id", "material_id"],
+                    set_={"quantity": statement.excluded.quantity},
+                ),
+                list({
+                    (ids[model], ids[material]): {
+                        "finished_product_id": ids[model], "material_id": ids[material], "quantity": quantity
+                    }
+                    for model, material, quantity in valid
+                }.values()),
+            )
+            self._chunk_done("bom", len(chunk), len(valid))
+
+    def providers(self, rows):
+        for chunk in _chunks(rows, self.chunk_size):
+            ids = self.product_ids({material: "raw" for _, material, _ in chunk})
+            statement = sqlite_insert(Supplier)
+            self.db.execute(
+                statement.on_conflict_do_update(
+                    index_elements=["name", "product_id"],
+                    set_={column: statement.excluded[column] for column in SUPPLIER_TERMS},
+                ),
+                list({
+                    (provider, material): {"name": provider, "product_id": ids[material], **dict(zip(SUPPLIER_TERMS, terms))}
+                    for provider, material, terms in chunk
+                }.values()),
+            )
+            self._chunk_done("providers", len(chunk), len(chunk))
+        self.suppliers = None
+
+    def capacity(self, capacity_per_day: int):
+        """Production capacity of the simulation, from the plan file"""
+        state = self.db.query(SimulationState).first()
+        if state is None:
+            self.db.add(SimulationState(current_day=datetime.now().date(), capacity_per_day=capacity_per_day))
+        else:
+            state.capacity_per_day = capacity_per_day
+
+    def inventory(self, rows):
+        """Set stock levels; the difference with the current stock goes to the inventory ledger"""
+        state = self.db.query(SimulationState).first()
+        current_day = state.current_day if state else datetime.now().date()
+        stock = dict(self.db.query(Inventory.product_id, Inventory.quantity))
+        ledger = InventoryLedger(self.db)
+        for chunk in _chunks(rows, self.chunk_size):
+            ids = self.product_ids({material: "raw" for material, _ in chunk})
+            levels = {ids[material]: quantity for material, quantity in chunk}
+            statement = sqlite_insert(Inventory)
+            self.db.execute(
+                statement.on_conflict_do_update(
+                    index_elements=["product_id"], set_={"quantity": statement.excluded.quantity}
+                ),
+                [{"product_id": product_id, "quantity": quantity} for product_id, quantity in levels.items()],
+            )
+            for product_id, quantity in levels.items():
+                ledger.record(product_id, current_day, quantity - (stock.get(product_id) or 0), "import")
+                stock[product_id] = quantity
+            ledger.flush()
+            self._chunk_done("inventory", len(chunk), len(levels))
+
+    def production_orders(self, rows):
+        for chunk in _chunks(rows, self.chunk_size):
+            self.db.execute(insert(ProductionOrder), [
+                {"product_id": self._known_product(product), "quantity": quantity, "status": status,
+                 "creation_date": created, "expected_completion_date": due, "due_date": due, "priority": priority}
+                for product, quantity, status, created, due, priority in chunk
+            ])
+            self._chunk_done("production_orders", len(chunk), len(chunk))
+
+    def purchase_orders(self, rows):
+        """Suppliers are matched by name and product"""
+        if self.suppliers is None:
+            self.suppliers = {
+                (name, product_id): id_ for id_, name, product_id in self.db.query(Supplier.id, Supplier.name, Supplier.product_id)
+            }
+        for chunk in _chunks(rows, self.chunk_size):
+            orders = []
+            for supplier, product, quantity, status, issued, due in chunk:
+                product_id = self._known_product(product)
+                supplier_id = self.suppliers.get((supplier, product_id))
+                if supplier_id is None:
+                    raise ValueError(f"Proveedor no encontrado: {supplier} ({product})")
+                orders.append({"supplier_id": supplier_id, "product_id": product_id, "quantity": quantity,
+                               "status": status, "issue_date": issued, "expected_delivery_date": due})
+            self.db.execute(insert(PurchaseOrder), orders)
+            self._chunk_done("purchase_orders", len(chunk), len(chunk))
+
+    def commit(self) -> dict:
+        self.db.commit()
+        return dict(self.stats)
+
+
+def _open(path: str, fmt: str):
+    return open(path, "r", newline="" if fmt == "csv" else None, encoding="utf-8")
+
+
+class ImportCatalog:
+    """
+    Product names and (supplier, product name) pairs the rows of an import
+    may refer to: those in the database plus those the files checked before
+    will create, as BulkImporter does when it writes them.
+    """
+
+    def __init__(self, db: Session):
+        self.products = {name for (name,) in db.query(Product.name)}
+        self.suppliers = set(db.query(Supplier.name, Product.name).join(Product, Supplier.product_id == Product.id))
+
+    def _product(self, name: str):
+        if name not in self.products:
+            raise ValueError(f"Producto no encontrado: {name}")
+
+    def check(self, kind: str, row: tuple):
+        """Raise the error the import would raise for `row`, or record what it creates"""
+        if kind == "bom":
+            model, material, quantity = row
+            if isinstance(quantity, int) or str(quantity).isdigit():
+                self.products.update((model, material))
+        elif kind == "providers":
+            provider, material, _ = row
+            self.products.add(material)
+            self.suppliers.add((provider, material))
+        elif kind == "inventory":
+            self.products.add(row[0])
+        elif kind == "production_orders":
+            self._product(row[0])
+        elif kind == "purchase_orders":
+            supplier, product = row[:2]
+            self._product(product)
+            if (supplier, product) not in self.suppliers:
+                raise ValueError(f"Proveedor no encontrado: {supplier} ({product})")
+
+
+def count_rows(path: str, kind: str, fmt: str = None, name: str = None, catalog: ImportCatalog = None) -> int:
+    """
+    Parse and type-check a whole file without writing anything. Returns its
+    number of rows. With a `catalog`, the products and suppliers the rows
+    refer to are resolved too. Errors name the file as `name` (default: its
+    basename).
+    """
+    fmt = fmt or detect_format(path)
+    rows = 0
+    models = {}
+    with _open(path, fmt) as f:
+        try:
+            reader = read_plan(f, fmt, models) if kind == "plan" else READERS[kind](f, fmt)
+            for row in reader:
+                if catalog is not None:
+                    catalog.check(kind, row)
+                rows += 1
+        except (KeyError, TypeError, ValueError) as e:
+            detail = f"falta el campo {e}" if isinstance(e, KeyError) else str(e)
+            raise ValueError(f"{name or os.path.basename(path)}, fila {rows + 1}: {detail}") from e
+    if catalog is not None:
+        # Models of a JSON plan and their BOM lines, imported along with it
+        catalog.products.update(models)
+        for row in _bom_rows(models):
+            catalog.check("bom", row)
+    return rows
+
+
+def import_file(path: str, db: Session, kind: str, fmt: str = None, on_chunk=None) -> dict:
+    """
+    Import one file of the given kind (see READERS). Plan files in JSON also
+    carry the BOMs of their "models" section.
+    """
+    if kind not in READERS:
+        raise ValueError(f"Tipo de importación desconocido: {kind}")
+    fmt = fmt or detect_format(path)
+    importer = BulkImporter(db, on_chunk=on_chunk)
+    try:
+        with _open(path, fmt) as f:
+            if kind == "plan":
+                models, settings = {}, {}
+                importer.plan(read_plan(f, fmt, models, settings))
+                importer.bom(_bom_rows(models))
+                importer.product_ids(dict.fromkeys(models, "finished"))  # models without BOM lines
+                if "capacity_per_day" in settings:
+                    importer.capacity(settings["capacity_per_day"])
+            else:
+                getattr(importer, kind)(READERS[kind](f, fmt))
+        return importer.commit()
+    except Exception:
+        db.rollback()
+        raise
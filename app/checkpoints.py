@@ -0,0 +1,84 @@
+import json
+import os
+import uuid
+from datetime import datetime
+from scenarios import SCENARIO_ID, Scenario, copy_database, registry
+
+CHECKPOINT_DIR = "data/checkpoints"
+
+
+def _paths(scenario_id: str, checkpoint_id: str):
+    if not SCENARIO_ID.match(checkpoint_id):
+        raise ValueError(f"Identificador de checkpoint no válido: {checkpoint_id}")
+    base = os.path.join(CHECKPOINT_DIR, scenario_id, checkpoint_id)
+    return base + ".db", base + ".json"
+
+
+def _load_info(meta_path: str) -> dict:
+    if not os.path.exists(meta_path):
+        raise KeyError(meta_path)
+    with open(meta_path, "r") as f:
+        return json.load(f)
+
+
+def create_checkpoint(scenario: Scenario, checkpoint_id: str = None) -> dict:
+    """
+    Capture the full scenario state: a copy of its database (current day,
+    inventory, orders, plans, events) plus the engine RNG state.
+    """
+    with scenario.lock:
+        engine = scenario.get_engine()
+        checkpoint_id = checkpoint_id or f"{engine.current_day.isoformat()}_{uuid.uuid4().hex[:8]}"
+        db_path, meta_path = _paths(scenario.id, checkpoint_id)
+        if os.path.exists(meta_path):
+            raise FileExistsError(checkpoint_id)
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        copy_database(scenario.db_path, db_path)
+        info = {
+            "id": checkpoint_id,
+            "scenario": scenario.id,
+            "current_day": engine.current_day.isoformat(),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "engine_state": engine.snapshot_state(),
+        }
+        with open(meta_path, "w") as f:
+            json.dump(info, f)
+        return info
+
+
+def list_checkpoints(scenario: Scenario) -> list[dict]:
+    directory = os.path.join(CHECKPOINT_DIR, scenario.id)
+    if not os.path.isdir(directory):
+        return []
+    infos = [_load_info(os.path.join(directory, name)) for name in os.listdir(directory) if name.endswith(".json")]
+    return sorted(infos, key=lambda info: (info["current_day"], info["created_at"]))
+
+
+def restore_checkpoint(scenario: Scenario, checkpoint_id: str) -> dict:
+    """Rewind the scenario to the checkpoint, in place"""
+    db_path, meta_path = _paths(scenario.id, checkpoint_id)
+    info = _load_info(meta_path)
+    with scenario.lock:
+        scenario.reset_engine()
+        copy_database(db_path, scenario.db_path)
+        scenario.get_engine().restore_state(info["engine_state"])
+    return info
+
+
+def fork_checkpoint(scenario: Scenario, checkpoint_id: str, new_scenario_id: str) -> dict:
+    """Clone a checkpoint into a new scenario without replaying any history"""
+    db_path, meta_path = _paths(scenario.id, checkpoint_id)
+    info = _load_info(meta_path)
+    forked = registry.create_from_file(new_scenario_id, db_path)
+    with forked.lock:
+        forked.get_engine().restore_state(info["engine_state"])
+    return info
+
+
+def delete_checkpoint(scenario: Scenario, checkpoint_id: str):
+    db_path, meta_path = _paths(scenario.id, checkpoint_id)
+    _load_info(meta_path)
+    os.remove(meta_path)
+    if os.path.exists(db_path):
+        os.remove(db_path)
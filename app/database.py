@@ -1,6 +1,6 @@
 from datetime import datetime
 from sqlalchemy import (
-    create_engine, Column, Integer, String, Float, Date, ForeignKey, Table, Text
+    create_engine, event, Column, Integer, String, Float, Date, ForeignKey, Table, Text, Index
 )
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
 import os
@@ -9,7 +9,28 @@ Base = declarative_base()
 DB_PATH = "data/simulator.db"
 DB_FILE = "sqlite:///"+DB_PATH
 
-engine = create_engine(DB_FILE, connect_args={"check_same_thread": False})
+# WAL lets dashboard reads run while the simulator writes; "delete" restores
+# SQLite's default rollback journal
+JOURNAL_MODE = os.getenv("SIM_SQLITE_JOURNAL_MODE", "wal")
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+    cursor.execute("PRAGMA synchronous=NORMAL")  # safe with WAL, fsync only at checkpoints
+    cursor.execute("PRAGMA cache_size=-65536")  # 64 MB page cache
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+def create_db_engine(db_path: str):
+    """SQLAlchemy engine for a SQLite database file with the tuned pragmas"""
+    db_engine = create_engine("sqlite:///"+db_path, connect_args={"check_same_thread": False})
+    event.listen(db_engine, "connect", set_sqlite_pragmas)
+    return db_engine
+
+
+engine = create_db_engine(DB_PATH)
 SessionLocal = sessionmaker(bind=engine)
 
 # --- MODELOS ---
@@ -30,11 +51,17 @@ class BOM(Base):
     material_id = Column(Integer, ForeignKey("product.id"))
     quantity = Column(Integer, nullable=False)
 
+    __table_args__ = (
+        Index("ix_bom_finished_product_id", "finished_product_id"),
+        Index("ux_bom_finished_material", "finished_product_id", "material_id", unique=True),
+    )
+
 
 class SimulationState(Base):
     __tablename__ = "simulation_state"
     id = Column(Integer, primary_key=True)
     current_day = Column(Date, default=datetime.now())
+    capacity_per_day = Column(Integer)  # units of production per day, from plan.json
 
 
 class Inventory(Base):
@@ -51,6 +78,13 @@ class Supplier(Base):
     name = Column(String, nullable=False)
     product_id = Column(Integer, ForeignKey("product.id"), nullable=False)
     unit_cost = Column(Float, nullable=False)
+    lead_time_days = Column(Integer, nullable=False, default=3)  # mean lead time
+    lead_time_std = Column(Float, nullable=False, default=0.0)
+    capacity_per_day = Column(Integer, nullable=True)  # units it accepts per order day, None if unlimited
+
+    __table_args__ = (
+        Index("ux_supplier_name_product", "name", "product_id", unique=True),
+    )
 
 
 class PurchaseOrder(Base):
@@ -64,6 +98,10 @@ class PurchaseOrder(Base):
     expected_delivery_date = Column(Date)
     status = Column(String)  # pending, delivered, cancelled
 
+    __table_args__ = (
+        Index("ix_purchase_order_status_delivery", "status", "expected_delivery_date"),
+    )
+
 
 class ProductionOrder(Base):
     __tablename__ = "production_order"
@@ -72,8 +110,15 @@ class ProductionOrder(Base):
     product_id = Column(Integer, ForeignKey("product.id"))
     quantity = Column(Integer)
     status = Column(String)  # pending, in_progress, completed, cancelled
-    expected_completion_date = Column(Date)
+    expected_completion_date = Column(Date)  # moved on as the order gets capacity, the actual day once completed
     daily_plan_id = Column(Integer, ForeignKey("daily_plan.id"))
+    quantity_done = Column(Integer, nullable=False, default=0)  # units already made; split orders finish over several days
+    priority = Column(Integer, nullable=False, default=0)  # higher goes first among orders due the same day
+    due_date = Column(Date)  # day of its plan line, or the imported one; the scheduler's key
+
+    __table_args__ = (
+        Index("ix_production_order_status", "status"),
+    )
 
 
 class Event(Base):
@@ -81,7 +126,15 @@ class Event(Base):
     id = Column(Integer, primary_key=True, index=True)
     type = Column(String)
     sim_date = Column(Date)
-    detail = Column(Text)
+    product_id = Column(Integer)  # typed fields; the detail text is rendered from them when read
+    order_id = Column(Integer)
+    quantity = Column(Integer)
+    target_day = Column(Date)
+    detail = Column(Text)  # free text of events without a template, and of rows older than the typed fields
+
+    __table_args__ = (
+        Index("ix_event_sim_date_id", "sim_date", "id"),
+    )
 
 
 class DailyPlan(Base):
@@ -92,6 +145,51 @@ class DailyPlan(Base):
     quantity = Column(Integer)
     status = Column(String, default="pending")  # pending, fulfilled, cancelled
 
+    __table_args__ = (
+        Index("ix_daily_plan_day", "day"),
+        Index("ix_daily_plan_status_day", "status", "day"),
+    )
+
+
+class InventoryMovement(Base):
+    """Append-only ledger: every change of Inventory.quantity with its day and cause"""
+    __tablename__ = "inventory_movement"
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("product.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    delta = Column(Integer, nullable=False)
+    cause = Column(String, nullable=False)  # opening, import, purchase_arrival, production
+    reference_id = Column(Integer)  # purchase or production order behind the movement
+
+    __table_args__ = (
+        Index("ix_inventory_movement_day", "day"),
+        Index("ix_inventory_movement_product_day", "product_id", "day"),
+    )
+
+
+class InventorySnapshot(Base):
+    """Stock of every product at the end of a day, taken every few simulated days"""
+    __tablename__ = "inventory_snapshot"
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey("product.id"), primary_key=True)
+    quantity = Column(Integer, nullable=False)
+
+
+class DailyKPI(Base):
+    """Dashboard metrics of one simulated day, written when the day closes"""
+    __tablename__ = "daily_kpi"
+    day = Column(Date, primary_key=True)
+    units_produced = Column(Integer, default=0)
+    orders_fulfilled = Column(Integer, default=0)
+    units_received = Column(Integer, default=0)
+    purchase_spend = Column(Float, default=0.0)
+    backlog_orders = Column(Integer, default=0)  # pending plan lines due on or before the day
+    backlog_units = Column(Integer, default=0)
+    stock_total = Column(Integer, default=0)
+    stock_levels = Column(Text)  # JSON {product_id: quantity} at the end of the day
+    units_scheduled = Column(Integer, default=0)  # production capacity used
+    capacity = Column(Integer, default=0)
+
 
 def get_session():
     return SessionLocal()
@@ -1,16 +1,27 @@
-from database import Base, engine, DB_PATH
+from database import Base, engine, DB_PATH, get_session
 import os
+from migrations import migrate
 from import_service import import_initial_inventory_from_json, import_production_orders_from_json, import_providers_from_json, import_purchase_orders_from_json, import_simulation_from_json
 
+def create_schema(bind):
+    Base.metadata.create_all(bind=bind)
+    migrate(bind)
+
+def seed_database(db):
+    import_simulation_from_json("data/plan.json", db)
+    import_providers_from_json("data/providers.json", db)
+    import_initial_inventory_from_json("data/inventory_init.json", db)
+    # import_production_orders_from_json("data/production_orders.json", db)
+    # import_purchase_orders_from_json("data/purchase_orders.json", db)
+
 def init_db():
     if not os.path.exists(DB_PATH):
         print("Inicializando base de datos...")
-        Base.metadata.create_all(bind=engine)
-        import_simulation_from_json("data/plan.json")
-        import_providers_from_json("data/providers.json")
-        import_initial_inventory_from_json("data/inventory_init.json")
-        # import_production_orders_from_json("data/production_orders.json")
-        # import_purchase_orders_from_json("data/purchase_orders.json")
-
+        create_schema(engine)
+        session = get_session()
+        try:
+            seed_database(session)
+        finally:
+            session.close()
     else:
-        Base.metadata.create_all(bind=engine)
\ No newline at end of file
+        create_schema(engine)
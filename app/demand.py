@@ -0,0 +1,181 @@
+import json
+from datetime import date, datetime, timedelta
+import numpy as np
+
+# Each demand model draws a whole horizon at once and returns three parallel
+# arrays: day offset in the horizon, product index and quantity of every order
+
+
+class DemandModel:
+    def draw(self, rng: np.random.Generator, start: date, days: int, products: list[str]):
+        raise NotImplementedError
+
+    def _orders(self, rng: np.random.Generator, counts: np.ndarray, n_products: int):
+        day_idx = np.repeat(np.arange(len(counts)), counts)
+        product_idx = rng.integers(0, n_products, day_idx.size)
+        return day_idx, product_idx
+
+
+class UniformDemand(DemandModel):
+    """Uniform number of orders per day and uniform quantity per order"""
+
+    def __init__(self, min_orders: int = 1, max_orders: int = 2, min_quantity: int = 1, max_quantity: int = 10):
+        self.min_orders = min_orders
+        self.max_orders = max_orders
+        self.min_quantity = min_quantity
+        self.max_quantity = max_quantity
+
+    def draw(self, rng, start, days, products):
+        counts = rng.integers(self.min_orders, self.max_orders + 1, days)
+        day_idx, product_idx = self._orders(rng, counts, len(products))
+        quantities = rng.integers(self.min_quantity, self.max_quantity + 1, day_idx.size)
+        return day_idx, product_idx, quantities
+
+
+class PoissonDemand(DemandModel):
+    """Poisson number of orders per day, quantities 1 + Poisson(quantity_mean - 1)"""
+
+    def __init__(self, orders_rate: float = 1.5, quantity_mean: float = 5.0):
+        self.orders_rate = orders_rate
+        self.quantity_mean = quantity_mean
+
+    def _rates(self, start: date, days: int) -> np.ndarray:
+        return np.full(days, self.orders_rate)
+
+    def draw(self, rng, start, days, products):
+        counts = rng.poisson(self._rates(start, days))
+        day_idx, product_idx = self._orders(rng, counts, len(products))
+        quantities = 1 + rng.poisson(max(self.quantity_mean - 1, 0), day_idx.size)
+        return day_idx, product_idx, quantities
+
+
+class SeasonalDemand(PoissonDemand):
+    """Poisson demand whose daily rate follows a cosine season peaking on `peak_day` (day of year)"""
+
+    def __init__(self, orders_rate: float = 1.5, amplitude: float = 0.5, period_days: int = 365,
+                 peak_day: int = 1, quantity_mean: float = 5.0):
+        super().__init__(orders_rate, quantity_mean)
+        self.amplitude = amplitude
+        self.period_days = period_days
+        self.peak_day = peak_day
+
+    def _rates(self, start, days):
+        day_of_year = start.timetuple().tm_yday + np.arange(days)
+        season = np.cos(2 * np.pi * (day_of_year - self.peak_day) / self.period_days)
+        return np.clip(self.orders_rate * (1 + self.amplitude * season), 0, None)
+
+
+class NegativeBinomialDemand(DemandModel):
+    """Over-dispersed demand: orders and quantities drawn from negative binomials with the given means"""
+
+    def __init__(self, orders_mean: float = 1.5, orders_dispersion: float = 2.0,
+                 quantity_mean: float = 5.0, quantity_dispersion: float = 2.0):
+        self.orders_mean = orders_mean
+        self.orders_dispersion = orders_dispersion
+        self.quantity_mean = quantity_mean
+        self.quantity_dispersion = quantity_dispersion
+
+    @staticmethod
+    def _sample(rng, mean: float, dispersion: float, size):
+        # numpy parametrizes by (n, p) with mean n (1 - p) / p
+        if mean <= 0:
+            return np.zeros(size, dtype=np.int64)
+        return rng.negative_binomial(dispersion, dispersion / (dispersion + mean), size)
+
+    def draw(self, rng, start, days, products):
+        counts = self._sample(rng, self.orders_mean, self.orders_dispersion, days)
+        day_idx, product_idx = self._orders(rng, counts, len(products))
+        quantities = 1 + self._sample(rng, self.quantity_mean - 1, self.quantity_dispersion, day_idx.size)
+        return day_idx, product_idx, quantities
+
+
+class TraceDemand(DemandModel):
+    """
+    Replays a historical trace. Trace day offsets are mapped onto simulated
+    days cyclically, so a one-year trace repeats every year.
+    """
+
+    def __init__(self, records: list[tuple[int, str, int]], anchor: date, length: int = None):
+        self.records = records  # (day offset from anchor, model, quantity)
+        self.anchor = anchor
+        self.length = length or (max((r[0] for r in records), default=0) + 1)
+
+    @classmethod
+    def from_plan_json(cls, json_path: str, anchor: date = None):
+        """Load a trace in the data/plan.json format (days as dd/mm/yyyy)"""
+        with open(json_path, "r") as f:
+            plan = json.load(f)["plan"]
+        days = [datetime.strptime(p["day"], "%d/%m/%Y").date() for p in plan]
+        anchor = anchor or min(days, default=date.today())
+        records = [
+            ((day - anchor).days, order["model"], order["quantity"])
+            for day, p in zip(days, plan) for order in p["orders"]
+        ]
+        return cls(records, anchor)
+
+    def draw(self, rng, start, days, products):
+        product_index = {name: i for i, name in enumerate(products)}
+        offsets = np.array([r[0] for r in self.records], dtype=np.int64)
+        known = np.array([r[1] in product_index for r in self.records], dtype=bool)
+        if not known.any():
+            empty = np.array([], dtype=np.int64)
+            return empty, empty, empty
+        offsets = offsets[known]
+        product_idx = np.array([product_index[r[1]] for r in self.records if r[1] in product_index])
+        quantities = np.array([r[2] for r in self.records if r[1] in product_index])
+
+        # Every cycle of the trace that overlaps [start, start + days)
+        shift = (start - self.anchor).days
+        cycles = np.arange(shift // self.length, (shift + days) // self.length + 1)
+        day_idx = (offsets[None, :] + cycles[:, None] * self.length).ravel() - shift
+        mask = (day_idx >= 0) & (day_idx < days)
+        order = np.argsort(day_idx[mask], kind="stable")
+        return (day_idx[mask][order],
+                np.tile(product_idx, len(cycles))[mask][order],
+                np.tile(quantities, len(cycles))[mask][order])
+
+
+DEMAND_MODELS = {
+    "uniform": UniformDemand,
+    "poisson": PoissonDemand,
+    "seasonal": SeasonalDemand,
+    "negative_binomial": NegativeBinomialDemand,
+}
+
+
+def demand_model_from_config(config: dict) -> DemandModel:
+    """
+    Build a demand model from a dict such as {"type": "poisson", "orders_rate": 2}
+    or {"type": "trace", "path": "data/plan.json"}.
+    """
+    params = dict(config)
+    model_type = params.pop("type", "uniform")
+    if model_type == "trace":
+        return TraceDemand.from_plan_json(params["path"])
+    if model_type not in DEMAND_MODELS:
+        raise ValueError(f"Modelo de demanda desconocido: {model_type}")
+    return DEMAND_MODELS[model_type](**params)
+
+
+class DemandGenerator:
+    """Draws a whole horizon of plan lines from a demand model with a per-engine seed"""
+
+    def __init__(self, model: DemandModel, seed: int = None, horizon_days: int = 30):
+        self.model = model
+        self.rng = np.random.default_rng(seed)
+        self.horizon_days = max(1, horizon_days)
+
+    def draw(self, start: date, products: list[str], skip_days: set[date] = frozenset()):
+        """
+        Return (day, model, quantity) for every order in [start, start + horizon_days),
+        leaving out the days in `skip_days` (they already have a plan).
+        """
+        if not products:
+            return []
+        day_idx, product_idx, quantities = self.model.draw(self.rng, start, self.horizon_days, products)
+        days = [start + timedelta(days=i) for i in range(self.horizon_days)]
+        return [
+            (days[d], products[p], int(q))
+            for d, p, q in zip(day_idx.tolist(), product_idx.tolist(), quantities.tolist())
+            if days[d] not in skip_days
+        ]
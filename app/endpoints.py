@@ -1,44 +1,170 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends
+import json
+import os
+import shutil
+import time
+from contextlib import nullcontext
+from datetime import date
+from typing import List, Optional, Union
+from fastapi import APIRouter, Depends, File, Header, Query, Request, UploadFile
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
-from production import add_to_production
-from simulator import SimulationEngine
-from database import get_session, Product as DBProduct, Inventory as DBInventory, \
-    ProductionOrder as DBProductionOrder, PurchaseOrder as DBPurchaseOrder, Supplier as DBSupplier, Event as DBEvent, DailyPlan as DBDailyPlan, BOM as DBBOM
-from model import Product, InventoryItem, ProductionOrder, PurchaseOrder, Supplier, Event, DailyPlan, BOMItem, \
-    SimulationResponse
+from production import add_to_production, release_production_batch
+from mrp import compute_requirements, shortages
+from ledger import stock_as_of, stock_series
+from replications import run_replications, snapshot_database
+from checkpoints import create_checkpoint, delete_checkpoint, fork_checkpoint, list_checkpoints, restore_checkpoint
+from scenarios import DEFAULT_SCENARIO, Scenario, registry
+from bom import BOMCycleError, bom_graph
+from bulk_import import detect_format
+from events import EVENT_COLUMNS, render_events
+from jobs import ImportJob, SimulationJob, import_jobs, jobs
+from metrics import HTTP_REQUESTS, HTTP_SECONDS, sql_scope
+from profiler import PROFILE_ALL, get_profile, list_profiles, profile, profile_stream, slow_queries
+from database import Product as DBProduct, Inventory as DBInventory, \
+    ProductionOrder as DBProductionOrder, PurchaseOrder as DBPurchaseOrder, Supplier as DBSupplier, Event as DBEvent, DailyPlan as DBDailyPlan, BOM as DBBOM, \
+    DailyKPI as DBDailyKPI
+from model import Product, InventoryItem, StockLevel, ProductionOrder, PurchaseOrder, Supplier, Event, DailyPlan, BOMItem, \
+    SimulationResponse, SimulationBatchResponse, DaySummary, MRPResponse, MaterialShortage, \
+    ProductionReleaseRequest, ProductionReleaseResponse, EventPage, ReplicationResponse, CheckpointInfo, JobInfo, DailyKPI, ImportJobInfo, \
+    QueryProfileInfo, QueryProfileReport, SlowQuery
 from fastapi import HTTPException
+from fastapi.routing import APIRoute
 from sqlalchemy.exc import IntegrityError
 
-router = APIRouter(prefix="/app", tags=["App"])
 
-db = get_session()
+class InstrumentedRoute(APIRoute):
+    """
+    Times every route for /metrics and attributes the SQL it issues to it.
+    With the X-Profile header (or SIM_PROFILE=1) the request's statements are
+    also profiled; the report id comes back in the X-Profile-Id header.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        route = self.path_format
+
+        async def instrumented(request: Request):
+            start, status = time.perf_counter(), 500
+            profiled = PROFILE_ALL or request.headers.get("x-profile", "").lower() in ("1", "true", "yes")
+            try:
+                with sql_scope(f"{request.method} {route}"), \
+                        (profile(f"{request.method} {request.url.path}") if profiled else nullcontext()) as current:
+                    response = await handler(request)
+                if current is not None:
+                    response.headers["X-Profile-Id"] = current.id
+                    if isinstance(response, StreamingResponse):
+                        response.body_iterator = profile_stream(response.body_iterator, current)
+                status = response.status_code
+                return response
+            except HTTPException as e:
+                status = e.status_code
+                raise
+            except RequestValidationError:
+                status = 422
+                raise
+            finally:
+                HTTP_REQUESTS.inc(1, request.method, route, str(status))
+                HTTP_SECONDS.observe(time.perf_counter() - start, request.method, route)
+
+        return instrumented
+
+
+router = APIRouter(prefix="/app", tags=["App"], route_class=InstrumentedRoute)
+
+
+# --- Escenarios: cada ruta trabaja sobre el escenario indicado en ?scenario= ---
+
+def get_scenario(scenario: str = Query(DEFAULT_SCENARIO, description="Scenario id")) -> Scenario:
+    try:
+        return registry.get(scenario)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Escenario no encontrado: {scenario}")
+
+def get_scenario_db(scenario: Scenario = Depends(get_scenario)):
+    """One session per request on the scenario database, always closed afterwards"""
+    session = scenario.session_factory()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@router.get("/scenarios", response_model=list[str])
+def list_scenarios():
+    return registry.list()
+
+@router.post("/scenarios/{scenario_id}")
+def create_scenario(scenario_id: str, seed: bool = True):
+    """Create a new scenario database, seeded from the JSON files in data/ by default"""
+    try:
+        registry.create(scenario_id, seed=seed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileExistsError:
+        raise HTTPException(status_code=409, detail=f"El escenario ya existe: {scenario_id}")
+    return {"status": "ok", "scenario": scenario_id}
+
+@router.delete("/scenarios/{scenario_id}")
+def delete_scenario(scenario_id: str):
+    try:
+        registry.delete(scenario_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Escenario no encontrado: {scenario_id}")
+    return {"status": "ok"}
+
 
 # --- Endpoints de lectura con acceso a base de datos ---
 
 @router.get("/inventory/", response_model=list[InventoryItem])
-def get_inventory(session: Session = Depends(get_session)):
+def get_inventory(
+    as_of: Optional[date] = Query(None, description="Stock at the end of this day, from the inventory ledger"),
+    session: Session = Depends(get_scenario_db)
+):
+    if as_of is not None:
+        return [InventoryItem(product_id=product_id, quantity=quantity)
+                for product_id, quantity in sorted(stock_as_of(session, as_of).items())]
     inventory = session.query(DBInventory).all()
     return [InventoryItem(product_id=item.product_id, quantity=item.quantity) for item in inventory]
 
+@router.get("/inventory/{product_id}/history", response_model=list[StockLevel])
+def get_inventory_history(
+    product_id: int,
+    start: date,
+    end: date,
+    session: Session = Depends(get_scenario_db)
+):
+    """End-of-day stock of a product for every day in [start, end]"""
+    if end < start:
+        raise HTTPException(status_code=400, detail="El final del intervalo es anterior al inicio")
+    if (end - start).days > 3650:
+        raise HTTPException(status_code=400, detail="El intervalo no puede superar los 3650 días")
+    return [StockLevel(day=day, quantity=quantity) for day, quantity in stock_series(session, product_id, start, end)]
+
 @router.get("/products/", response_model=list[Product])
-def get_products(session: Session = Depends(get_session)):
+def get_products(session: Session = Depends(get_scenario_db)):
     products = session.query(DBProduct).all()
     return [Product(id=p.id, name=p.name, type=p.type) for p in products]
 
 @router.get("/production/orders/", response_model=list[ProductionOrder])
-def get_production_orders(session: Session = Depends(get_session)):
+def get_production_orders(session: Session = Depends(get_scenario_db)):
     orders = session.query(DBProductionOrder).all()
     return [ProductionOrder(
         id=o.id, creation_date=o.creation_date,
         product_id=o.product_id, quantity=o.quantity, status=o.status,
         expected_completion_date=o.expected_completion_date,
-        daily_plan_id=o.daily_plan_id
+        daily_plan_id=o.daily_plan_id, quantity_done=o.quantity_done or 0, priority=o.priority or 0,
+        due_date=o.due_date
     ) for o in orders]
 
 @router.get("/purchases/orders/", response_model=list[PurchaseOrder])
-def get_purchase_orders(session: Session = Depends(get_session)):
+def get_purchase_orders(session: Session = Depends(get_scenario_db)):
     orders = session.query(DBPurchaseOrder).all()
     return [PurchaseOrder(
         id=o.id, supplier_id=o.supplier_id,
@@ -49,28 +175,31 @@ def get_purchase_orders(session: Session = Depends(get_session)):
     ) for o in orders]
 
 @router.get("/suppliers/", response_model=list[Supplier])
-def get_suppliers(session: Session = Depends(get_session)):
+def get_suppliers(session: Session = Depends(get_scenario_db)):
     suppliers = session.query(DBSupplier).all()
     return [Supplier(
         id=s.id,
         name=s.name,
         product_id=s.product_id,
-        unit_cost=s.unit_cost
+        unit_cost=s.unit_cost,
+        lead_time_days=s.lead_time_days,
+        lead_time_std=s.lead_time_std,
+        capacity_per_day=s.capacity_per_day
     ) for s in suppliers]
 
 @router.get("/simulator/current-day")
-def get_current_day(session: Session = Depends(get_session)):
+def get_current_day(scenario: Scenario = Depends(get_scenario)):
     """
     Get the current simulation day.
     """
     try:
-        engine = get_engine(session)
+        engine = scenario.get_engine()
         return {"current_day": engine.current_day}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/plan/", response_model=list[DailyPlan])
-def get_plan(session: Session = Depends(get_session)):
+def get_plan(session: Session = Depends(get_scenario_db)):
     plans = session.query(DBDailyPlan).all()
     return [DailyPlan(
         id=p.id,
@@ -82,14 +211,131 @@ def get_plan(session: Session = Depends(get_session)):
         }]
     ) for p in plans]
 
+@router.get("/mrp", response_model=MRPResponse)
+def get_material_requirements(
+    start: Optional[date] = None,
+    days: Optional[int] = Query(None, ge=1, le=3650),
+    session: Session = Depends(get_scenario_db)
+):
+    """
+    Forecast material shortages per day for all pending plan lines,
+    netting gross requirements against inventory and pending purchases.
+    """
+    result = compute_requirements(session, start=start, days=days)
+    names = dict(session.query(DBProduct.id, DBProduct.name).all())
+    return MRPResponse(
+        start_day=result.start,
+        days=result.days,
+        plan_lines=result.plan_lines,
+        shortages=[MaterialShortage(material=names.get(s["material_id"], ""), **s) for s in shortages(result)]
+    )
+
+@router.get("/kpi", response_model=list[DailyKPI])
+def get_daily_kpis(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    session: Session = Depends(get_scenario_db)
+):
+    """Dashboard metrics per simulated day in [start, end], one row per day"""
+    query = session.query(DBDailyKPI)
+    if start is not None:
+        query = query.filter(DBDailyKPI.day >= start)
+    if end is not None:
+        query = query.filter(DBDailyKPI.day <= end)
+    return [
+        DailyKPI(
+            day=k.day, units_produced=k.units_produced, orders_fulfilled=k.orders_fulfilled,
+            units_received=k.units_received, purchase_spend=k.purchase_spend,
+            backlog_orders=k.backlog_orders, backlog_units=k.backlog_units,
+            stock_total=k.stock_total, stock_levels=json.loads(k.stock_levels or "{}"),
+            units_scheduled=k.units_scheduled or 0, capacity=k.capacity or 0,
+            utilization=round((k.units_scheduled or 0) / k.capacity, 4) if k.capacity else 0.0
+        )
+        for k in query.order_by(DBDailyKPI.day)
+    ]
+
 @router.get("/events/", response_model=list[Event])
-def get_events(session: Session = Depends(get_session)):
-    events = session.query(DBEvent).all()
-    return [Event(id=e.id, type=e.type, sim_date=e.sim_date, detail=e.detail) for e in events]
+def get_events(session: Session = Depends(get_scenario_db)):
+    rows = session.execute(select(*EVENT_COLUMNS)).all()
+    return [Event(**e) for e in render_events(session, rows)]
+
+def _event_filters(type_: Optional[str], start: Optional[date], end: Optional[date]):
+    filters = []
+    if type_ is not None:
+        filters.append(DBEvent.type == type_)
+    if start is not None:
+        filters.append(DBEvent.sim_date >= start)
+    if end is not None:
+        filters.append(DBEvent.sim_date <= end)
+    return filters
+
+def _parse_cursor(cursor: str):
+    try:
+        day, event_id = cursor.split("_")
+        return date.fromisoformat(day), int(event_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Cursor no válido: {cursor}")
+
+@router.get("/events/page", response_model=EventPage)
+def get_events_page(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    type: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    session: Session = Depends(get_scenario_db)
+):
+    """
+    Page through events ordered by (sim_date, id). Pass the returned
+    `next_cursor` to get the following page.
+    """
+    query = select(*EVENT_COLUMNS) \
+        .where(*_event_filters(type, start, end)) \
+        .order_by(DBEvent.sim_date, DBEvent.id) \
+        .limit(limit + 1)
+    if cursor:
+        query = query.where(tuple_(DBEvent.sim_date, DBEvent.id) > _parse_cursor(cursor))
+    rows = session.execute(query).all()
+
+    items = [Event(**e) for e in render_events(session, rows[:limit])]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = f"{last.sim_date.isoformat()}_{last.id}"
+    return EventPage(items=items, next_cursor=next_cursor)
+
+@router.get("/events/stream")
+def stream_events(
+    type: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    scenario: Scenario = Depends(get_scenario)
+):
+    """
+    Stream events ordered by (sim_date, id) as NDJSON, one event per line,
+    without loading the whole table in memory.
+    """
+    query = select(*EVENT_COLUMNS) \
+        .where(*_event_filters(type, start, end)) \
+        .order_by(DBEvent.sim_date, DBEvent.id) \
+        .execution_options(yield_per=1000)
+
+    def generate():
+        # The stream outlives the request, so it uses its own session
+        session = scenario.session_factory()
+        product_names = {}
+        try:
+            for rows in session.execute(query).partitions():
+                for event in render_events(session, rows, product_names):
+                    yield json.dumps(event, default=str, ensure_ascii=False) + "\n"
+        finally:
+            session.close()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
 
 
 @router.get("/products/", response_model=list[Product])
-def get_products(session: Session = Depends(get_session)):
+def get_products(session: Session = Depends(get_scenario_db)):
     products = session.query(DBProduct).all()
     return [Product(id=p.id, name=p.name, type=p.type) for p in products]
 
@@ -97,18 +343,63 @@ def get_products(session: Session = Depends(get_session)):
 def get_status():
     return {"status": "OK", "day": 1}
 
-@router.post("/import/json")
-def import_from_json():
-    return {"status": "imported"}
+@router.post("/import/json", response_model=ImportJobInfo)
+def import_from_json(
+    plan: Optional[UploadFile] = File(None),
+    bom: Optional[UploadFile] = File(None),
+    providers: Optional[UploadFile] = File(None),
+    inventory: Optional[UploadFile] = File(None),
+    production_orders: Optional[UploadFile] = File(None),
+    purchase_orders: Optional[UploadFile] = File(None),
+    scenario: Scenario = Depends(get_scenario)
+):
+    """
+    Upload plan, BOM, provider, inventory and order files as multipart form
+    fields. Each file is JSON (data/*.json layouts), NDJSON or CSV, by its
+    extension. Files are spooled to disk and ingested by a background job;
+    follow it at /import/jobs/{job_id}.
+    """
+    uploads = {
+        "plan": plan, "bom": bom, "providers": providers, "inventory": inventory,
+        "production_orders": production_orders, "purchase_orders": purchase_orders,
+    }
+    uploads = {kind: upload for kind, upload in uploads.items() if upload is not None}
+    if not uploads:
+        raise HTTPException(status_code=400, detail="No se ha enviado ningún fichero")
+
+    job = ImportJob(scenario.id)
+    try:
+        for kind, upload in uploads.items():
+            name = upload.filename or ""
+            fmt = detect_format(name) if os.path.splitext(name)[1] else "json"
+            job.add_file(kind, upload.filename, fmt, upload.file)
+    except ValueError as e:
+        shutil.rmtree(job.spool_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    return ImportJobInfo(**import_jobs.submit(job).info())
+
+@router.get("/import/jobs", response_model=list[ImportJobInfo])
+def list_import_jobs():
+    return [ImportJobInfo(**job.info()) for job in import_jobs.list()]
+
+@router.get("/import/jobs/{job_id}", response_model=ImportJobInfo)
+def get_import_job(job_id: str):
+    try:
+        return ImportJobInfo(**import_jobs.get(job_id).info())
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Importación no encontrada: {job_id}")
 
 from fastapi import Body
 
 @router.post("/products")
-def create_product(product: Product = Body(...), session: Session = Depends(get_session)):
+def create_product(product: Product = Body(...), scenario: Scenario = Depends(get_scenario),
+                   session: Session = Depends(get_scenario_db)):
     db_product = DBProduct(name=product.name, type=product.type)
     session.add(db_product)
     try:
-        session.commit()
+        with scenario.lock:
+            session.commit()
+            scenario.invalidate_engine()  # a new finished product enters the demand draws
         session.refresh(db_product)
         return Product(id=db_product.id, name=db_product.name, type=db_product.type)
     except IntegrityError:
@@ -116,7 +407,8 @@ def create_product(product: Product = Body(...), session: Session = Depends(get_
         raise HTTPException(status_code=400, detail="El producto ya existe (nombre duplicado).")
 
 @router.post("/purchases/orders")
-def create_purchase_order(order: PurchaseOrder, session: Session = Depends(get_session)):
+def create_purchase_order(order: PurchaseOrder, scenario: Scenario = Depends(get_scenario),
+                          session: Session = Depends(get_scenario_db)):
     db_order = DBPurchaseOrder(
         supplier_id=order.supplier_id,
         product_id=order.product_id,
@@ -126,7 +418,9 @@ def create_purchase_order(order: PurchaseOrder, session: Session = Depends(get_s
         status=order.status
     )
     session.add(db_order)
-    session.commit()
+    # The engine picks the order up on its next run; in memory mode it also hands out purchase ids
+    with scenario.lock:
+        session.commit()
     session.refresh(db_order)
     return PurchaseOrder(
         id=db_order.id,
@@ -140,75 +434,93 @@ def create_purchase_order(order: PurchaseOrder, session: Session = Depends(get_s
 
 
 @router.get("/bom/{product_id}", response_model=list[BOMItem])
-def get_bom(product_id: int, session: Session = Depends(get_session)):
+def get_bom(product_id: int, session: Session = Depends(get_scenario_db)):
     rows = session.query(DBBOM).filter(DBBOM.finished_product_id == product_id).all()
     return [BOMItem(material_id=r.material_id, quantity=r.quantity) for r in rows]
 
+@router.get("/bom/{product_id}/explosion", response_model=list[BOMItem])
+def get_bom_explosion(product_id: int, session: Session = Depends(get_scenario_db)):
+    """Raw materials per unit of the product through every sub-assembly level"""
+    materials = bom_graph(session).explode(product_id)
+    return [BOMItem(material_id=material_id, quantity=quantity) for material_id, quantity in materials.items()]
+
 @router.post("/bom/{product_id}/add")
-def add_bom_item(product_id: int, item: BOMItem, session: Session = Depends(get_session)):
-    row = DBBOM(finished_product_id=product_id, material_id=item.material_id, quantity=item.quantity)
-    session.merge(row)
-    session.commit()
+def add_bom_item(product_id: int, item: BOMItem, session: Session = Depends(get_scenario_db)):
+    """Add or update a BOM line. The material may itself have a BOM (a sub-assembly)."""
+    graph = bom_graph(session)
+    # The graph lock keeps a concurrent add from closing a cycle between the check and the write
+    with graph.lock:
+        try:
+            graph.check_item(product_id, item.material_id)
+        except BOMCycleError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        statement = sqlite_insert(DBBOM).values(
+            finished_product_id=product_id, material_id=item.material_id, quantity=item.quantity
+        )
+        session.execute(statement.on_conflict_do_update(
+            index_elements=["finished_product_id", "material_id"], set_={"quantity": statement.excluded.quantity}
+        ))
+        session.commit()
+        graph.set_item(product_id, item.material_id, item.quantity)
     return {"status": "ok"}
 
 @router.delete("/bom/{product_id}/remove/{material_id}")
-def delete_bom_item(product_id: int, material_id: int, session: Session = Depends(get_session)):
-    session.query(DBBOM).filter(
-        DBBOM.finished_product_id == product_id,
-        DBBOM.material_id == material_id
-    ).delete()
-    session.commit()
+def delete_bom_item(product_id: int, material_id: int, session: Session = Depends(get_scenario_db)):
+    graph = bom_graph(session)
+    with graph.lock:
+        session.query(DBBOM).filter(
+            DBBOM.finished_product_id == product_id,
+            DBBOM.material_id == material_id
+        ).delete()
+        session.commit()
+        graph.remove_item(product_id, material_id)
     return {"status": "ok"}
 
 @router.get("/simulator/events/all", response_model=List[Event])
-def get_all_events(session: Session = Depends(get_session)):
+def get_all_events(session: Session = Depends(get_scenario_db)):
     """
     Return all simulation events stored in the database.
     """
     try:
-        events = session.query(DBEvent).order_by(DBEvent.sim_date).all()
-        return [
-            Event(
-                id=event.id,
-                type=event.type,
-                sim_date=event.sim_date,
-                detail=event.detail
-            )
-            for event in events
-        ]
+        rows = session.execute(select(*EVENT_COLUMNS).order_by(DBEvent.sim_date)).all()
+        return [Event(**event) for event in render_events(session, rows)]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-_engine = None
-
-def get_engine(session: Session) -> SimulationEngine:
-    global _engine
-    if _engine is None:
-        _engine = SimulationEngine(session)
-    return _engine
-
-@router.post("/simulator/run", response_model=SimulationResponse)
-def run_simulation(session: Session = Depends(get_session)):
+@router.post("/simulator/run", response_model=Union[SimulationResponse, SimulationBatchResponse])
+def run_simulation(
+    days: int = Query(1, ge=1, le=3650),
+    until: Optional[date] = None,
+    scenario: Scenario = Depends(get_scenario),
+    session: Session = Depends(get_scenario_db)
+):
     """
     Run one day of simulation and return the events that occurred.
+    With `days` > 1 or `until`, run several days in a single call and
+    return a per-day summary instead of the events.
     """
+    with scenario.lock:
+        return _run_simulation(scenario.get_engine(), days, until, session)
+
+def _run_simulation(engine, days: int, until: Optional[date], session: Session):
     try:
-        engine = get_engine(session)
         previous_day = engine.current_day
+
+        if days > 1 or until is not None:
+            summaries = engine.run_until(until) if until is not None else engine.run_days(days)
+            return SimulationBatchResponse(
+                success=True,
+                start_day=previous_day,
+                end_day=engine.current_day,
+                days=[DaySummary(**summary) for summary in summaries]
+            )
+
         engine.run_one_day()
         
         # Get events for the day that was just simulated
-        events = session.query(DBEvent).filter_by(sim_date=previous_day).all()
-        events_data = [
-            Event(
-                id=event.id,
-                type=event.type,
-                sim_date=event.sim_date,  # Already a date object
-                detail=event.detail
-            )
-            for event in events
-        ]
+        rows = session.execute(select(*EVENT_COLUMNS).where(DBEvent.sim_date == previous_day)).all()
+        events_data = [Event(**event) for event in render_events(session, rows)]
         
         return SimulationResponse(
             success=True,
@@ -217,15 +529,211 @@ def run_simulation(session: Session = Depends(get_session)):
         )
     except Exception as e:
         session.rollback()
+        engine.db.rollback()
         print(f"Error in run_simulation: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/simulator/replications", response_model=ReplicationResponse)
+def run_simulation_replications(
+    replications: int = Query(10, ge=1, le=1000),
+    days: int = Query(30, ge=1, le=3650),
+    seed: int = 0,
+    scenario: Scenario = Depends(get_scenario)
+):
+    """
+    Run seeded copies of an N-day simulation of the scenario in parallel
+    (one process per core) and return KPI means with 95% confidence intervals.
+    The scenario itself is not modified.
+    """
+    with scenario.lock:
+        snapshot_path = snapshot_database(scenario.db_path)
+    try:
+        return ReplicationResponse(**run_replications(snapshot_path, replications, days, base_seed=seed))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        os.remove(snapshot_path)
+
+
+@router.post("/jobs", response_model=JobInfo)
+def submit_simulation_job(
+    days: int = Query(1, ge=1, le=3650),
+    until: Optional[date] = None,
+    scenario: Scenario = Depends(get_scenario)
+):
+    """
+    Queue a simulation run in the background and return immediately.
+    Progress is available at /jobs/{job_id} and as server-sent events at /jobs/{job_id}/events.
+    """
+    return JobInfo(**jobs.submit(SimulationJob(scenario.id, days=days, until=until)).info())
+
+@router.get("/jobs", response_model=list[JobInfo])
+def list_simulation_jobs():
+    return [JobInfo(**job.info()) for job in jobs.list()]
+
+def _get_job(job_id: str):
+    try:
+        return jobs.get(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Trabajo no encontrado: {job_id}")
+
+@router.get("/jobs/{job_id}", response_model=JobInfo)
+def get_simulation_job(job_id: str):
+    return JobInfo(**_get_job(job_id).info())
+
+@router.post("/jobs/{job_id}/cancel", response_model=JobInfo)
+def cancel_simulation_job(job_id: str):
+    """Stop the job after the day in progress; days already simulated are kept"""
+    job = _get_job(job_id)
+    job.cancel()
+    return JobInfo(**job.info())
+
+@router.get("/jobs/{job_id}/events")
+def stream_simulation_job(
+    job_id: str,
+    since: int = Query(0, ge=0, description="Number of days already received"),
+    last_event_id: Optional[str] = Header(None)
+):
+    """
+    Server-sent events with one `day` message per simulated day (summary and
+    new events) and a final `end` message with the job status. Reconnecting
+    clients resume after the Last-Event-ID header or `since`.
+    """
+    job = _get_job(job_id)
+    if last_event_id is not None and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    async def generate():
+        seen = since
+        while True:
+            updates = await job.next_updates(seen)
+            for update in updates:
+                seen += 1
+                data = json.dumps(update, default=str, ensure_ascii=False)
+                yield f"id: {seen}\nevent: day\ndata: {data}\n\n"
+            if job.finished and seen >= len(job.updates):
+                data = json.dumps(job.info(), default=str, ensure_ascii=False)
+                yield f"event: end\ndata: {data}\n\n"
+                return
+            if not updates:
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(generate(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+
+@router.get("/checkpoints", response_model=list[CheckpointInfo])
+def get_checkpoints(scenario: Scenario = Depends(get_scenario)):
+    return [CheckpointInfo(**info) for info in list_checkpoints(scenario)]
+
+@router.post("/checkpoints", response_model=CheckpointInfo)
+def post_checkpoint(name: Optional[str] = None, scenario: Scenario = Depends(get_scenario)):
+    """
+    Snapshot the scenario (database and RNG state) so it can be restored
+    or forked later.
+    """
+    try:
+        return CheckpointInfo(**create_checkpoint(scenario, name))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileExistsError:
+        raise HTTPException(status_code=409, detail=f"El checkpoint ya existe: {name}")
+
+@router.post("/checkpoints/{checkpoint_id}/restore", response_model=CheckpointInfo)
+def post_restore_checkpoint(checkpoint_id: str, scenario: Scenario = Depends(get_scenario)):
+    try:
+        return CheckpointInfo(**restore_checkpoint(scenario, checkpoint_id))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Checkpoint no encontrado: {checkpoint_id}")
+
+@router.post("/checkpoints/{checkpoint_id}/fork/{new_scenario_id}", response_model=CheckpointInfo)
+def post_fork_checkpoint(checkpoint_id: str, new_scenario_id: str, scenario: Scenario = Depends(get_scenario)):
+    """Create a new scenario starting from the checkpoint"""
+    try:
+        return CheckpointInfo(**fork_checkpoint(scenario, checkpoint_id, new_scenario_id))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Checkpoint no encontrado: {checkpoint_id}")
+    except FileExistsError:
+        raise HTTPException(status_code=409, detail=f"El escenario ya existe: {new_scenario_id}")
+
+@router.delete("/checkpoints/{checkpoint_id}")
+def remove_checkpoint(checkpoint_id: str, scenario: Scenario = Depends(get_scenario)):
+    try:
+        delete_checkpoint(scenario, checkpoint_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Checkpoint no encontrado: {checkpoint_id}")
+    return {"status": "ok"}
+
+
 @router.post("/production/start/{order_id}")
-def start_production(order_id: int, session: Session = Depends(get_session)):
+def start_production(order_id: int, scenario: Scenario = Depends(get_scenario),
+                     session: Session = Depends(get_scenario_db)):
     try:
-        message = add_to_production(order_id, session)
+        with scenario.lock:
+            message = add_to_production(order_id, session)
+            if message == "ok":
+                scenario.invalidate_engine()
         return {"result": message}
     except Exception as e:
         session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/production/release", response_model=ProductionReleaseResponse)
+def release_production(request: ProductionReleaseRequest, scenario: Scenario = Depends(get_scenario),
+                       session: Session = Depends(get_scenario_db)):
+    """
+    Release a batch of pending plan lines (by id and/or date range) to
+    production, allocating materials in the requested priority order.
+    Requested ids that cannot be released come back as blocked lines.
+    """
+    try:
+        with scenario.lock:
+            result = release_production_batch(
+                session,
+                plan_ids=request.plan_ids,
+                start_day=request.start_day,
+                end_day=request.end_day,
+                priority=request.priority,
+                order_priority=request.order_priority
+            )
+            if result["released"]:
+                scenario.invalidate_engine()
+        return ProductionReleaseResponse(**result)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        session.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# --- Depuración: perfiles SQL ---
+
+@router.get("/debug/profiles", response_model=list[QueryProfileInfo])
+def list_query_profiles():
+    """Most recent profiles first"""
+    return [QueryProfileInfo(**p.report()) for p in reversed(list_profiles())]
+
+@router.get("/debug/profile/{profile_id}", response_model=QueryProfileReport)
+def get_query_profile(profile_id: str):
+    """
+    Every SQL statement of a profiled request or simulated day, with its
+    duration and rows returned or written, the statement shapes repeated often enough
+    to be N+1 loops and the query plan of the slow statements.
+    """
+    try:
+        return QueryProfileReport(**get_profile(profile_id).report())
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Perfil no encontrado: {profile_id}")
+
+@router.get("/debug/slow-queries", response_model=list[SlowQuery])
+def get_slow_queries():
+    """Statements slower than SIM_PROFILE_SLOW_MS in any profile, most recent first"""
+    return [SlowQuery(**q) for q in reversed(slow_queries)]
@@ -0,0 +1,122 @@
+from dataclasses import dataclass
+from datetime import date
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from database import Event, Product
+
+# Human readable detail for each event type, rendered when events are read
+EVENT_TEMPLATES = {
+    "start_day": "Inicio del día {day}",
+    "end_day": "Fin del día {day}",
+    "plan_generated": "Plan generado para el día {target_day} con {quantity} órdenes",
+    "purchase_arrival": "Llegada de {quantity} unidades de {product} (OC #{order_id})",
+    "purchase_ordered": "Pedido de compra de {quantity} unidades de {product} para el día {target_day}",
+    "purchase_rescheduled": "Pedido de compra #{order_id} reprogramado para el día {target_day} - Capacidad máxima alcanzada",
+    "production_completed": "Producción completada: {quantity} unidades de {product}",
+    "order_fulfilled": "Pedido #{order_id} completado: {quantity} unidades de {product}",
+    "production_started": "Iniciada producción de {quantity} unidades del producto {product}",
+}
+
+
+@dataclass(slots=True)
+class EventRecord:
+    type: str
+    sim_date: date
+    product_id: int | None = None
+    order_id: int | None = None
+    quantity: int | None = None
+    target_day: date | None = None
+    detail: str | None = None
+
+    def render(self, product_names: dict[int, str]) -> str:
+        if self.detail is not None:
+            return self.detail
+        template = EVENT_TEMPLATES.get(self.type)
+        if template is None:
+            return self.type
+        return template.format(
+            day=self.sim_date.strftime("%d/%m/%Y"),
+            target_day=self.target_day,
+            product=product_names.get(self.product_id, self.product_id),
+            order_id=self.order_id,
+            quantity=self.quantity,
+        )
+
+
+# Columns of an event row, as render_events() reads them
+EVENT_COLUMNS = (Event.id, Event.type, Event.sim_date, Event.product_id, Event.order_id, Event.quantity,
+                 Event.target_day, Event.detail)
+
+
+def render_events(db: Session, rows, product_names: dict[int, str] = None) -> list[dict]:
+    """
+    Event rows (EVENT_COLUMNS or Event objects) as dicts with their detail
+    rendered. The names of the products they mention are loaded into
+    `product_names`, which callers may keep as a cache across calls.
+    """
+    product_names = {} if product_names is None else product_names
+    missing = {r.product_id for r in rows if r.product_id is not None and r.product_id not in product_names}
+    if missing:
+        product_names.update(db.query(Product.id, Product.name).filter(Product.id.in_(missing)).all())
+    return [{
+        "id": r.id, "type": r.type, "sim_date": r.sim_date, "product_id": r.product_id, "order_id": r.order_id,
+        "quantity": r.quantity, "target_day": r.target_day,
+        "detail": EventRecord(r.type, r.sim_date, r.product_id, r.order_id, r.quantity, r.target_day,
+                              r.detail).render(product_names),
+    } for r in rows]
+
+
+class EventSink:
+    """
+    Buffers simulation events in memory and bulk-inserts them with their
+    typed fields into the event table on flush() or once `flush_threshold`
+    events are pending. Only events without a template store a detail text.
+    """
+
+    def __init__(self, db: Session, flush_threshold: int = 5000):
+        self.db = db
+        self.flush_threshold = flush_threshold
+        self.pending: list[EventRecord] = []
+        self.today: list[EventRecord] = []  # Events of the day being simulated, for live progress
+        self.product_names: dict[int, str] | None = None
+
+    def load_products(self):
+        self.product_names = dict(self.db.query(Product.id, Product.name).all())
+
+    def emit(self, type_: str, sim_date: date, detail: str | None = None, **fields) -> EventRecord:
+        record = EventRecord(type_, sim_date, detail=detail, **fields)
+        self.pending.append(record)
+        self.today.append(record)
+        if len(self.pending) >= self.flush_threshold:
+            self.flush()
+        return record
+
+    def start_day(self):
+        self.today = []
+
+    def render(self, records: list[EventRecord]) -> list[dict]:
+        """Plain dicts with the rendered detail, for the live progress of jobs"""
+        if self.product_names is None or any(
+            r.product_id is not None and r.product_id not in self.product_names for r in records
+        ):
+            self.load_products()
+        return [
+            {"type": r.type, "sim_date": r.sim_date, "detail": r.render(self.product_names)}
+            for r in records
+        ]
+
+    def flush(self):
+        """Insert the buffered events in the current transaction (the caller commits)"""
+        if not self.pending:
+            return
+        self.db.execute(insert(Event), [
+            {"type": r.type, "sim_date": r.sim_date, "product_id": r.product_id, "order_id": r.order_id,
+             "quantity": r.quantity, "target_day": r.target_day, "detail": r.detail}
+            for r in self.pending
+        ])
+        self.pending.clear()
+
+    def clear(self):
+        """Drop the buffered events of a failed run, so its retry does not write them twice"""
+        self.pending.clear()
+        self.today = []
@@ -0,0 +1,255 @@
+import asyncio
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from bulk_import import ImportCatalog, count_rows, import_file
+from scenarios import Scenario, registry
+
+MAX_JOB_WORKERS = int(os.getenv("SIM_JOB_WORKERS", "2"))
+# A job holds the scenario lock for this many days at a time, so other writers wait one batch at most
+JOB_BATCH_DAYS = int(os.getenv("SIM_JOB_BATCH_DAYS", "10"))
+MAX_IMPORT_WORKERS = int(os.getenv("SIM_IMPORT_WORKERS", "1"))
+MAX_FINISHED_JOBS = 100
+IMPORT_DIR = "data/imports"  # uploads are spooled here until their import job ends
+# Files of an upload are ingested in this order, so plans and providers exist before orders
+IMPORT_KINDS = ["plan", "bom", "providers", "inventory", "production_orders", "purchase_orders"]
+
+
+class SimulationJob:
+    """
+    A simulation run executed in the background, with its per-day progress.
+    The scenario is looked up when the job starts and kept open while it runs.
+    """
+
+    def __init__(self, scenario_id: str, days: int = None, until: date = None):
+        self.id = uuid.uuid4().hex
+        self.scenario_id = scenario_id
+        self.days = days
+        self.until = until
+        self.status = "queued"  # queued, running, completed, cancelled, failed
+        self.error = None
+        self.created_at = datetime.now()
+        self.updates: list[dict] = []  # one entry per simulated day
+        self._cancel = threading.Event()
+        self._changed = threading.Condition()
+        self._waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []  # SSE streams waiting for news
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "cancelled", "failed")
+
+    def info(self) -> dict:
+        return {
+            "id": self.id,
+            "scenario": self.scenario_id,
+            "status": self.status,
+            "days_requested": self.days,
+            "until": self.until,
+            "days_done": len(self.updates),
+            "current_day": self.updates[-1]["day"] if self.updates else None,
+            "error": self.error,
+        }
+
+    def cancel(self):
+        self._cancel.set()
+        with self._changed:
+            if self.status == "queued":
+                self.status = "cancelled"
+            self._notify()
+
+    def _notify(self):
+        """Wake up the waiting streams; called with `_changed` held"""
+        self._changed.notify_all()
+        for loop, changed in self._waiters:
+            loop.call_soon_threadsafe(changed.set)
+
+    async def next_updates(self, seen: int, timeout: float = 15.0) -> list[dict]:
+        """
+        Wait until there are more than `seen` updates or the job ends, on the
+        event loop: a waiting stream holds no worker thread.
+        """
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._changed:
+            if len(self.updates) > seen or self.finished:
+                return self.updates[seen:]
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._changed:
+                self._waiters.remove(waiter)
+        with self._changed:
+            return self.updates[seen:]
+
+    def run(self):
+        with self._changed:
+            if self._cancel.is_set():
+                return
+            self.status = "running"
+        engine = None
+        try:
+            with registry.use(self.scenario_id) as scenario:
+                while not self._cancel.is_set():
+                    # The lock is taken per batch, so API writes get in between
+                    with scenario.lock:
+                        engine = scenario.get_engine()
+                        remaining = (self.until - engine.current_day).days if self.until is not None \
+                            else self.days - len(self.updates)
+                        if remaining <= 0:
+                            break
+                        engine.run_days(min(JOB_BATCH_DAYS, remaining), on_day=self._on_day(engine))
+            status = "cancelled" if self._cancel.is_set() else "completed"
+        except Exception as e:
+            if engine is not None:
+                engine.db.rollback()
+            self.error = str(e)
+            status = "failed"
+        with self._changed:
+            self.status = status
+            self._notify()
+
+    def _on_day(self, engine):
+        def on_day(summary):
+            update = {**summary, "new_events": engine.events.render(engine.events.today)}
+            with self._changed:
+                self.updates.append(update)
+                self._notify()
+            return not self._cancel.is_set()
+        return on_day
+
+
+class ImportJob:
+    """
+    Ingests uploaded files spooled under `spool_dir`. Every file is parsed
+    once to validate it, resolve the products and suppliers it refers to and
+    count its rows, without locking the scenario. Then the files are
+    imported in chunks with a commit per chunk, which keeps transactions and
+    the WAL small and shows progress. The scenario lock is held for the
+    whole import, so simulation runs and other writers wait for it to end.
+    An import that still fails while writing keeps the chunks committed
+    before the error; the live engine is reset either way, so it reloads
+    whatever was written.
+    """
+
+    def __init__(self, scenario_id: str, job_id: str = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.scenario_id = scenario_id
+        self.spool_dir = os.path.join(IMPORT_DIR, self.id)
+        self.files: list[dict] = []
+        self.status = "queued"  # queued, validating, importing, completed, failed
+        self.error = None
+        self.stats: dict[str, int] = {}
+        self.created_at = datetime.now()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def add_file(self, kind: str, filename: str, fmt: str, source):
+        """Copy an uploaded file object to the spool directory in 1 MB blocks"""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = os.path.join(self.spool_dir, f"{kind}.{fmt}")
+        with open(path, "wb") as target:
+            shutil.copyfileobj(source, target, 1 << 20)
+        self.files.append({"kind": kind, "filename": filename, "format": fmt, "path": path,
+                           "rows_total": None, "rows_done": 0})
+        self.files.sort(key=lambda f: IMPORT_KINDS.index(f["kind"]))
+
+    def info(self) -> dict:
+        return {
+            "id": self.id,
+            "scenario": self.scenario_id,
+            "status": self.status,
+            "files": [{k: v for k, v in f.items() if k != "path"} for f in self.files],
+            "rows_total": sum(f["rows_total"] or 0 for f in self.files),
+            "rows_done": sum(f["rows_done"] for f in self.files),
+            "stats": dict(self.stats),
+            "error": self.error,
+        }
+
+    def run(self):
+        try:
+            self.status = "validating"
+            # Looked up now, not when queued, and kept open until the import ends
+            with registry.use(self.scenario_id) as scenario:
+                self._validate(scenario)
+                self.status = "importing"
+                self._import(scenario)
+            self.status = "completed"
+        except Exception as e:
+            self.error = str(e)
+            self.status = "failed"
+        finally:
+            shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    def _validate(self, scenario: Scenario):
+        session = scenario.session_factory()
+        try:
+            catalog = ImportCatalog(session)
+        finally:
+            session.close()
+        for file in self.files:
+            file["rows_total"] = count_rows(file["path"], file["kind"], file["format"], file["filename"], catalog)
+
+    def _import(self, scenario: Scenario):
+        session = scenario.session_factory()
+        try:
+            with scenario.lock:
+                try:
+                    for file in self.files:
+                        def on_chunk(kind, rows, file=file):
+                            session.commit()
+                            if kind == file["kind"]:
+                                file["rows_done"] += rows
+
+                        stats = import_file(file["path"], session, file["kind"], file["format"], on_chunk=on_chunk)
+                        for key, count in stats.items():
+                            self.stats[key] = self.stats.get(key, 0) + count
+                finally:
+                    # The live engine may hold stock and plans in memory; reload it from what was committed,
+                    # also after a failure
+                    scenario.reset_engine()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+
+class JobManager:
+    """Runs background jobs on a bounded worker pool and keeps the recent ones for polling"""
+
+    def __init__(self, max_workers: int = MAX_JOB_WORKERS, name: str = "sim-job"):
+        self.pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix=name)
+        self.jobs: OrderedDict[str, SimulationJob | ImportJob] = OrderedDict()
+        self._mutex = threading.Lock()
+
+    def submit(self, job):
+        with self._mutex:
+            self.jobs[job.id] = job
+            self._prune()
+        self.pool.submit(job.run)
+        return job
+
+    def get(self, job_id: str):
+        with self._mutex:
+            return self.jobs[job_id]
+
+    def list(self) -> list:
+        with self._mutex:
+            return list(self.jobs.values())
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+
+jobs = JobManager()
+import_jobs = JobManager(MAX_IMPORT_WORKERS, name="import-job")
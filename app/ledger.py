@@ -0,0 +1,103 @@
+import os
+from datetime import date, timedelta
+from sqlalchemy import func, insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from database import InventoryMovement, InventorySnapshot
+
+# A full stock snapshot is stored every SIM_SNAPSHOT_DAYS simulated days, so
+# an as-of query only sums the movements since the closest snapshot
+SNAPSHOT_DAYS = int(os.getenv("SIM_SNAPSHOT_DAYS", "7"))
+
+
+class InventoryLedger:
+    """
+    Buffers inventory movements and snapshots and bulk-inserts them on
+    flush(), in the caller's transaction, next to the stock change itself.
+    """
+
+    def __init__(self, db: Session, snapshot_days: int = SNAPSHOT_DAYS):
+        self.db = db
+        self.snapshot_days = max(1, snapshot_days)
+        self.movements: list[dict] = []
+        self.snapshots: list[dict] = []
+
+    def record(self, product_id: int, day: date, delta: int, cause: str, reference_id: int = None):
+        if delta:
+            self.movements.append({
+                "product_id": product_id, "day": day, "delta": delta,
+                "cause": cause, "reference_id": reference_id,
+            })
+
+    def close_day(self, day: date, stock: dict[int, int]):
+        """Snapshot the stock at the end of `day` if it falls on the snapshot interval"""
+        if day.toordinal() % self.snapshot_days == 0:
+            self.snapshots.extend(
+                {"day": day, "product_id": product_id, "quantity": quantity}
+                for product_id, quantity in stock.items()
+            )
+
+    def flush(self):
+        """Insert the buffered rows in the current transaction (the caller commits)"""
+        if self.movements:
+            self.db.execute(insert(InventoryMovement), self.movements)
+            self.movements.clear()
+        if self.snapshots:
+            statement = sqlite_insert(InventorySnapshot)
+            self.db.execute(
+                statement.on_conflict_do_update(
+                    index_elements=["day", "product_id"], set_={"quantity": statement.excluded.quantity}
+                ),
+                self.snapshots,
+            )
+            self.snapshots.clear()
+
+    def clear(self):
+        self.movements.clear()
+        self.snapshots.clear()
+
+
+def _latest_snapshot_day(db: Session, day: date) -> date | None:
+    return db.query(func.max(InventorySnapshot.day)).filter(InventorySnapshot.day <= day).scalar()
+
+
+def stock_as_of(db: Session, day: date) -> dict[int, int]:
+    """Stock per product at the end of `day`: closest snapshot plus the movements since"""
+    snapshot_day = _latest_snapshot_day(db, day)
+    stock: dict[int, int] = {}
+    movements = db.query(InventoryMovement.product_id, func.sum(InventoryMovement.delta)) \
+        .filter(InventoryMovement.day <= day)
+    if snapshot_day is not None:
+        stock = dict(db.query(InventorySnapshot.product_id, InventorySnapshot.quantity)
+                     .filter(InventorySnapshot.day == snapshot_day))
+        movements = movements.filter(InventoryMovement.day > snapshot_day)
+    for product_id, delta in movements.group_by(InventoryMovement.product_id):
+        stock[product_id] = stock.get(product_id, 0) + delta
+    return stock
+
+
+def stock_series(db: Session, product_id: int, start: date, end: date) -> list[tuple[date, int]]:
+    """End-of-day stock of one product for every day in [start, end]"""
+    before = start - timedelta(days=1)
+    snapshot_day = _latest_snapshot_day(db, before)
+    opening = db.query(func.sum(InventoryMovement.delta)).filter(
+        InventoryMovement.product_id == product_id, InventoryMovement.day <= before
+    )
+    quantity = 0
+    if snapshot_day is not None:
+        quantity = db.query(InventorySnapshot.quantity).filter(
+            InventorySnapshot.day == snapshot_day, InventorySnapshot.product_id == product_id
+        ).scalar() or 0
+        opening = opening.filter(InventoryMovement.day > snapshot_day)
+    quantity += opening.scalar() or 0
+
+    deltas = dict(db.query(InventoryMovement.day, func.sum(InventoryMovement.delta)).filter(
+        InventoryMovement.product_id == product_id,
+        InventoryMovement.day >= start, InventoryMovement.day <= end
+    ).group_by(InventoryMovement.day))
+    series = []
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        quantity += deltas.get(day, 0)
+        series.append((day, quantity))
+    return series
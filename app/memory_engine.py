@@ -0,0 +1,420 @@
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, timedelta
+from sqlalchemy import func, insert, update
+from sqlalchemy.orm import Session
+from database import Inventory, DailyPlan, Product, ProductionOrder, PurchaseOrder, SimulationState
+from metrics import phase
+from replenishment import DEFAULT_MAX_CAPACITY, SUPPLIER_COLUMNS, MaterialPosition, SupplierIndex
+from scheduler import DEFAULT_CAPACITY_PER_DAY, ProductionScheduler, completion_day
+from simulator import SimulationEngine
+
+
+# --- Estructuras compactas en memoria ---
+
+@dataclass(slots=True)
+class StockRecord:
+    quantity: int
+    max_capacity: int
+
+
+@dataclass(slots=True)
+class PurchaseRecord:
+    id: int
+    supplier_id: int | None
+    product_id: int
+    quantity: int
+    expected_delivery_date: date
+    status: str
+    issue_date: date | None = None
+
+
+@dataclass(slots=True)
+class ProductionRecord:
+    id: int
+    product_id: int
+    quantity: int
+    status: str
+    daily_plan_id: int | None
+    quantity_done: int = 0
+    expected_completion_date: date | None = None
+
+
+@dataclass(slots=True)
+class PlanRecord:
+    id: int
+    day: date
+    model: str
+    quantity: int
+    status: str
+
+
+class InMemorySimulationEngine(SimulationEngine):
+    """
+    Simulation engine that loads the simulation state on its first run,
+    steps days entirely in memory and writes only the changed rows back to
+    the database every `checkpoint_days` days and at the end of each run.
+    The state is kept across runs; it is loaded again only after a failed
+    run or when invalidate() reports writes made outside the engine.
+    """
+    mode = "memory"
+
+    def __init__(self, db: Session, checkpoint_days: int = 30, **kwargs):
+        super().__init__(db, **kwargs)
+        self.checkpoint_days = max(1, checkpoint_days)
+        self._days_since_checkpoint = 0
+        self.loaded = False
+        self._reset()
+
+    def _reset(self):
+        self.product_names: dict[int, str] = {}
+        self.finished_products: list[str] = []
+        self.stock: dict[int, StockRecord] = {}
+        self.purchases: dict[int, PurchaseRecord] = {}  # pending purchase orders
+        self.on_order: Counter = Counter()  # units in pending purchase orders per product
+        self.next_purchase_id = 1
+        self.production: dict[int, ProductionRecord] = {}  # open production orders
+        self.finishing: list[ProductionRecord] = []  # orders whose last units were dispatched
+        self.scheduler = ProductionScheduler()
+        self.plans: dict[int, PlanRecord] = {}  # plan lines not fulfilled yet
+        self.open_plans: dict[int, PlanRecord] = {}  # pending plan lines, for the backlog KPI
+        self.plan_days: set[date] = set()  # days from the current one on that already have a plan
+        self.next_plan_id = 1
+
+        # Write-behind: rows changed since the last checkpoint
+        self.dirty_stock: set[int] = set()
+        self.new_stock: set[int] = set()
+        self.dirty_purchases: dict[int, PurchaseRecord] = {}
+        self.new_purchases: list[PurchaseRecord] = []
+        self.dirty_production: dict[int, ProductionRecord] = {}
+        self.dirty_plans: dict[int, PlanRecord] = {}
+        self.new_plans: list[PlanRecord] = []
+        self.events.clear()
+        self.ledger.clear()
+        self.pending_kpis.clear()
+        self.reset_clock()
+
+    def load(self):
+        """Load inventory, suppliers, open orders and open plan lines from the database; BOMs come from bom_graph"""
+        with phase("load"):
+            self._load()
+
+    def _load(self):
+        self._reset()
+        db = self.db
+
+        state = db.query(SimulationState).first()
+        if state:
+            self.current_day = state.current_day
+            self.capacity_per_day = self.default_capacity or state.capacity_per_day or DEFAULT_CAPACITY_PER_DAY
+            self.reset_clock()
+
+        for id_, name, type_ in db.query(Product.id, Product.name, Product.type):
+            self.product_names[id_] = name
+            if type_ == "finished":
+                self.finished_products.append(name)
+        self.events.product_names = self.product_names
+
+        suppliers = db.query(*SUPPLIER_COLUMNS).all()
+        self.supplier_costs = {row[0]: row[2] for row in suppliers}
+        self.supplier_index = SupplierIndex.build(suppliers, self.replenishment.lead_time_cost)
+
+        for product_id, quantity, max_capacity in db.query(Inventory.product_id, Inventory.quantity, Inventory.max_capacity):
+            self.stock[product_id] = StockRecord(quantity or 0, max_capacity or DEFAULT_MAX_CAPACITY)
+
+        purchases = db.query(
+            PurchaseOrder.id, PurchaseOrder.supplier_id, PurchaseOrder.product_id, PurchaseOrder.quantity,
+            PurchaseOrder.expected_delivery_date
+        ).filter(PurchaseOrder.status == "pending").order_by(PurchaseOrder.id)
+        for id_, supplier_id, product_id, quantity, delivery_date in purchases:
+            self.purchases[id_] = PurchaseRecord(id_, supplier_id, product_id, quantity, delivery_date, "pending")
+            self.schedule_delivery(id_, delivery_date)
+            self.on_order[product_id] += quantity
+        self.next_purchase_id = (db.query(func.max(PurchaseOrder.id)).scalar() or 0) + 1
+
+        orders = db.query(
+            ProductionOrder.id, ProductionOrder.product_id, ProductionOrder.quantity,
+            ProductionOrder.status, ProductionOrder.daily_plan_id, ProductionOrder.quantity_done,
+            ProductionOrder.priority, ProductionOrder.due_date, ProductionOrder.expected_completion_date
+        ).filter(
+            ProductionOrder.status.in_(["pending", "in_progress"])
+        ).order_by(ProductionOrder.id)
+        for id_, product_id, quantity, status, plan_id, done, priority, due, expected in orders:
+            order = ProductionRecord(id_, product_id, quantity, status, plan_id, done or 0, expected)
+            self.production[id_] = order
+            if order.quantity_done >= quantity:
+                self.finishing.append(order)
+            self.scheduler.push(id_, due, priority, quantity - order.quantity_done)
+
+        # Fulfilled history is never needed again, only the lines still pending or in production
+        for id_, day, model, quantity, status in db.query(
+            DailyPlan.id, DailyPlan.day, DailyPlan.model, DailyPlan.quantity, DailyPlan.status
+        ).filter(DailyPlan.status.in_(["pending", "in_production"])):
+            self.plans[id_] = PlanRecord(id_, day, model, quantity, status)
+            if status == "pending":
+                self.open_plans[id_] = self.plans[id_]
+        self.plan_days = {day for (day,) in db.query(DailyPlan.day).filter(
+            DailyPlan.day >= self.current_day
+        ).distinct()}
+        self.next_plan_id = (db.query(func.max(DailyPlan.id)).scalar() or 0) + 1
+        self.loaded = True
+
+    def invalidate(self):
+        """Load the state again before the next run"""
+        self.loaded = False
+
+    def sync_purchases(self):
+        """Load the pending purchase orders created outside the engine since its last run (API, imports)"""
+        purchases = self.db.query(
+            PurchaseOrder.id, PurchaseOrder.supplier_id, PurchaseOrder.product_id, PurchaseOrder.quantity,
+            PurchaseOrder.expected_delivery_date
+        ).filter(PurchaseOrder.id >= self.next_purchase_id, PurchaseOrder.status == "pending").order_by(PurchaseOrder.id)
+        for id_, supplier_id, product_id, quantity, delivery_date in purchases:
+            self.purchases[id_] = PurchaseRecord(id_, supplier_id, product_id, quantity, delivery_date, "pending")
+            self.schedule_delivery(id_, delivery_date)
+            self.on_order[product_id] += quantity
+            self.next_purchase_id = id_ + 1
+
+    def run_days(self, days: int, on_day=None):
+        # Purchase order ids are handed out in memory and written at the next
+        # checkpoint, so runs and API inserts must not overlap (scenario.lock)
+        if not self.loaded:
+            self.load()
+        else:
+            self.sync_purchases()
+        self._days_since_checkpoint = 0
+        try:
+            summaries = super().run_days(days, on_day)
+            self.flush()
+        except Exception:
+            # Discard the unflushed days; the next run resumes from the last checkpoint
+            # and draws again the horizon whose plans were lost
+            self.events.clear()
+            self.ledger.clear()
+            self.pending_kpis.clear()
+            self.db.rollback()
+            self.loaded = False
+            self.planned_until = None
+            raise
+        return summaries
+
+    def _close_day(self):
+        simulated_day = self.current_day
+        self.current_day = simulated_day + timedelta(days=1)
+        self._days_since_checkpoint += 1
+        if self._days_since_checkpoint >= self.checkpoint_days:
+            self.flush()
+
+        return {
+            "day": simulated_day,
+            "events": sum(self.day_events.values()),
+            "event_types": dict(self.day_events),
+            "utilization": round(self.day_kpi["units_scheduled"] / self.capacity_per_day, 4),
+        }
+
+    def flush(self):
+        """Write the rows changed since the last checkpoint and commit once"""
+        with phase("flush"):
+            self._flush()
+
+    def _flush(self):
+        db = self.db
+
+        if self.new_stock:
+            db.execute(insert(Inventory), [
+                {"product_id": product_id, "quantity": self.stock[product_id].quantity,
+                 "max_capacity": self.stock[product_id].max_capacity}
+                for product_id in self.new_stock
+            ])
+        updated_stock = self.dirty_stock - self.new_stock
+        if updated_stock:
+            db.execute(update(Inventory), [
+                {"product_id": product_id, "quantity": self.stock[product_id].quantity}
+                for product_id in updated_stock
+            ])
+        if self.new_purchases:
+            db.execute(insert(PurchaseOrder), [
+                {"id": o.id, "supplier_id": o.supplier_id, "product_id": o.product_id, "quantity": o.quantity,
+                 "issue_date": o.issue_date, "expected_delivery_date": o.expected_delivery_date, "status": o.status}
+                for o in self.new_purchases
+            ])
+        new_purchase_ids = {o.id for o in self.new_purchases}
+        updated_purchases = [o for o in self.dirty_purchases.values() if o.id not in new_purchase_ids]
+        if updated_purchases:
+            db.execute(update(PurchaseOrder), [
+                {"id": o.id, "status": o.status, "expected_delivery_date": o.expected_delivery_date}
+                for o in updated_purchases
+            ])
+        if self.dirty_production:
+            db.execute(update(ProductionOrder), [
+                {"id": o.id, "status": o.status, "quantity_done": o.quantity_done,
+                 "expected_completion_date": o.expected_completion_date}
+                for o in self.dirty_production.values()
+            ])
+        if self.new_plans:
+            db.execute(insert(DailyPlan), [
+                {"id": p.id, "day": p.day, "model": p.model, "quantity": p.quantity, "status": p.status}
+                for p in self.new_plans
+            ])
+        new_plan_ids = {p.id for p in self.new_plans}
+        updated_plans = [p for p in self.dirty_plans.values() if p.id not in new_plan_ids]
+        if updated_plans:
+            db.execute(update(DailyPlan), [{"id": p.id, "status": p.status} for p in updated_plans])
+        self.events.flush()
+        self.ledger.flush()
+        self.flush_kpis()
+
+        db.query(SimulationState).update({SimulationState.current_day: self.current_day})
+        db.commit()
+
+        self.dirty_stock.clear()
+        self.new_stock.clear()
+        self.dirty_purchases.clear()
+        self.new_purchases.clear()
+        self.dirty_production.clear()
+        self.dirty_plans.clear()
+        self.new_plans.clear()
+        self._days_since_checkpoint = 0
+
+    def backlog(self, day: date) -> tuple[int, int]:
+        due = [plan.quantity for plan in self.open_plans.values() if plan.day <= day]
+        return len(due), sum(due)
+
+    def stock_levels(self) -> dict[int, int]:
+        return {product_id: stock.quantity for product_id, stock in self.stock.items()}
+
+    def get_supplier_index(self) -> SupplierIndex:
+        return self.supplier_index
+
+    def material_position(self, index: SupplierIndex, day: date) -> MaterialPosition:
+        position = MaterialPosition(
+            index.scatter(self.stock_levels()),
+            index.scatter(self.on_order),
+            index.scatter({product_id: stock.max_capacity for product_id, stock in self.stock.items()},
+                          DEFAULT_MAX_CAPACITY),
+        )
+        if self.replenishment.cover_days is not None:
+            windows = index.lead_times + self.replenishment.cover_days
+            until = day + timedelta(days=int(windows.max()))
+            demand = Counter()
+            for plan in self.open_plans.values():
+                if plan.day <= until:
+                    demand[(plan.day - day).days, plan.model] += plan.quantity
+            position.requirements = self.material_requirements(index, demand, windows)
+        return position
+
+    def product_name_map(self) -> dict[int, str]:
+        return self.product_names
+
+    def issue_purchases(self, day: date, orders: list[tuple[int, int, int, date]]):
+        for supplier_id, product_id, quantity, delivery in orders:
+            record = PurchaseRecord(self.next_purchase_id, supplier_id, product_id, quantity, delivery, "pending", day)
+            self.next_purchase_id += 1
+            self.purchases[record.id] = record
+            self.schedule_delivery(record.id, delivery)
+            self.new_purchases.append(record)
+            self.on_order[product_id] += quantity
+            self.log_event("purchase_ordered", day, product_id=product_id, quantity=quantity, target_day=delivery)
+
+    # --- Pasos del día en memoria ---
+
+    def check_and_generate_plan(self, day: date):
+        """Make sure there is a plan for the next day, drawing a whole horizon at a time"""
+        yield self.env.timeout(0)
+
+        tomorrow = day + timedelta(days=1)
+        if self.planned_until is not None and tomorrow < self.planned_until:
+            return
+
+        if not self.finished_products:
+            self.log_event("error", day, "No hay productos finales disponibles para generar plan")
+            return
+
+        orders = self.demand.draw(tomorrow, self.finished_products, skip_days=self.plan_days)
+        for plan_day, model, quantity in orders:
+            plan = PlanRecord(self.next_plan_id, plan_day, model, quantity, "pending")
+            self.next_plan_id += 1
+            self.plans[plan.id] = plan
+            self.open_plans[plan.id] = plan
+            self.new_plans.append(plan)
+            self.plan_days.add(plan_day)
+        self.planned_until = tomorrow + timedelta(days=self.demand.horizon_days)
+        self._log_plans_generated(day, orders)
+
+    def handle_arrivals(self, day: date):
+        """Receive the purchase orders whose delivery timeout fired, in order, see SimulationEngine"""
+        yield self.env.timeout(0)
+
+        next_day = day + timedelta(days=1)
+        due, self.due_purchases = self.due_purchases, []
+        full = set()
+        for order_id in sorted(due):
+            order = self.purchases[order_id]
+            stock = self.stock.get(order.product_id)
+            max_capacity = stock.max_capacity if stock else DEFAULT_MAX_CAPACITY
+            current = stock.quantity if stock else 0
+
+            if order.product_id in full or current + order.quantity > max_capacity:
+                # Reschedule the order for the next day
+                full.add(order.product_id)
+                order.expected_delivery_date = next_day
+                self.schedule_delivery(order.id, next_day)
+                self.dirty_purchases[order.id] = order
+                self.log_event("purchase_rescheduled", day, order_id=order.id, target_day=next_day)
+                continue
+
+            if stock:
+                stock.quantity += order.quantity
+            else:
+                self.stock[order.product_id] = StockRecord(order.quantity, DEFAULT_MAX_CAPACITY)
+                self.new_stock.add(order.product_id)
+            self.dirty_stock.add(order.product_id)
+            self.on_order[order.product_id] -= order.quantity
+            order.status = "delivered"
+            del self.purchases[order.id]
+            self.dirty_purchases[order.id] = order
+            self.day_kpi["purchase_spend"] += order.quantity * self.supplier_costs.get(order.supplier_id, 0.0)
+            self.ledger.record(order.product_id, day, order.quantity, "purchase_arrival", order.id)
+            self.log_event(
+                "purchase_arrival", day,
+                product_id=order.product_id, order_id=order.id, quantity=order.quantity
+            )
+
+    def execute_production(self, day: date):
+        """
+        Complete the orders whose last units were made yesterday, then fill
+        today's capacity from the scheduler, splitting the order that does not fit.
+        """
+        yield self.env.timeout(0)
+
+        # First, complete production orders in progress
+        for order in sorted(self.finishing, key=lambda o: o.id):
+            order.status = "completed"
+            self.dirty_production[order.id] = order
+            del self.production[order.id]
+            self.log_event("production_completed", day, product_id=order.product_id, quantity=order.quantity)
+
+            plan = self.plans.pop(order.daily_plan_id, None)
+            if plan:
+                plan.status = "fulfilled"
+                self.dirty_plans[plan.id] = plan
+                self.open_plans.pop(plan.id, None)
+                self.log_event(
+                    "order_fulfilled", day,
+                    product_id=order.product_id, order_id=plan.id, quantity=order.quantity
+                )
+        self.finishing = []
+
+        # Then, give today's capacity to the most urgent open orders
+        allocations, used = self.scheduler.dispatch(self.capacity_per_day)
+        self.day_kpi["units_scheduled"] += used
+        for order_id, units, finished in allocations:
+            order = self.production[order_id]
+            if order.status == "pending":
+                order.status = "in_progress"
+                self.log_event("production_started", day, product_id=order.product_id, quantity=order.quantity)
+            order.quantity_done += units
+            order.expected_completion_date = completion_day(day, finished)
+            self.dirty_production[order.id] = order
+            if finished:
+                self.finishing.append(order)
@@ -0,0 +1,190 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Prometheus text exposition without a client library: a few counters and
+# histograms with labels, rendered on GET /metrics
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._samples(items))
+        return lines
+
+    def _samples(self, items) -> list[str]:
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}" for key, value in items]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]  # per-bucket counts, sum, count
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _samples(self, items) -> list[str]:
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                bucket_labels = _labels(self.label_names, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            bucket_labels = _labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+DAYS = registry.register(Counter("sim_days_total", "Simulated days committed", ("engine",)))
+DAY_SECONDS = registry.register(Histogram(
+    "sim_day_seconds", "Wall time of a simulated day, commit included", ("engine",)
+))
+DAYS_PER_SECOND = registry.register(Gauge(
+    "sim_days_per_second", "Throughput of the last simulation run", ("engine",)
+))
+PHASE_SECONDS = registry.register(Histogram(
+    "sim_phase_seconds", "Wall time of each step of a simulated day", ("phase",)
+))
+EVENTS = registry.register(Counter("sim_events_total", "Simulation events logged", ("type",)))
+SQL_STATEMENTS = registry.register(Counter(
+    "sim_sql_statements_total", "SQL statements executed, by the phase or route that issued them", ("phase",)
+))
+SQL_ROWS = registry.register(Counter(
+    "sim_sql_rows_total", "Rows inserted, updated or deleted, by the phase or route that issued them", ("phase",)
+))
+SQL_SECONDS = registry.register(Counter(
+    "sim_sql_seconds_total", "Time spent executing SQL, by the phase or route that issued it", ("phase",)
+))
+HTTP_REQUESTS = registry.register(Counter(
+    "http_requests_total", "HTTP requests served", ("method", "route", "status")
+))
+HTTP_SECONDS = registry.register(Histogram(
+    "http_request_duration_seconds", "Wall time of HTTP requests", ("method", "route")
+))
+
+# Phase or route the current thread is working for; SQL statements are attributed to it
+current_phase: contextvars.ContextVar[str] = contextvars.ContextVar("current_phase", default="other")
+
+
+@contextmanager
+def sql_scope(name: str):
+    """Attribute the SQL statements of the block to `name`"""
+    token = current_phase.set(name)
+    try:
+        yield
+    finally:
+        current_phase.reset(token)
+
+
+@contextmanager
+def phase(name: str):
+    """Run the block as phase `name`, observing its wall time"""
+    token = current_phase.set(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_SECONDS.observe(time.perf_counter() - start, name)
+        current_phase.reset(token)
+
+
+def timed(name: str, generator):
+    """Run a SimPy process generator as phase `name`, observing its wall time across its yields"""
+    token = current_phase.set(name)
+    start = time.perf_counter()
+    try:
+        return (yield from generator)
+    finally:
+        PHASE_SECONDS.observe(time.perf_counter() - start, name)
+        current_phase.reset(token)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["metrics_start"] = time.perf_counter()  # statements on a connection never overlap
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop("metrics_start", time.perf_counter())
+    name = current_phase.get()
+    SQL_STATEMENTS.inc(1, name)
+    SQL_SECONDS.inc(elapsed, name)
+    if cursor.rowcount > 0:  # -1 for SELECT
+        SQL_ROWS.inc(cursor.rowcount, name)
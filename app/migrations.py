@@ -0,0 +1,100 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# Ordered schema migrations. The version applied last is stored in SQLite's
+# PRAGMA user_version, so existing simulator.db files are upgraded in place.
+# Statements must be idempotent: new databases already get the current
+# schema from create_all before migrate() runs. SQLite has no ADD COLUMN
+# IF NOT EXISTS, so new columns go through add_column().
+
+
+def add_column(table: str, column: str, ddl: str):
+    """Migration step adding `column` to `table` unless create_all already did"""
+    def apply(conn):
+        columns = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+        if column not in columns:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return apply
+
+
+MIGRATIONS = [
+    (1, [
+        "CREATE INDEX IF NOT EXISTS ix_bom_finished_product_id ON bom (finished_product_id)",
+        "CREATE INDEX IF NOT EXISTS ix_purchase_order_status_delivery ON purchase_order (status, expected_delivery_date)",
+        "CREATE INDEX IF NOT EXISTS ix_production_order_status ON production_order (status)",
+        "CREATE INDEX IF NOT EXISTS ix_event_sim_date_id ON event (sim_date, id)",
+        "CREATE INDEX IF NOT EXISTS ix_daily_plan_day ON daily_plan (day)",
+        "CREATE INDEX IF NOT EXISTS ix_daily_plan_status_day ON daily_plan (status, day)",
+    ]),
+    # Inventory ledger: existing stock becomes the opening movement at the end of the last simulated day
+    (2, [
+        "CREATE INDEX IF NOT EXISTS ix_inventory_movement_day ON inventory_movement (day)",
+        "CREATE INDEX IF NOT EXISTS ix_inventory_movement_product_day ON inventory_movement (product_id, day)",
+        "INSERT INTO inventory_movement (product_id, day, delta, cause) "
+        "SELECT product_id, date(COALESCE((SELECT current_day FROM simulation_state LIMIT 1), date('now')), '-1 day'), quantity, 'opening' "
+        "FROM inventory WHERE quantity != 0 AND NOT EXISTS (SELECT 1 FROM inventory_movement)",
+    ]),
+    # Upsert keys for the bulk importer; duplicated BOM lines keep the latest, duplicated suppliers the first
+    (3, [
+        "DELETE FROM bom WHERE id NOT IN (SELECT MAX(id) FROM bom GROUP BY finished_product_id, material_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_bom_finished_material ON bom (finished_product_id, material_id)",
+        "DELETE FROM supplier WHERE id NOT IN (SELECT MIN(id) FROM supplier GROUP BY name, product_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_supplier_name_product ON supplier (name, product_id)",
+    ]),
+    # Capacity-constrained scheduling: production progress, priorities and daily utilization.
+    # Orders already started were started whole.
+    (4, [
+        add_column("production_order", "quantity_done", "INTEGER NOT NULL DEFAULT 0"),
+        add_column("production_order", "priority", "INTEGER NOT NULL DEFAULT 0"),
+        add_column("simulation_state", "capacity_per_day", "INTEGER"),
+        add_column("daily_kpi", "units_scheduled", "INTEGER DEFAULT 0"),
+        add_column("daily_kpi", "capacity", "INTEGER DEFAULT 0"),
+        "UPDATE production_order SET quantity_done = quantity "
+        "WHERE status IN ('in_progress', 'completed') AND quantity_done = 0",
+    ]),
+    # Supplier lead-time distributions and capacity; existing suppliers keep the former fixed 3-day lead time
+    (5, [
+        add_column("supplier", "lead_time_days", "INTEGER NOT NULL DEFAULT 3"),
+        add_column("supplier", "lead_time_std", "REAL NOT NULL DEFAULT 0"),
+        add_column("supplier", "capacity_per_day", "INTEGER"),
+    ]),
+    # Typed event fields; existing events keep their rendered detail
+    (6, [
+        add_column("event", "product_id", "INTEGER"),
+        add_column("event", "order_id", "INTEGER"),
+        add_column("event", "quantity", "INTEGER"),
+        add_column("event", "target_day", "DATE"),
+    ]),
+    # Production due dates, apart from the expected completion the simulation now moves on
+    (7, [
+        add_column("production_order", "due_date", "DATE"),
+        "UPDATE production_order SET due_date = COALESCE("
+        "(SELECT day FROM daily_plan WHERE daily_plan.id = production_order.daily_plan_id), expected_completion_date) "
+        "WHERE due_date IS NULL",
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(engine: Engine) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text("PRAGMA user_version")).scalar()
+
+
+def migrate(engine: Engine) -> int:
+    """Apply every migration newer than the database version. Returns the final version."""
+    current = get_schema_version(engine)
+    for version, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        print(f"Aplicando migración de esquema v{version}...")
+        with engine.begin() as conn:
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(text(statement))
+            conn.execute(text(f"PRAGMA user_version = {version}"))
+        current = version
+    return current
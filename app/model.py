@@ -1,6 +1,6 @@
 from pydantic import BaseModel
-from typing import List, Optional
-from datetime import date
+from typing import List, Literal, Optional
+from datetime import date, datetime
 
 
 # --- Productos e Inventario ---
@@ -27,6 +27,11 @@ class InventoryItem(BaseModel):
     quantity: int
 
 
+class StockLevel(BaseModel):
+    day: date
+    quantity: int
+
+
 # --- Proveedores y compras ---
 
 class Supplier(BaseModel):
@@ -34,6 +39,9 @@ class Supplier(BaseModel):
     name: str
     product_id: int
     unit_cost: float
+    lead_time_days: int = 3
+    lead_time_std: float = 0.0
+    capacity_per_day: Optional[int] = None
 
 
 class PurchaseOrder(BaseModel):
@@ -56,6 +64,37 @@ class ProductionOrder(BaseModel):
     status: str  # "pending", "in_progress", "completed", "cancelled"
     expected_completion_date: date
     daily_plan_id: Optional[int]
+    quantity_done: int = 0  # units made so far; orders larger than the free capacity are split over days
+    priority: int = 0
+    due_date: Optional[date] = None  # the scheduler serves earlier due dates first
+
+
+class ProductionReleaseRequest(BaseModel):
+    plan_ids: Optional[List[int]] = None
+    start_day: Optional[date] = None
+    end_day: Optional[date] = None
+    priority: Literal["due_date", "fifo", "largest_first"] = "due_date"
+    order_priority: int = 0  # of the created production orders, higher goes first among orders due the same day
+
+
+class ReleasedLine(BaseModel):
+    plan_id: int
+    production_order_id: int
+    model: str
+    quantity: int
+
+
+class BlockedLine(BaseModel):
+    plan_id: int
+    model: Optional[str] = None  # None when the requested plan line does not exist
+    quantity: Optional[int] = None
+    reason: str
+    missing: dict[str, int]  # material -> unidades que faltan
+
+
+class ProductionReleaseResponse(BaseModel):
+    released: List[ReleasedLine]
+    blocked: List[BlockedLine]
 
 
 # --- Evento registrado durante la simulación ---
@@ -64,7 +103,16 @@ class Event(BaseModel):
     id: Optional[int]
     type: str  # "production_start", etc.
     sim_date: date
-    detail: str
+    product_id: Optional[int] = None
+    order_id: Optional[int] = None
+    quantity: Optional[int] = None
+    target_day: Optional[date] = None
+    detail: str  # rendered from the typed fields when read
+
+
+class EventPage(BaseModel):
+    items: List[Event]
+    next_cursor: Optional[str] = None  # None cuando no hay más eventos
 
 
 # --- Configuración de la simulación (solo en memoria o JSON) ---
@@ -97,3 +145,152 @@ class SimulationResponse(BaseModel):
     day: date
     events: List[Event]
     error: Optional[str] = None
+
+
+class DaySummary(BaseModel):
+    day: date
+    events: int
+    event_types: dict[str, int]
+    utilization: float = 0.0  # share of the production capacity used
+
+
+class SimulationBatchResponse(BaseModel):
+    success: bool
+    start_day: date
+    end_day: date
+    days: List[DaySummary]
+    error: Optional[str] = None
+
+
+# --- Planificación de necesidades de materiales (MRP) ---
+
+class MaterialShortage(BaseModel):
+    day: date
+    material_id: int
+    material: str
+    gross_requirement: int
+    net_requirement: int
+    projected_stock: int
+
+
+class MRPResponse(BaseModel):
+    start_day: date
+    days: int
+    plan_lines: int
+    shortages: List[MaterialShortage]
+
+
+# --- Réplicas Monte Carlo ---
+
+class KPIStats(BaseModel):
+    mean: float
+    std: float
+    ci_low: float
+    ci_high: float
+
+
+class ReplicationRun(BaseModel):
+    seed: int
+    fill_rate: float
+    stockout_days: int
+    ending_inventory: int
+    late_orders: int
+
+
+class ReplicationResponse(BaseModel):
+    replications: int
+    days: int
+    kpis: dict[str, KPIStats]
+    runs: List[ReplicationRun]
+
+
+# --- Checkpoints de la simulación ---
+
+class CheckpointInfo(BaseModel):
+    id: str
+    scenario: str
+    current_day: date
+    created_at: str
+
+
+class JobInfo(BaseModel):
+    id: str
+    scenario: str
+    status: str
+    days_requested: Optional[int] = None
+    until: Optional[date] = None
+    days_done: int
+    current_day: Optional[date] = None
+    error: Optional[str] = None
+
+
+class DailyKPI(BaseModel):
+    day: date
+    units_produced: int
+    orders_fulfilled: int
+    units_received: int
+    purchase_spend: float
+    backlog_orders: int
+    backlog_units: int
+    stock_total: int
+    stock_levels: dict[int, int]
+    units_scheduled: int  # production capacity used
+    capacity: int
+    utilization: float
+
+
+class ImportFileInfo(BaseModel):
+    kind: str
+    filename: Optional[str] = None
+    format: str
+    rows_total: Optional[int] = None  # known once the file has been validated
+    rows_done: int
+
+
+class ImportJobInfo(BaseModel):
+    id: str
+    scenario: str
+    status: str
+    files: List[ImportFileInfo]
+    rows_total: int
+    rows_done: int
+    stats: dict[str, int]
+    error: Optional[str] = None
+
+
+class ProfiledStatement(BaseModel):
+    sql: str
+    duration_ms: float
+    rows: Optional[int] = None  # rows returned by a SELECT, rows changed by a write
+    executemany: bool = False
+    plan: Optional[List[str]] = None  # EXPLAIN QUERY PLAN, for slow statements
+
+
+class RepeatedStatement(BaseModel):
+    sql: str
+    count: int
+    total_ms: float
+
+
+class QueryProfileInfo(BaseModel):
+    id: str
+    label: str
+    started_at: datetime
+    duration_ms: Optional[float] = None
+    statement_count: int
+    sql_ms: float
+
+
+class QueryProfileReport(QueryProfileInfo):
+    n_plus_one: List[RepeatedStatement]
+    slow: List[ProfiledStatement]
+    statements: List[ProfiledStatement]
+
+
+class SlowQuery(BaseModel):
+    profile_id: str
+    label: str
+    at: datetime
+    sql: str
+    duration_ms: float
+    plan: Optional[List[str]] = None
@@ -0,0 +1,127 @@
+from dataclasses import dataclass
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy.orm import Session
+from bom import bom_graph
+from database import DailyPlan, Inventory, Product, PurchaseOrder
+
+
+@dataclass
+class BOMMatrix:
+    """Dense products x raw materials matrix of the flattened (multi-level) BOM"""
+    product_ids: list[int]
+    material_ids: list[int]
+    product_index: dict[str, int]  # product name -> row
+    material_index: dict[int, int]  # material id -> column
+    matrix: np.ndarray
+
+
+@dataclass
+class MRPResult:
+    start: date
+    days: int
+    material_ids: list[int]
+    plan_lines: int
+    gross: np.ndarray  # days x materials, units consumed by the plan each day
+    receipts: np.ndarray  # days x materials, pending purchase orders due each day
+    projected: np.ndarray  # days x materials, stock at the end of each day (may be negative)
+    net: np.ndarray  # days x materials, extra units needed that day to avoid a stockout
+
+
+def build_bom_matrix(session: Session) -> BOMMatrix:
+    rows = [(product_id, material_id, quantity)
+            for product_id, materials in bom_graph(session).explode_all().items()
+            for material_id, quantity in materials.items()]
+    product_ids = sorted({r[0] for r in rows})
+    material_ids = sorted({r[1] for r in rows})
+    row_of = {id_: i for i, id_ in enumerate(product_ids)}
+    material_index = {id_: i for i, id_ in enumerate(material_ids)}
+
+    matrix = np.zeros((len(product_ids), len(material_ids)), dtype=np.int64)
+    if rows:
+        np.add.at(
+            matrix,
+            ([row_of[r[0]] for r in rows], [material_index[r[1]] for r in rows]),
+            [r[2] for r in rows]
+        )
+
+    names = dict(session.query(Product.name, Product.id).filter(Product.id.in_(product_ids)).all()) if product_ids else {}
+    product_index = {name: row_of[id_] for name, id_ in names.items()}
+    return BOMMatrix(product_ids, material_ids, product_index, material_index, matrix)
+
+
+def compute_requirements(session: Session, start: date | None = None, days: int | None = None,
+                         bom: BOMMatrix | None = None) -> MRPResult:
+    """
+    Explode every pending plan line in [start, start + days) through the BOM
+    and net the resulting gross requirements against current inventory and
+    pending purchase orders, all in one pass over dense day x material arrays.
+    """
+    bom = bom or build_bom_matrix(session)
+
+    query = session.query(DailyPlan.day, DailyPlan.model, DailyPlan.quantity).filter(DailyPlan.status == "pending")
+    if start is not None:
+        query = query.filter(DailyPlan.day >= start)
+        if days is not None:
+            query = query.filter(DailyPlan.day < start + timedelta(days=days))
+    plan = query.all()
+
+    if start is None:
+        start = min((p[0] for p in plan), default=date.today())
+    if days is None:
+        days = max(((p[0] - start).days + 1 for p in plan), default=1)
+
+    n_materials = len(bom.material_ids)
+
+    # Demand per day and product -> gross requirements per day and material
+    demand = np.zeros((days, len(bom.product_ids)), dtype=np.int64)
+    lines = [(
+        (day - start).days, bom.product_index[model], quantity
+    ) for day, model, quantity in plan if model in bom.product_index and 0 <= (day - start).days < days]
+    if lines:
+        day_idx, product_idx, quantities = (np.array(col) for col in zip(*lines))
+        np.add.at(demand, (day_idx, product_idx), quantities)
+    gross = demand @ bom.matrix
+
+    # Current stock and scheduled receipts on the same material axis
+    stock = np.zeros(n_materials, dtype=np.int64)
+    for product_id, quantity in session.query(Inventory.product_id, Inventory.quantity).all():
+        column = bom.material_index.get(product_id)
+        if column is not None:
+            stock[column] = quantity or 0
+
+    receipts = np.zeros((days, n_materials), dtype=np.int64)
+    end = start + timedelta(days=days)
+    purchases = session.query(
+        PurchaseOrder.expected_delivery_date, PurchaseOrder.product_id, PurchaseOrder.quantity
+    ).filter(
+        PurchaseOrder.status == "pending",
+        PurchaseOrder.expected_delivery_date < end
+    ).all()
+    arrivals = [(
+        max((delivery - start).days, 0), bom.material_index[product_id], quantity
+    ) for delivery, product_id, quantity in purchases if product_id in bom.material_index]
+    if arrivals:
+        day_idx, material_idx, quantities = (np.array(col) for col in zip(*arrivals))
+        np.add.at(receipts, (day_idx, material_idx), quantities)
+
+    projected = stock + np.cumsum(receipts, axis=0) - np.cumsum(gross, axis=0)
+
+    # Net requirements assume earlier shortages get covered: the cumulative
+    # net requirement is the running maximum of the cumulative deficit
+    covered = np.maximum.accumulate(np.maximum(-projected, 0), axis=0)
+    net = np.diff(covered, axis=0, prepend=np.zeros((1, n_materials), dtype=np.int64))
+
+    return MRPResult(start, days, bom.material_ids, len(lines), gross, receipts, projected, net)
+
+
+def shortages(result: MRPResult) -> list[dict]:
+    """Flatten the non-zero net requirements into (day, material) entries"""
+    day_idx, material_idx = np.nonzero(result.net)
+    return [{
+        "day": result.start + timedelta(days=int(d)),
+        "material_id": result.material_ids[m],
+        "gross_requirement": int(result.gross[d, m]),
+        "net_requirement": int(result.net[d, m]),
+        "projected_stock": int(result.projected[d, m]),
+    } for d, m in zip(day_idx, material_idx)]
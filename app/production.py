@@ -1,6 +1,8 @@
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from database import DailyPlan, Product, BOM, Inventory, ProductionOrder, SimulationState
+from bom import bom_graph
+from database import DailyPlan, Product, Inventory, ProductionOrder, SimulationState
+from ledger import InventoryLedger
 
 def add_to_production(order_id: int, session: Session):
     """
@@ -18,22 +20,25 @@ def add_to_production(order_id: int, session: Session):
         if not product:
             return f"Product {order.model} not found"
 
-        # Get BOM for the product
-        bom_items = session.query(BOM).filter_by(finished_product_id=product.id).all()
-        if not bom_items:
+        # Raw materials per unit through every BOM level, from the cached explosion
+        materials = bom_graph(session).explode(product.id)
+        if not materials:
             return f"No BOM found for product {order.model}"
 
         # Check inventory for each material
-        missing_materials = []
-        for bom_item in bom_items:
-            inventory = session.query(Inventory).filter_by(product_id=bom_item.material_id).first()
-            required_quantity = bom_item.quantity * order.quantity
-            
-            if not inventory or inventory.quantity < required_quantity:
-                material = session.query(Product).filter_by(id=bom_item.material_id).first()
-                missing_materials.append(f"{material.name}: {required_quantity - (inventory.quantity if inventory else 0)} units")
-
-        if missing_materials:
+        inventory = {
+            item.product_id: item
+            for item in session.query(Inventory).filter(Inventory.product_id.in_(materials))
+        }
+        missing = {
+            material_id: quantity * order.quantity - (inventory[material_id].quantity if material_id in inventory else 0)
+            for material_id, quantity in materials.items()
+            if material_id not in inventory or inventory[material_id].quantity < quantity * order.quantity
+        }
+        if missing:
+            names = dict(session.query(Product.id, Product.name).filter(Product.id.in_(missing)).all())
+            missing_materials = [f"{names.get(material_id, material_id)}: {units} units"
+                                 for material_id, units in missing.items()]
             return f"Missing materials: {', '.join(missing_materials)}"
 
         # Get current simulation day
@@ -47,7 +52,8 @@ def add_to_production(order_id: int, session: Session):
             quantity=order.quantity,
             status="pending",
             expected_completion_date=current_day + timedelta(days=1),
-            daily_plan_id=order_id
+            daily_plan_id=order_id,
+            due_date=order.day
         )
         session.add(production_order)
         
@@ -55,10 +61,13 @@ def add_to_production(order_id: int, session: Session):
         order.status = "in_production"
         
         # Remove raw materials from inventory
-        for bom_item in bom_items:
-            inventory = session.query(Inventory).filter_by(product_id=bom_item.material_id).first()
-            required_quantity = bom_item.quantity * order.quantity
-            inventory.quantity -= required_quantity
+        session.flush()
+        ledger = InventoryLedger(session)
+        for material_id, quantity in materials.items():
+            required_quantity = quantity * order.quantity
+            inventory[material_id].quantity -= required_quantity
+            ledger.record(material_id, current_day, -required_quantity, "production", production_order.id)
+        ledger.flush()
         
         session.commit()
         return "ok"
@@ -66,3 +75,136 @@ def add_to_production(order_id: int, session: Session):
     except Exception as e:
         session.rollback()
         return str(e)
+
+
+RELEASE_PRIORITIES = {
+    "due_date": lambda plan: (plan.day, plan.id),
+    "fifo": lambda plan: plan.id,
+    "largest_first": lambda plan: (-plan.quantity, plan.day, plan.id),
+}
+
+
+def release_production_batch(session: Session, plan_ids: list[int] = None, start_day=None, end_day=None,
+                             priority: str = "due_date", order_priority: int = 0):
+    """
+    Release several pending daily plan lines to production at once.
+    Materials are allocated greedily, in priority order, from a single
+    inventory snapshot and every production order and inventory decrement
+    is written in one transaction. The orders get `order_priority`, which
+    the scheduler uses among orders due the same day.
+    Requested `plan_ids` that are missing, not pending or outside the days
+    are reported as blocked. A request without ids nor days is rejected.
+    Returns a dict with the released lines and the blocked ones.
+    """
+    if priority not in RELEASE_PRIORITIES:
+        raise ValueError(f"Unknown priority rule: {priority}")
+    if plan_ids is None and start_day is None and end_day is None:
+        raise ValueError("Give plan_ids or a day range to release")
+
+    blocked = []
+    if plan_ids is not None:
+        found = {plan.id: plan for plan in session.query(DailyPlan).filter(DailyPlan.id.in_(plan_ids))}
+        plans = []
+        for plan_id in dict.fromkeys(plan_ids):
+            plan = found.get(plan_id)
+            if plan is None:
+                reason = "Plan line not found"
+            elif plan.status != "pending":
+                reason = f"Plan line is {plan.status}, not pending"
+            elif (start_day is not None and plan.day < start_day) or (end_day is not None and plan.day > end_day):
+                reason = "Plan line outside the requested days"
+            else:
+                plans.append(plan)
+                continue
+            blocked.append({"plan_id": plan_id, "model": plan.model if plan else None,
+                            "quantity": plan.quantity if plan else None, "reason": reason, "missing": {}})
+    else:
+        query = session.query(DailyPlan).filter(DailyPlan.status == "pending")
+        if start_day is not None:
+            query = query.filter(DailyPlan.day >= start_day)
+        if end_day is not None:
+            query = query.filter(DailyPlan.day <= end_day)
+        plans = query.all()
+    plans.sort(key=RELEASE_PRIORITIES[priority])
+    if not plans:
+        return {"released": [], "blocked": blocked}
+
+    # Snapshot of everything the allocation needs, one query per table
+    products = dict(session.query(Product.name, Product.id).filter(
+        Product.name.in_({plan.model for plan in plans})
+    ).all())
+    graph = bom_graph(session)
+    bom = {product_id: graph.explode(product_id) for product_id in products.values()}
+    material_ids = {material_id for items in bom.values() for material_id in items}
+    inventory = {
+        item.product_id: item
+        for item in session.query(Inventory).filter(Inventory.product_id.in_(material_ids))
+    }
+    available = {material_id: (inventory[material_id].quantity if material_id in inventory else 0)
+                 for material_id in material_ids}
+    names = dict(session.query(Product.id, Product.name).filter(Product.id.in_(material_ids)).all())
+
+    state = session.query(SimulationState).first()
+    current_day = state.current_day if state else datetime.now().date()
+
+    released, new_orders = [], []
+    for plan in plans:
+        product_id = products.get(plan.model)
+        if product_id is None:
+            blocked.append({"plan_id": plan.id, "model": plan.model, "quantity": plan.quantity,
+                            "reason": f"Product {plan.model} not found", "missing": {}})
+            continue
+        items = bom.get(product_id)
+        if not items:
+            blocked.append({"plan_id": plan.id, "model": plan.model, "quantity": plan.quantity,
+                            "reason": f"No BOM found for product {plan.model}", "missing": {}})
+            continue
+
+        missing = {
+            names.get(material_id, str(material_id)): quantity * plan.quantity - available[material_id]
+            for material_id, quantity in items.items()
+            if available[material_id] < quantity * plan.quantity
+        }
+        if missing:
+            blocked.append({"plan_id": plan.id, "model": plan.model, "quantity": plan.quantity,
+                            "reason": "Missing materials", "missing": missing})
+            continue
+
+        for material_id, quantity in items.items():
+            available[material_id] -= quantity * plan.quantity
+        plan.status = "in_production"
+        order = ProductionOrder(
+            creation_date=current_day,
+            product_id=product_id,
+            quantity=plan.quantity,
+            status="pending",
+            expected_completion_date=current_day + timedelta(days=1),
+            daily_plan_id=plan.id,
+            due_date=plan.day,
+            priority=order_priority
+        )
+        new_orders.append(order)
+        released.append((plan, order))
+
+    try:
+        for material_id, item in inventory.items():
+            item.quantity = available[material_id]
+        session.add_all(new_orders)
+        session.flush()
+        ledger = InventoryLedger(session)
+        for plan, order in released:
+            for material_id, quantity in bom[order.product_id].items():
+                ledger.record(material_id, current_day, -quantity * plan.quantity, "production", order.id)
+        ledger.flush()
+        # Build the report before commit expires the rows
+        result = {
+            "released": [{"plan_id": plan.id, "production_order_id": order.id, "model": plan.model,
+                          "quantity": plan.quantity} for plan, order in released],
+            "blocked": blocked,
+        }
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    return result
@@ -0,0 +1,209 @@
+import contextvars
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Every request with the X-Profile header, or every request and simulated day
+# with SIM_PROFILE=1, records the SQL statements it issues
+PROFILE_ALL = os.getenv("SIM_PROFILE", "0") == "1"
+SLOW_QUERY_MS = float(os.getenv("SIM_PROFILE_SLOW_MS", "20"))
+N_PLUS_ONE_REPEATS = int(os.getenv("SIM_PROFILE_REPEATS", "5"))  # same statement shape this many times
+MAX_PROFILES = 100
+MAX_SLOW_QUERIES = 200
+
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """The statement with its whitespace collapsed and expanded IN lists folded, to group repeated queries"""
+    return _IN_LIST.sub("(?...)", _SPACES.sub(" ", statement).strip())
+
+
+class QueryProfile:
+    """SQL statements issued by one request or simulated day, in order"""
+
+    def __init__(self, label: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.started_at = datetime.now()
+        self.duration_ms = None
+        self.statements: list[dict] = []
+        self._start = time.perf_counter()
+
+    def record(self, statement: str, duration_ms: float, rows: int | None, executemany: bool,
+               plan: list | None) -> dict:
+        entry = {
+            "sql": statement, "duration_ms": round(duration_ms, 3), "rows": rows,
+            "executemany": executemany, "plan": plan,
+        }
+        self.statements.append(entry)
+        return entry
+
+    def finish(self):
+        self.duration_ms = round((time.perf_counter() - self._start) * 1000, 3)
+
+    def n_plus_one(self) -> list[dict]:
+        """Statement shapes run one by one at least N_PLUS_ONE_REPEATS times, the likely N+1 loops"""
+        shapes: dict[str, list[dict]] = {}
+        for entry in self.statements:
+            if not entry["executemany"]:
+                shapes.setdefault(statement_shape(entry["sql"]), []).append(entry)
+        return sorted((
+            {"sql": shape, "count": len(entries), "total_ms": round(sum(e["duration_ms"] for e in entries), 3)}
+            for shape, entries in shapes.items() if len(entries) >= N_PLUS_ONE_REPEATS
+        ), key=lambda c: -c["count"])
+
+    def report(self) -> dict:
+        return {
+            "id": self.id,
+            "label": self.label,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "statement_count": len(self.statements),
+            "sql_ms": round(sum(e["duration_ms"] for e in self.statements), 3),
+            "n_plus_one": self.n_plus_one(),
+            "slow": [e for e in self.statements if e["duration_ms"] >= SLOW_QUERY_MS],
+            "statements": self.statements,
+        }
+
+
+active_profile: contextvars.ContextVar[QueryProfile | None] = contextvars.ContextVar("active_profile", default=None)
+_profiles: "OrderedDict[str, QueryProfile]" = OrderedDict()
+_profiles_lock = threading.Lock()
+slow_queries: deque = deque(maxlen=MAX_SLOW_QUERIES)  # slow statements of every profile, newest last
+
+
+@contextmanager
+def profile(label: str):
+    """Record the SQL issued by the block; the profile is kept for get_profile() afterwards"""
+    current = QueryProfile(label)
+    token = active_profile.set(current)
+    try:
+        yield current
+    finally:
+        current.finish()
+        active_profile.reset(token)
+        with _profiles_lock:
+            _profiles[current.id] = current
+            while len(_profiles) > MAX_PROFILES:
+                _profiles.popitem(last=False)
+
+
+async def profile_stream(body, current: QueryProfile):
+    """
+    Body iterator of a streaming response whose statements keep going to
+    `current` until the stream ends: the body runs after profile() exits.
+    """
+    iterator = body.__aiter__()
+    try:
+        while True:
+            # Set and reset around each step, so the token never crosses a yield
+            token = active_profile.set(current)
+            try:
+                chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                active_profile.reset(token)
+            yield chunk
+    finally:
+        current.finish()
+
+
+def get_profile(profile_id: str) -> QueryProfile:
+    with _profiles_lock:
+        return _profiles[profile_id]
+
+
+def list_profiles() -> list[QueryProfile]:
+    with _profiles_lock:
+        return list(_profiles.values())
+
+
+def check_max_queries(current: QueryProfile, max_count: int):
+    """Fail with the statements issued if the profile holds more than `max_count`"""
+    if len(current.statements) > max_count:
+        listing = "\n".join(f"  {e['sql']}" for e in current.statements)
+        raise AssertionError(f"{current.label}: {len(current.statements)} consultas SQL, máximo {max_count}\n{listing}")
+
+
+@contextmanager
+def assert_max_queries(max_count: int, label: str = "assert_max_queries"):
+    """
+    Fail with the statements issued if the block runs more than `max_count`.
+    Only code run in the caller's context is seen: for the API use the
+    X-Profile header, as the max_queries pytest fixture does.
+    """
+    with profile(label) as current:
+        yield current
+    check_max_queries(current, max_count)
+
+
+class _CountingCursor:
+    """DBAPI cursor proxy that counts the rows of a SELECT into its profile entry as they are fetched"""
+
+    def __init__(self, cursor, entry: dict):
+        self._cursor = cursor
+        self._entry = entry
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._entry["rows"] += 1
+        return row
+
+    def fetchmany(self, *size):
+        rows = self._cursor.fetchmany(*size)
+        self._entry["rows"] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._entry["rows"] += len(rows)
+        return rows
+
+
+def _explain(cursor, statement: str, parameters) -> list[str] | None:
+    """EXPLAIN QUERY PLAN on a separate DBAPI cursor, so no SQLAlchemy event fires again"""
+    try:
+        return [row[-1] for row in cursor.connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())]
+    except Exception:
+        return None  # statements such as PRAGMA or DDL have no plan
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if active_profile.get() is not None:
+        conn.info["profile_start"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    current = active_profile.get()
+    start = conn.info.pop("profile_start", None)
+    if current is None or start is None:
+        return
+    duration_ms = (time.perf_counter() - start) * 1000
+    slow = duration_ms >= SLOW_QUERY_MS
+    plan = _explain(cursor, statement, parameters) if slow and not executemany else None
+    if cursor.description is not None and context is not None and not executemany:
+        # Rows returned: counted as the result fetches them, SQLite reports no rowcount for SELECT
+        entry = current.record(statement, duration_ms, 0, executemany, plan)
+        context.cursor = _CountingCursor(cursor, entry)
+    else:
+        rows = cursor.rowcount if cursor.rowcount >= 0 else None
+        current.record(statement, duration_ms, rows, executemany, plan)
+    if slow:
+        slow_queries.append({"profile_id": current.id, "label": current.label, "at": datetime.now(),
+                             "sql": statement, "duration_ms": round(duration_ms, 3), "plan": plan})
@@ -0,0 +1,207 @@
+from dataclasses import dataclass
+import numpy as np
+from sqlalchemy.orm import Session
+from database import Supplier
+
+# Replenishment policies work on dense arrays aligned on the purchasable
+# products (those with at least one supplier) and return the quantity to
+# order today for every one of them
+
+DEFAULT_MAX_CAPACITY = 1000
+
+
+@dataclass(slots=True)
+class SupplierOption:
+    supplier_id: int
+    unit_cost: float
+    lead_time_days: int  # mean
+    lead_time_std: float
+    capacity_per_day: int | None  # units per order day, None if unlimited
+
+
+SUPPLIER_COLUMNS = (Supplier.id, Supplier.product_id, Supplier.unit_cost, Supplier.lead_time_days,
+                    Supplier.lead_time_std, Supplier.capacity_per_day)
+
+
+class SupplierIndex:
+    """
+    Suppliers of every purchasable product ranked by effective cost: unit
+    cost plus `lead_time_cost` per unit and day of mean lead time. Ties go
+    to the shorter lead time, then to the lowest supplier id.
+    """
+
+    def __init__(self, options: dict[int, list[SupplierOption]]):
+        self.options = options
+        self.product_ids = np.array(sorted(options), dtype=np.int64)
+        # Mean lead time of the preferred supplier, for the requirement windows
+        self.lead_times = np.array([options[p][0].lead_time_days for p in self.product_ids], dtype=np.int64)
+
+    @classmethod
+    def build(cls, rows, lead_time_cost: float = 0.0) -> "SupplierIndex":
+        """`rows` are (supplier_id, product_id, unit_cost, lead_time_days, lead_time_std, capacity_per_day)"""
+        options: dict[int, list[SupplierOption]] = {}
+        for supplier_id, product_id, unit_cost, lead_time, lead_time_std, capacity in rows:
+            options.setdefault(product_id, []).append(
+                SupplierOption(supplier_id, unit_cost, max(1, lead_time or 1), lead_time_std or 0.0, capacity)
+            )
+        for ranking in options.values():
+            ranking.sort(key=lambda o: (o.unit_cost + lead_time_cost * o.lead_time_days, o.lead_time_days, o.supplier_id))
+        return cls(options)
+
+    @classmethod
+    def load(cls, db: Session, lead_time_cost: float = 0.0) -> "SupplierIndex":
+        return cls.build(db.query(*SUPPLIER_COLUMNS), lead_time_cost)
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def scatter(self, values: dict[int, int], default: int = 0) -> np.ndarray:
+        """Dense array of `values` (product id -> value) on the index axis"""
+        result = np.full(len(self.product_ids), default, dtype=np.int64)
+        if values and len(self.product_ids):
+            keys = np.fromiter(values.keys(), dtype=np.int64, count=len(values))
+            data = np.fromiter(values.values(), dtype=np.int64, count=len(values))
+            position = np.searchsorted(self.product_ids, keys)
+            found = position < len(self.product_ids)
+            found[found] = self.product_ids[position[found]] == keys[found]
+            result[position[found]] = data[found]
+        return result
+
+    def allocate(self, quantities: np.ndarray) -> list[tuple[SupplierOption, int, int]]:
+        """
+        Split the quantity of every product over its ranking, each supplier
+        taking up to its daily capacity. Returns (supplier, product_id,
+        quantity); units that no supplier can take today are not ordered.
+        """
+        orders = []
+        for i in np.flatnonzero(quantities > 0):
+            product_id, remaining = int(self.product_ids[i]), int(quantities[i])
+            for option in self.options[product_id]:
+                units = remaining if option.capacity_per_day is None else min(remaining, option.capacity_per_day)
+                if units > 0:
+                    orders.append((option, product_id, units))
+                    remaining -= units
+                if remaining == 0:
+                    break
+        return orders
+
+
+def draw_lead_times(options: list[SupplierOption], rng: np.random.Generator) -> np.ndarray:
+    """Lead time in days of every order: normal around each supplier's mean, rounded, at least one day"""
+    if not options:
+        return np.array([], dtype=np.int64)
+    means = np.array([o.lead_time_days for o in options], dtype=float)
+    stds = np.array([o.lead_time_std for o in options], dtype=float)
+    return np.maximum(1, np.rint(rng.normal(means, stds))).astype(np.int64)
+
+
+@dataclass
+class MaterialPosition:
+    """Stock situation of every indexed product at the end of the day"""
+    on_hand: np.ndarray
+    on_order: np.ndarray  # units in pending purchase orders
+    max_capacity: np.ndarray
+    requirements: np.ndarray | None = None  # units the pending plan needs within each product's window
+
+    @property
+    def inventory_position(self) -> np.ndarray:
+        return self.on_hand + self.on_order
+
+
+class ReplenishmentPolicy:
+    lead_time_cost = 0.0  # cost per unit and day of lead time when ranking suppliers
+    cover_days = None  # days of pending plan beyond the lead time the policy needs exploded, None if it needs none
+
+    def order_quantities(self, position: MaterialPosition) -> np.ndarray:
+        raise NotImplementedError
+
+
+class NoReplenishment(ReplenishmentPolicy):
+    """Purchase orders only come from the API and the importers"""
+
+    def order_quantities(self, position):
+        return np.zeros_like(position.on_hand)
+
+
+class ReorderPointPolicy(ReplenishmentPolicy):
+    """
+    (s, S) policy: when the inventory position (on hand plus on order)
+    falls to the reorder point, order up to the order-up-to level. Both
+    levels are fractions of each product's max capacity.
+    """
+
+    def __init__(self, reorder_point: float = 0.25, order_up_to: float = 0.9, lead_time_cost: float = 0.0):
+        if not 0 <= reorder_point < order_up_to <= 1:
+            raise ValueError("Se requiere 0 <= reorder_point < order_up_to <= 1")
+        self.reorder_point = reorder_point
+        self.order_up_to = order_up_to
+        self.lead_time_cost = lead_time_cost
+
+    def order_quantities(self, position):
+        reorder_level = np.floor(self.reorder_point * position.max_capacity).astype(np.int64)
+        target = np.floor(self.order_up_to * position.max_capacity).astype(np.int64)
+        current = position.inventory_position
+        return np.where(current <= reorder_level, np.maximum(target - current, 0), 0)
+
+
+class MRPPolicy(ReplenishmentPolicy):
+    """
+    Order what the pending plan needs over the preferred supplier's lead
+    time plus `cover_days`, exploded through the BOM, plus a safety stock
+    (fraction of max capacity), net of the inventory position and capped
+    at the free capacity.
+    """
+
+    def __init__(self, cover_days: int = 7, safety_stock: float = 0.1, lead_time_cost: float = 0.0):
+        self.cover_days = cover_days
+        self.safety_stock = safety_stock
+        self.lead_time_cost = lead_time_cost
+
+    def order_quantities(self, position):
+        current = position.inventory_position
+        safety = np.floor(self.safety_stock * position.max_capacity).astype(np.int64)
+        needed = position.requirements + safety - current
+        return np.clip(needed, 0, np.maximum(position.max_capacity - current, 0))
+
+
+REPLENISHMENT_POLICIES = {
+    "none": NoReplenishment,
+    "reorder_point": ReorderPointPolicy,
+    "mrp": MRPPolicy,
+}
+
+
+def replenishment_policy_from_config(config: dict) -> ReplenishmentPolicy:
+    """Build a policy from a dict such as {"type": "mrp", "cover_days": 14}"""
+    params = dict(config)
+    policy_type = params.pop("type", "reorder_point")
+    if policy_type not in REPLENISHMENT_POLICIES:
+        raise ValueError(f"Política de reaprovisionamiento desconocida: {policy_type}")
+    return REPLENISHMENT_POLICIES[policy_type](**params)
+
+
+def requirements_matrix(explosions: dict[int, dict[int, int]], names: dict[int, str],
+                        index: SupplierIndex) -> tuple[dict[str, int], np.ndarray]:
+    """Models x indexed products matrix of the flattened BOM, with the row of each model name"""
+    models = [product_id for product_id in sorted(explosions) if product_id in names]
+    matrix = np.zeros((len(models), len(index)), dtype=np.int64)
+    for row, product_id in enumerate(models):
+        matrix[row] = index.scatter(explosions[product_id])
+    return {names[product_id]: row for row, product_id in enumerate(models)}, matrix
+
+
+def plan_requirements(demand: dict[tuple[int, str], int], rows: dict[str, int], matrix: np.ndarray,
+                      windows: np.ndarray) -> np.ndarray:
+    """
+    Units of every indexed product needed by `demand`, (days from today,
+    model name) -> units, due within that product's window in days.
+    Overdue lines count as due today.
+    """
+    horizon = int(windows.max()) + 1 if len(windows) else 1
+    by_day = np.zeros((horizon, matrix.shape[0]), dtype=np.int64)
+    for (offset, model), quantity in demand.items():
+        row = rows.get(model)
+        if row is not None and offset < horizon:
+            by_day[max(offset, 0), row] += quantity
+    cumulative = np.cumsum(by_day @ matrix, axis=0)
+    return cumulative[windows, np.arange(len(windows))]
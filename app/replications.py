@@ -0,0 +1,128 @@
+import math
+import multiprocessing
+import os
+import sqlite3
+import statistics
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from database import DailyPlan, Inventory
+from production import release_production_batch
+from scenarios import build_engine
+
+KPIS = ["fill_rate", "stockout_days", "ending_inventory", "late_orders"]
+
+# Two-sided 95% Student t critical values by degrees of freedom
+T_95 = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262,
+    10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 25: 2.060, 30: 2.042, 40: 2.021, 60: 2.000, 120: 1.980,
+}
+
+
+def _t_critical(df: int) -> float:
+    candidates = [k for k in T_95 if k <= df]
+    return T_95[max(candidates)] if df <= 120 else 1.960
+
+
+def snapshot_database(db_path: str) -> str:
+    """Consistent copy of a scenario database in a temporary file, so replications never see a run in progress"""
+    fd, snapshot_path = tempfile.mkstemp(suffix=".db", prefix="replication-")
+    os.close(fd)
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(snapshot_path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    return snapshot_path
+
+
+def open_in_memory_copy(db_path: str):
+    """Copy a scenario database into a private in-memory SQLite database"""
+    memory = sqlite3.connect(":memory:", check_same_thread=False)
+    source = sqlite3.connect(db_path)
+    try:
+        source.backup(memory)
+    finally:
+        source.close()
+    db_engine = create_engine("sqlite://", creator=lambda: memory, poolclass=StaticPool)
+    return sessionmaker(bind=db_engine)()
+
+
+def run_replication(db_path: str, days: int, seed: int) -> dict:
+    """
+    Simulate `days` days on a private copy of the scenario, with the engine,
+    demand model and replenishment policy the scenario runs with. Every day
+    the plan lines that are due are released to production before the day
+    runs, so the KPIs reflect whether materials were there when needed.
+    """
+    session = open_in_memory_copy(db_path)
+    try:
+        engine = build_engine(session, seed=seed, verbose=False)
+        start = engine.current_day
+        end = start + timedelta(days=days)
+
+        stockout_days = 0
+        late_orders = 0
+        for _ in range(days):
+            result = release_production_batch(session, end_day=engine.current_day, priority="due_date")
+            if result["released"]:
+                engine.invalidate()
+            if result["blocked"]:
+                stockout_days += 1
+                due_today = _due_today(session, engine.current_day)
+                late_orders += sum(1 for line in result["blocked"] if line["plan_id"] in due_today)
+            engine.run_one_day()
+
+        due = session.query(DailyPlan.status).filter(DailyPlan.day >= start, DailyPlan.day < end).all()
+        fulfilled = sum(1 for (status,) in due if status == "fulfilled")
+        ending_inventory = session.query(func.coalesce(func.sum(Inventory.quantity), 0)).scalar()
+
+        return {
+            "seed": seed,
+            "fill_rate": fulfilled / len(due) if due else 1.0,
+            "stockout_days": stockout_days,
+            "ending_inventory": ending_inventory,
+            "late_orders": late_orders,
+        }
+    finally:
+        session.close()
+
+
+def _due_today(session, day) -> set[int]:
+    return {id_ for (id_,) in session.query(DailyPlan.id).filter(DailyPlan.day == day)}
+
+
+def summarize(values: list[float]) -> dict:
+    mean = statistics.fmean(values)
+    std = statistics.stdev(values) if len(values) > 1 else 0.0
+    half_width = _t_critical(len(values) - 1) * std / math.sqrt(len(values)) if len(values) > 1 else 0.0
+    return {
+        "mean": mean,
+        "std": std,
+        "ci_low": mean - half_width,
+        "ci_high": mean + half_width,
+    }
+
+
+def run_replications(db_path: str, replications: int, days: int, base_seed: int = 0, workers: int = None) -> dict:
+    """
+    Run `replications` seeded copies of a `days`-day simulation across a
+    process pool and aggregate each KPI into a mean and 95% confidence interval.
+    """
+    seeds = [base_seed + i for i in range(replications)]
+    workers = min(replications, workers or os.cpu_count() or 1)
+    # Forking the threaded server would copy locks held by other threads into the workers
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        results = list(pool.map(run_replication, [db_path] * replications, [days] * replications, seeds))
+
+    return {
+        "replications": replications,
+        "days": days,
+        "kpis": {kpi: summarize([r[kpi] for r in results]) for kpi in KPIS},
+        "runs": results,
+    }
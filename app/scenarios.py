@@ -0,0 +1,236 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from sqlalchemy.orm import sessionmaker
+from bom import invalidate_bom_graph
+from database import DB_PATH, SessionLocal, create_db_engine, engine as default_engine
+from db_init import create_schema, seed_database
+from demand import demand_model_from_config
+from replenishment import replenishment_policy_from_config
+from memory_engine import InMemorySimulationEngine
+from simulator import SimulationEngine
+from sql_engine import SetBasedSimulationEngine
+
+DEFAULT_SCENARIO = "default"
+SCENARIO_DIR = "data/scenarios"
+SCENARIO_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# "db" steps each day against the database, "sql" does the same with set-based
+# statements per phase, "memory" steps days in memory and writes changed rows
+# back every SIM_CHECKPOINT_DAYS days
+ENGINE_MODE = os.getenv("SIM_ENGINE_MODE", "db")
+CHECKPOINT_DAYS = int(os.getenv("SIM_CHECKPOINT_DAYS", "30"))
+MAX_LIVE_SCENARIOS = int(os.getenv("SIM_MAX_LIVE_SCENARIOS", "8"))
+# Demand model as JSON, e.g. {"type": "poisson", "orders_rate": 2}; uniform by default
+DEMAND_MODEL = json.loads(os.getenv("SIM_DEMAND_MODEL", '{"type": "uniform"}'))
+DEMAND_HORIZON = int(os.getenv("SIM_DEMAND_HORIZON", "30"))
+REPLENISHMENT = json.loads(os.getenv("SIM_REPLENISHMENT", '{"type": "reorder_point"}'))
+
+
+def build_engine(session, seed: int = None, verbose: bool = True) -> SimulationEngine:
+    """Engine of the configured mode, demand model and replenishment policy (SIM_* settings) on `session`"""
+    options = {
+        "seed": seed, "verbose": verbose,
+        "demand": demand_model_from_config(DEMAND_MODEL), "demand_horizon": DEMAND_HORIZON,
+        "replenishment": replenishment_policy_from_config(REPLENISHMENT),
+    }
+    if ENGINE_MODE == "memory":
+        return InMemorySimulationEngine(session, checkpoint_days=CHECKPOINT_DAYS, **options)
+    if ENGINE_MODE == "sql":
+        return SetBasedSimulationEngine(session, **options)
+    return SimulationEngine(session, **options)
+
+
+def copy_database(source_path: str, target_path: str):
+    """Consistent copy of a live SQLite database through the online backup API"""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+
+class Scenario:
+    """An isolated simulation: its own database file, session factory and engine"""
+
+    def __init__(self, scenario_id: str, db_path: str, db_engine, session_factory, lock: threading.RLock):
+        self.id = scenario_id
+        self.db_path = db_path
+        self.db_engine = db_engine
+        self.session_factory = session_factory
+        self.lock = lock  # serializes simulation runs and other writers
+        self.users = 0  # jobs using the scenario; it is not evicted while they run
+        self._simulation = None
+
+    def get_engine(self) -> SimulationEngine:
+        """
+        The engine outlives any request, so it owns a long-lived session
+        instead of borrowing the (per-request, closed afterwards) one.
+        """
+        if self._simulation is None:
+            self._simulation = build_engine(self.session_factory())
+        return self._simulation
+
+    def invalidate_engine(self):
+        """Tell the live engine that its tables were written outside it, under `lock`"""
+        if self._simulation is not None:
+            self._simulation.invalidate()
+
+    def reset_engine(self):
+        """Drop the live engine so the next get_engine() reloads it from the database"""
+        invalidate_bom_graph(self.db_engine)
+        if self._simulation is not None:
+            self._simulation.db.close()
+            self._simulation = None
+
+    def close(self):
+        self.reset_engine()
+        if self.id != DEFAULT_SCENARIO:
+            self.db_engine.dispose()
+
+
+class ScenarioRegistry:
+    """
+    Scenarios live as database files under `base_dir`. At most `max_live`
+    of them are kept open; the least recently used idle one is closed when
+    the limit is exceeded and reopened on the next request. Background jobs
+    hold their scenario through use(), which keeps it from being closed.
+    """
+
+    def __init__(self, base_dir: str = SCENARIO_DIR, max_live: int = MAX_LIVE_SCENARIOS):
+        self.base_dir = base_dir
+        self.max_live = max(1, max_live)
+        self._live: OrderedDict[str, Scenario] = OrderedDict()
+        self._locks: dict[str, threading.RLock] = {}
+        self._mutex = threading.Lock()
+
+    def path_for(self, scenario_id: str) -> str:
+        if scenario_id == DEFAULT_SCENARIO:
+            return DB_PATH
+        if not SCENARIO_ID.match(scenario_id):
+            raise ValueError(f"Identificador de escenario no válido: {scenario_id}")
+        return os.path.join(self.base_dir, f"{scenario_id}.db")
+
+    def exists(self, scenario_id: str) -> bool:
+        return os.path.exists(self.path_for(scenario_id))
+
+    def list(self) -> list[str]:
+        scenarios = [DEFAULT_SCENARIO]
+        if os.path.isdir(self.base_dir):
+            scenarios += sorted(name[:-3] for name in os.listdir(self.base_dir) if name.endswith(".db"))
+        return scenarios
+
+    def lock(self, scenario_id: str) -> threading.RLock:
+        # Locks are never evicted, so a reopened scenario keeps its lock
+        with self._mutex:
+            return self._locks.setdefault(scenario_id, threading.RLock())
+
+    def get(self, scenario_id: str, pin: bool = False) -> Scenario:
+        """The open scenario; with `pin`, it stays open until release() is called"""
+        with self._mutex:
+            scenario = self._live.get(scenario_id)
+            if scenario is not None:
+                self._live.move_to_end(scenario_id)
+                scenario.users += pin
+                return scenario
+
+        if not self.exists(scenario_id):
+            raise KeyError(scenario_id)
+        return self._open(scenario_id, pin)
+
+    def release(self, scenario: Scenario):
+        with self._mutex:
+            scenario.users -= 1
+            self._evict()
+
+    @contextmanager
+    def use(self, scenario_id: str):
+        """The scenario, kept open for the whole block"""
+        scenario = self.get(scenario_id, pin=True)
+        try:
+            yield scenario
+        finally:
+            self.release(scenario)
+
+    def create(self, scenario_id: str, seed: bool = True) -> Scenario:
+        path = self.path_for(scenario_id)
+        with self.lock(scenario_id):
+            if os.path.exists(path):
+                raise FileExistsError(scenario_id)
+            os.makedirs(self.base_dir, exist_ok=True)
+            scenario = self._open(scenario_id)
+            create_schema(scenario.db_engine)
+            if seed:
+                session = scenario.session_factory()
+                try:
+                    seed_database(session)
+                finally:
+                    session.close()
+            return scenario
+
+    def create_from_file(self, scenario_id: str, source_path: str) -> Scenario:
+        """Create a scenario whose database is a copy of `source_path`"""
+        path = self.path_for(scenario_id)
+        with self.lock(scenario_id):
+            if os.path.exists(path):
+                raise FileExistsError(scenario_id)
+            os.makedirs(self.base_dir, exist_ok=True)
+            copy_database(source_path, path)
+            return self._open(scenario_id)
+
+    def delete(self, scenario_id: str):
+        if scenario_id == DEFAULT_SCENARIO:
+            raise ValueError("El escenario por defecto no se puede eliminar")
+        path = self.path_for(scenario_id)
+        with self.lock(scenario_id):
+            with self._mutex:
+                scenario = self._live.pop(scenario_id, None)
+            if scenario is not None:
+                scenario.close()
+            if not os.path.exists(path):
+                raise KeyError(scenario_id)
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    def _open(self, scenario_id: str, pin: bool = False) -> Scenario:
+        with self._mutex:
+            scenario = self._live.get(scenario_id)
+            if scenario is None:
+                if scenario_id == DEFAULT_SCENARIO:
+                    scenario = Scenario(scenario_id, DB_PATH, default_engine, SessionLocal,
+                                        self._locks.setdefault(scenario_id, threading.RLock()))
+                else:
+                    path = self.path_for(scenario_id)
+                    db_engine = create_db_engine(path)
+                    scenario = Scenario(scenario_id, path, db_engine, sessionmaker(bind=db_engine),
+                                        self._locks.setdefault(scenario_id, threading.RLock()))
+                self._live[scenario_id] = scenario
+            self._live.move_to_end(scenario_id)
+            scenario.users += pin
+            self._evict()
+            return scenario
+
+    def _evict(self):
+        """Close least recently used scenarios that no job uses and that are not running anything"""
+        # The most recently used scenario is the one being returned, never evict it
+        for scenario_id in list(self._live)[:-1]:
+            if len(self._live) <= self.max_live:
+                return
+            scenario = self._live[scenario_id]
+            if scenario_id == DEFAULT_SCENARIO or scenario.users or not scenario.lock.acquire(blocking=False):
+                continue
+            try:
+                del self._live[scenario_id]
+                scenario.close()
+            finally:
+                scenario.lock.release()
+
+
+registry = ScenarioRegistry()
@@ -0,0 +1,51 @@
+import heapq
+from datetime import date, timedelta
+
+DEFAULT_CAPACITY_PER_DAY = 10
+
+
+def completion_day(day: date, finished: bool) -> date:
+    """Expected completion of an order given capacity on `day`: the next day if its last units were dispatched"""
+    return day + timedelta(days=1 if finished else 2)
+
+
+class ProductionScheduler:
+    """
+    Open production orders in a heap keyed by (due date, -priority, id).
+    Every day dispatch() fills the capacity from the top of the heap; the
+    order that does not fit whole is split and its remainder stays on top
+    for the next day. Orders are pushed once, so a day costs O(k log n)
+    for the k orders it touches instead of a sort of every open order.
+    """
+
+    def __init__(self):
+        self._heap: list[list] = []  # [due, -priority, order_id, remaining units]
+        self.last_id = 0  # highest order id pushed, to pick up newer orders incrementally
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, order_id: int, due: date | None, priority: int, remaining: int):
+        self.last_id = max(self.last_id, order_id)
+        if remaining > 0:
+            heapq.heappush(self._heap, [due or date.max, -(priority or 0), order_id, remaining])
+
+    def dispatch(self, capacity: int) -> tuple[list[tuple[int, int, bool]], int]:
+        """
+        Give today's capacity to the most urgent orders. Returns the units
+        given to each order as (order_id, units, finished) and the units used.
+        """
+        allocations, free = [], capacity
+        while free > 0 and self._heap:
+            entry = self._heap[0]
+            units = min(free, entry[3])
+            free -= units
+            entry[3] -= units  # the key is unchanged, so a split order keeps its place on top
+            finished = entry[3] == 0
+            if finished:
+                heapq.heappop(self._heap)
+            allocations.append((entry[2], units, finished))
+        return allocations, capacity - free
+
+    def remaining_units(self) -> int:
+        return sum(entry[3] for entry in self._heap)
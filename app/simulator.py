@@ -1,13 +1,44 @@
+import json
+import time
+from collections import Counter
+from contextlib import nullcontext
 from datetime import date, datetime, timedelta
+import numpy as np
 import simpy 
-import random
-from database import Inventory, DailyPlan, Product, ProductionOrder, PurchaseOrder, Event, BOM, Supplier, SimulationState
+from sqlalchemy import func, insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import Inventory, DailyPlan, Product, ProductionOrder, PurchaseOrder, BOM, Supplier, SimulationState, DailyKPI
+from demand import DemandGenerator, DemandModel, UniformDemand
+from events import EventSink
+from ledger import InventoryLedger
+from bom import bom_graph
+from metrics import DAY_SECONDS, DAYS, DAYS_PER_SECOND, EVENTS, PHASE_SECONDS, phase, timed
+from profiler import PROFILE_ALL, active_profile, profile
+from scheduler import DEFAULT_CAPACITY_PER_DAY, ProductionScheduler, completion_day
+from replenishment import (
+    DEFAULT_MAX_CAPACITY, MaterialPosition, NoReplenishment, ReorderPointPolicy, ReplenishmentPolicy, SupplierIndex,
+    draw_lead_times, plan_requirements, requirements_matrix,
+)
 from sqlalchemy.orm import Session 
 
+# Daily KPI counters derived from the typed fields of each event
+KPI_COUNTERS = {
+    "production_completed": ("units_produced", "quantity"),
+    "order_fulfilled": ("orders_fulfilled", None),
+    "purchase_arrival": ("units_received", "quantity"),
+}
+
+
 class SimulationEngine:
-    def __init__(self, db: Session): 
-        self.env = simpy.Environment() 
+    mode = "db"  # engine label of the metrics
+
+    def __init__(self, db: Session, seed: int = None, verbose: bool = True,
+                 demand: DemandModel = None, demand_horizon: int = 30,
+                 replenishment: ReplenishmentPolicy = None, capacity_per_day: int = None): 
         self.db = db 
+        self.events = EventSink(db)
+        self.ledger = InventoryLedger(db)
+        self.verbose = verbose
         
         # Load current day from database
         state = self.db.query(SimulationState).first()
@@ -19,223 +50,469 @@ class SimulationEngine:
             self.db.add(state)
             self.db.commit()
             self.current_day = datetime.now().date()
+        self.reset_clock()
         
-        self.capacity_per_day = 10
+        # Production capacity: explicit, else the one imported from plan.json
+        self.default_capacity = capacity_per_day
+        self.capacity_per_day = capacity_per_day or state.capacity_per_day or DEFAULT_CAPACITY_PER_DAY
+        self.scheduler: ProductionScheduler | None = None  # open orders by urgency, built on first use
         self.min_daily_orders = 1  # Minimum number of orders per day
         self.max_daily_orders = 2  # Maximum number of orders per day
         self.min_order_quantity = 1  # Minimum quantity per order
         self.max_order_quantity = 10  # Maximum quantity per order
+        self.day_events = Counter()  # Event counts of the day being simulated
+        self.day_kpi = Counter()  # KPI counters of the day being simulated
+        self.pending_kpis: list[dict] = []  # Closed days not yet written to daily_kpi
+        self.supplier_costs: dict[int, float] = {}
+
+        # Demand is drawn a whole horizon at a time, seeded per engine
+        demand = demand or UniformDemand(
+            self.min_daily_orders, self.max_daily_orders, self.min_order_quantity, self.max_order_quantity
+        )
+        self.demand = DemandGenerator(demand, seed=seed, horizon_days=demand_horizon)
+        self.planned_until = None  # First day without a generated plan
+
+        self.replenishment = replenishment or ReorderPointPolicy()
+        self.supplier_index: SupplierIndex | None = None  # ranked suppliers per product, built on first use
+        self._requirements = None  # (graph, graph version, index, model rows, BOM matrix)
+        # Supplier lead times have their own stream so they do not shift the demand draws
+        self.lead_time_rng = np.random.default_rng(None if seed is None else [seed, 1])
+
+    def snapshot_state(self) -> dict:
+        """In-memory state that is not stored in the database (RNG and plan horizon)"""
+        return {
+            "demand_rng": self.demand.rng.bit_generator.state,
+            "lead_time_rng": self.lead_time_rng.bit_generator.state,
+            "planned_until": self.planned_until.isoformat() if self.planned_until else None,
+        }
+
+    def restore_state(self, state: dict):
+        self.demand.rng.bit_generator.state = state["demand_rng"]
+        if "lead_time_rng" in state:
+            self.lead_time_rng.bit_generator.state = state["lead_time_rng"]
+        self.planned_until = date.fromisoformat(state["planned_until"]) if state["planned_until"] else None
+
+    def invalidate(self):
+        """
+        Called after the engine's tables were written outside it (production
+        releases, API orders). This engine reads them every day, so it has
+        nothing to reload.
+        """
 
     def run_one_day(self):
-        print(f"🕒 Ejecutando día {self.current_day}...")
-        self.env.process(self.process_day(self.current_day))
-        self.env.run()
+        return self.run_days(1)[0]
+
+    def run_days(self, days: int, on_day=None):
+        """
+        Run `days` consecutive days inside a single SimPy run.
+        Returns a compact summary per simulated day.
+        `on_day(summary)` is called after each committed day; returning
+        False stops the run early.
+        """
+        summaries = []
+        start = time.perf_counter()
+        # Stop with the day loop: deliveries scheduled past the last day stay queued for the next run
+        self.env.run(until=self.env.process(self._run_days(days, summaries, on_day)))
+        if summaries:
+            DAYS_PER_SECOND.set(len(summaries) / max(time.perf_counter() - start, 1e-9), self.mode)
+        return summaries
+
+    def run_until(self, target_day: date, on_day=None):
+        """
+        Run the simulation until the current day reaches `target_day`.
+        The target day itself is not simulated.
+        """
+        days = (target_day - self.current_day).days
+        if days <= 0:
+            return []
+        return self.run_days(days, on_day)
+
+    def _run_days(self, days: int, summaries: list, on_day=None):
+        for _ in range(days):
+            if self.verbose:
+                print(f"🕒 Ejecutando día {self.current_day}...")
+            self.day_events = Counter()
+            self.day_kpi = Counter()
+            self.events.start_day()
+            start = time.perf_counter()
+            day = self.current_day
+            # With SIM_PROFILE=1 each day gets its own SQL profile, unless a profiled request runs it
+            profiled = PROFILE_ALL and active_profile.get() is None
+            try:
+                with profile(f"day {day}") if profiled else nullcontext():
+                    yield self.env.process(timed("process_day", self.process_day(day)))
+                    with phase("close_day"):
+                        summary = self._close_day()
+            except Exception:
+                self._abort_day(day)
+                raise
+            DAY_SECONDS.observe(time.perf_counter() - start, self.mode)
+            DAYS.inc(1, self.mode)
+            yield self.env.timeout(1)  # one unit of SimPy time per day
+            summaries.append(summary)
+            if on_day is not None and on_day(summary) is False:
+                break
+
+    def _close_day(self):
+        """Advance the current day and commit everything the day produced at once"""
+        simulated_day = self.current_day
         self.current_day = (self.current_day + timedelta(days=1))
-        
-        # Save current day to database
+
+        # Save current day and the day's events to database
         state = self.db.query(SimulationState).first()
         state.current_day = self.current_day
+        self.events.flush()
+        self.ledger.flush()
+        self.flush_kpis()
         self.db.commit()
 
+        return {
+            "day": simulated_day,
+            "events": sum(self.day_events.values()),
+            "event_types": dict(self.day_events),
+            "utilization": round(self.day_kpi["units_scheduled"] / self.capacity_per_day, 4),
+        }
+
+    def _abort_day(self, day: date):
+        """Roll back a day that failed while simulated or committed, so the next run simulates it again"""
+        self.events.clear()
+        self.ledger.clear()
+        self.pending_kpis.clear()
+        self.db.rollback()
+        self.current_day = day
+        self.planned_until = None
+        self.scheduler = None  # its dispatches were rolled back
+        self.reset_clock()  # and so were its arrivals; pending orders are scheduled again
+
     def process_day(self, day: datetime):
         yield self.env.timeout(0)
-        formatted_day = day.strftime("%d/%m/%Y")
-        self.log_event("start_day", day, f"Inicio del día {formatted_day}")
+        self.log_event("start_day", day)
 
         # First handle arrivals from previous day's production and purchases
-        yield self.env.process(self.handle_arrivals(day))
+        yield self.env.process(timed("handle_arrivals", self.handle_arrivals(day)))
         
         # Check if we need to generate a new plan
-        yield self.env.process(self.check_and_generate_plan(day))
+        yield self.env.process(timed("check_and_generate_plan", self.check_and_generate_plan(day)))
         
         # Then execute production orders for today
-        yield self.env.process(self.execute_production(day))
+        yield self.env.process(timed("execute_production", self.execute_production(day)))
+
+        # Order the materials the replenishment policy asks for
+        yield self.env.process(timed("replenish", self.replenish(day)))
+
+        self.log_event("end_day", day)
+        with phase("record_kpis"):
+            stock = self.stock_levels()
+            self.record_kpis(day, stock)
+            self.ledger.close_day(day, stock)
+
+    # --- KPIs diarios ---
+
+    def record_kpis(self, day: date, stock: dict[int, int]):
+        """Close the KPI row of the day from the counters kept while it ran"""
+        backlog_orders, backlog_units = self.backlog(day)
+        self.pending_kpis.append({
+            "day": day,
+            "units_produced": self.day_kpi["units_produced"],
+            "orders_fulfilled": self.day_kpi["orders_fulfilled"],
+            "units_received": self.day_kpi["units_received"],
+            "purchase_spend": round(self.day_kpi["purchase_spend"], 2),
+            "backlog_orders": backlog_orders,
+            "backlog_units": backlog_units,
+            "stock_total": sum(stock.values()),
+            "stock_levels": json.dumps(stock),
+            "units_scheduled": self.day_kpi["units_scheduled"],
+            "capacity": self.capacity_per_day,
+        })
+
+    def flush_kpis(self):
+        """Write the closed days in the current transaction (the caller commits)"""
+        if not self.pending_kpis:
+            return
+        statement = sqlite_insert(DailyKPI)
+        columns = [c.name for c in DailyKPI.__table__.columns if c.name != "day"]
+        self.db.execute(
+            statement.on_conflict_do_update(
+                index_elements=["day"], set_={c: statement.excluded[c] for c in columns}
+            ),
+            self.pending_kpis,
+        )
+        self.pending_kpis.clear()
+
+    def backlog(self, day: date) -> tuple[int, int]:
+        """Pending plan lines due on or before `day` and their units"""
+        return self.db.query(func.count(DailyPlan.id), func.coalesce(func.sum(DailyPlan.quantity), 0)).filter(
+            DailyPlan.status == "pending", DailyPlan.day <= day
+        ).one()
+
+    def stock_levels(self) -> dict[int, int]:
+        return {product_id: quantity or 0 for product_id, quantity in self.db.query(Inventory.product_id, Inventory.quantity)}
+
+    def unit_cost(self, supplier_id: int) -> float:
+        if supplier_id is not None and supplier_id not in self.supplier_costs:
+            self.supplier_costs = dict(self.db.query(Supplier.id, Supplier.unit_cost))
+        return self.supplier_costs.get(supplier_id, 0.0)
+
+    # --- Reaprovisionamiento ---
+
+    def replenish(self, day: date):
+        """Issue today's purchase orders for every product at once, from the policy's order quantities"""
+        yield self.env.timeout(0)
+        if isinstance(self.replenishment, NoReplenishment):
+            return
+        index = self.get_supplier_index()
+        if not len(index):
+            return
+        quantities = self.replenishment.order_quantities(self.material_position(index, day))
+        orders = index.allocate(quantities)
+        if orders:
+            lead_times = draw_lead_times([option for option, _, _ in orders], self.lead_time_rng)
+            self.issue_purchases(day, [
+                (option.supplier_id, product_id, quantity, day + timedelta(days=int(lead_time)))
+                for (option, product_id, quantity), lead_time in zip(orders, lead_times)
+            ])
+
+    def get_supplier_index(self) -> SupplierIndex:
+        if self.supplier_index is None:
+            self.supplier_index = SupplierIndex.load(self.db, self.replenishment.lead_time_cost)
+        return self.supplier_index
+
+    def material_position(self, index: SupplierIndex, day: date) -> MaterialPosition:
+        stock, capacity = {}, {}
+        for product_id, quantity, max_capacity in self.db.query(
+            Inventory.product_id, Inventory.quantity, Inventory.max_capacity
+        ):
+            stock[product_id] = quantity or 0
+            capacity[product_id] = max_capacity or DEFAULT_MAX_CAPACITY
+        on_order = dict(self.db.query(PurchaseOrder.product_id, func.sum(PurchaseOrder.quantity)).filter(
+            PurchaseOrder.status == "pending"
+        ).group_by(PurchaseOrder.product_id))
+        position = MaterialPosition(
+            index.scatter(stock), index.scatter(on_order), index.scatter(capacity, DEFAULT_MAX_CAPACITY)
+        )
+        if self.replenishment.cover_days is not None:
+            # Pending plan lines due within the longest window, overdue ones included
+            windows = index.lead_times + self.replenishment.cover_days
+            until = day + timedelta(days=int(windows.max()))
+            demand = {
+                ((plan_day - day).days, model): quantity
+                for plan_day, model, quantity in self.db.query(
+                    DailyPlan.day, DailyPlan.model, func.sum(DailyPlan.quantity)
+                ).filter(DailyPlan.status == "pending", DailyPlan.day <= until).group_by(DailyPlan.day, DailyPlan.model)
+            }
+            position.requirements = self.material_requirements(index, demand, windows)
+        return position
+
+    def material_requirements(self, index: SupplierIndex, demand: dict[tuple[int, str], int],
+                              windows: np.ndarray) -> np.ndarray:
+        """Units of every indexed product needed by `demand`, through the cached BOM explosion matrix"""
+        graph = bom_graph(self.db)
+        cached = self._requirements
+        if cached is None or cached[0] is not graph or cached[1] != graph.version or cached[2] is not index:
+            rows, matrix = requirements_matrix(graph.explode_all(), self.product_name_map(), index)
+            cached = self._requirements = (graph, graph.version, index, rows, matrix)
+        return plan_requirements(demand, cached[3], cached[4], windows)
+
+    def product_name_map(self) -> dict[int, str]:
+        return dict(self.db.query(Product.id, Product.name))
 
-        self.log_event("end_day", day, f"Fin del día {formatted_day}")
+    def issue_purchases(self, day: date, orders: list[tuple[int, int, int, date]]):
+        """Insert the day's purchase orders, (supplier_id, product_id, quantity, delivery), in one statement"""
+        self.db.execute(insert(PurchaseOrder), [
+            {"supplier_id": supplier_id, "product_id": product_id, "quantity": quantity,
+             "issue_date": day, "expected_delivery_date": delivery, "status": "pending"}
+            for supplier_id, product_id, quantity, delivery in orders
+        ])
+        for _, product_id, quantity, delivery in orders:
+            self.log_event("purchase_ordered", day, product_id=product_id, quantity=quantity, target_day=delivery)
+        self.sync_purchases()
+
+    # --- Llegadas de compras ---
+
+    def reset_clock(self):
+        """New SimPy environment whose time 0 is the current day, with no delivery scheduled on it"""
+        self.env = simpy.Environment()
+        self.epoch = self.current_day
+        self.due_purchases: list[int] = []  # purchase orders whose delivery fired, in firing order
+        self.purchase_watermark = 0  # highest purchase order id scheduled
+
+    def schedule_delivery(self, order_id: int, delivery: date | None):
+        """Fire the arrival of a purchase order as a SimPy timeout on the day it is due"""
+        delay = (delivery - self.epoch).days - self.env.now if delivery else 0
+        if delay <= 0:
+            self.due_purchases.append(order_id)
+        else:
+            self.env.timeout(delay, value=order_id).callbacks.append(self._purchase_due)
+
+    def _purchase_due(self, event):
+        self.due_purchases.append(event.value)
+
+    def sync_purchases(self):
+        """Schedule the pending purchase orders created since the last call (API, imports, replenishment)"""
+        for order_id, delivery in self.db.query(PurchaseOrder.id, PurchaseOrder.expected_delivery_date).filter(
+            PurchaseOrder.id > self.purchase_watermark, PurchaseOrder.status == "pending"
+        ).order_by(PurchaseOrder.id):
+            self.schedule_delivery(order_id, delivery)
+            self.purchase_watermark = order_id
 
     def check_and_generate_plan(self, day: datetime):
-        """Check if we need to generate a new plan for the next day"""
+        """
+        Make sure there is a plan for the next day. Plans are generated a
+        whole demand horizon at a time, in one draw and one bulk insert.
+        """
         yield self.env.timeout(0)
         
         tomorrow : date = (day + timedelta(days=1))
-        # Check if we have a plan for tomorrow
-        tomorrow_plan = self.db.query(DailyPlan).filter(
-            DailyPlan.day == tomorrow
-        ).first()
-        if tomorrow_plan:
+        if self.planned_until is not None and tomorrow < self.planned_until:
             return
+        horizon_end = tomorrow + timedelta(days=self.demand.horizon_days)
+
+        # Days of the horizon that already have a plan are left untouched
+        planned_days = {d for (d,) in self.db.query(DailyPlan.day).filter(
+            DailyPlan.day >= tomorrow, DailyPlan.day < horizon_end
+        ).distinct()}
             
         # Get all finished products
-        finished_products = self.db.query(Product).filter_by(type="finished").all()
+        finished_products = [name for (name,) in self.db.query(Product.name).filter_by(type="finished")]
         if not finished_products:
             self.log_event("error", day, "No hay productos finales disponibles para generar plan")
             return
             
-        # Generate random number of orders for tomorrow
-        num_orders = random.randint(self.min_daily_orders, self.max_daily_orders)
-        
-        # Generate random orders
-        for _ in range(num_orders):
-            # Select random product
-            product = random.choice(finished_products)
-            
-            # Generate random quantity
-            quantity = random.randint(self.min_order_quantity, self.max_order_quantity)
-            
-            # Create daily plan entry
-            plan = DailyPlan(
-                day=tomorrow,
-                model=product.name,
-                quantity=quantity,
-                status="pending"
-            )
-            self.db.add(plan)
-            
-        self.db.commit()
-        self.log_event(
-            "plan_generated",
-            day,
-            f"Plan generado para el día {day + timedelta(days=1)} con {num_orders} órdenes"
-        )
+        orders = self.demand.draw(tomorrow, finished_products, skip_days=planned_days)
+        if orders:
+            self.db.execute(insert(DailyPlan), [
+                {"day": plan_day, "model": model, "quantity": quantity, "status": "pending"}
+                for plan_day, model, quantity in orders
+            ])
+        self.planned_until = horizon_end
+        self._log_plans_generated(day, orders)
+
+    def _log_plans_generated(self, day: date, orders: list):
+        orders_per_day = Counter(plan_day for plan_day, _, _ in orders)
+        for plan_day in sorted(orders_per_day):
+            self.log_event("plan_generated", day, target_day=plan_day, quantity=orders_per_day[plan_day])
 
 
     def handle_arrivals(self, day: datetime):
-        """Process deliveries from previous day's purchases"""
+        """
+        Receive the purchase orders whose delivery timeout fired, in order.
+        Once a delivery does not fit in its inventory, it and the later
+        deliveries of the same product are rescheduled for the next day.
+        """
         yield self.env.timeout(0)
-        
-        # Handle purchase order arrivals
-        deliveries = self.db.query(PurchaseOrder).filter(
-            PurchaseOrder.expected_delivery_date == day,
-            PurchaseOrder.status == "pending"
-        ).all()
+        self.sync_purchases()
+        due, self.due_purchases = self.due_purchases, []
+        if not due:
+            return
+
+        orders = {order.id: order for order in self.db.query(PurchaseOrder).filter(PurchaseOrder.id.in_(due))}
+        stock = {item.product_id: item for item in self.db.query(Inventory).filter(
+            Inventory.product_id.in_({order.product_id for order in orders.values()})
+        )}
+        next_day = day + timedelta(days=1)
+        full = set()  # products whose inventory refused a delivery today
+        for order_id in sorted(due):
+            order = orders.get(order_id)
+            if order is None or order.status != "pending":
+                continue  # delivered or removed outside the simulation
+            if order.expected_delivery_date is not None and order.expected_delivery_date > day:
+                self.schedule_delivery(order.id, order.expected_delivery_date)  # postponed through the API
+                continue
+
+            inventory = stock.get(order.product_id)
+            current = inventory.quantity if inventory else 0
+            max_capacity = (inventory.max_capacity if inventory else None) or DEFAULT_MAX_CAPACITY
+            if order.product_id in full or current + order.quantity > max_capacity:
+                # Reschedule the order for the next day
+                full.add(order.product_id)
+                order.expected_delivery_date = next_day
+                self.schedule_delivery(order.id, next_day)
+                self.log_event("purchase_rescheduled", day, order_id=order.id, target_day=next_day)
+                continue
 
-        for order in deliveries:
-            inventory = self.db.query(Inventory).filter_by(product_id=order.product_id).first()
-            
-            # Check if adding the order quantity would exceed max capacity
             if inventory:
-                if inventory.quantity + order.quantity > inventory.max_capacity:
-                    # Reschedule the order for the next day
-                    order.expected_delivery_date = day + timedelta(days=1)
-                    self.log_event(
-                        "purchase_rescheduled",
-                        day,
-                        f"Pedido de compra #{order.id} reprogramado para el día {day + timedelta(days=1)} - Capacidad máxima alcanzada"
-                    )
-                else:
-                    inventory.quantity += order.quantity
-                    order.status = "delivered"
-                    self.log_event(
-                        "purchase_arrival",
-                        day,
-                        f"Llegada de {order.quantity} unidades de {inventory.product.name} (OC #{order.id})"
-                    )
+                inventory.quantity += order.quantity
             else:
-                # For new inventory items, check if initial quantity exceeds max capacity
-                if order.quantity > 1000:  # Default max capacity
-                    # Reschedule the order for the next day
-                    order.expected_delivery_date = day + timedelta(days=1)
-                    self.log_event(
-                        "purchase_rescheduled",
-                        day,
-                        f"Pedido de compra #{order.id} reprogramado para el día {day + timedelta(days=1)} - Capacidad máxima alcanzada"
-                    )
-                else:
-                    self.db.add(Inventory(product_id=order.product_id, quantity=order.quantity))
-                    order.status = "delivered"
-                    self.log_event(
-                        "purchase_arrival",
-                        day,
-                        f"Llegada de {order.quantity} unidades (OC #{order.id})"
-                    )
-            
-            self.db.commit()
-
+                stock[order.product_id] = Inventory(product_id=order.product_id, quantity=order.quantity)
+                self.db.add(stock[order.product_id])
+            order.status = "delivered"
+            self.day_kpi["purchase_spend"] += order.quantity * self.unit_cost(order.supplier_id)
+            self.ledger.record(order.product_id, day, order.quantity, "purchase_arrival", order.id)
+            self.log_event(
+                "purchase_arrival", day,
+                product_id=order.product_id, order_id=order.id, quantity=order.quantity
+            )
 
     def execute_production(self, day: datetime):
-        """Execute production orders for today and complete orders"""
+        """
+        Complete the orders whose last units were made yesterday, then fill
+        today's capacity from the scheduler, splitting the order that does not fit.
+        """
         yield self.env.timeout(0)
         
         # First, complete production orders in progress
         production_orders = self.db.query(ProductionOrder).filter(
-            ProductionOrder.status == "in_progress"
-        ).all()
+            ProductionOrder.status == "in_progress",
+            ProductionOrder.quantity_done >= ProductionOrder.quantity
+        ).order_by(ProductionOrder.id).all()
+        plan_ids = [order.daily_plan_id for order in production_orders if order.daily_plan_id is not None]
+        daily_plans = {plan.id: plan for plan in self.db.query(DailyPlan).filter(DailyPlan.id.in_(plan_ids))} \
+            if plan_ids else {}
 
         for order in production_orders:
-            product = self.db.query(Product).filter_by(id=order.product_id).first()
-            
             order.status = "completed"
-            # Find and update the corresponding daily plan using the direct relationship
-            daily_plan = self.db.query(DailyPlan).filter_by(id=order.daily_plan_id).first()
-            self.log_event(
-                "production_completed",
-                day,
-                f"Producción completada: {order.quantity} unidades de {product.name}"
-            )
+            daily_plan = daily_plans.get(order.daily_plan_id)
+            self.log_event("production_completed", day, product_id=order.product_id, quantity=order.quantity)
             
             if daily_plan:
                 daily_plan.status = "fulfilled"
                 self.log_event(
-                    "order_fulfilled",
-                    day,
-                    f"Pedido #{daily_plan.id} completado: {order.quantity} unidades de {product.name}"
+                    "order_fulfilled", day,
+                    product_id=order.product_id, order_id=daily_plan.id, quantity=order.quantity
                 )
 
-        # Then, start new production orders in pending
-        pending_orders = self.db.query(ProductionOrder).filter(
-            ProductionOrder.status == "pending",
-        ).all()
-
-        for order in pending_orders:
-            order.status = "in_progress"
-            self.log_event(
-                "production_started",
-                day,
-                f"Iniciada producción de {order.quantity} unidades del producto {order.product_id}"
-            )
+        # Then, give today's capacity to the most urgent open orders
+        allocations, used = self.get_scheduler().dispatch(self.capacity_per_day)
+        self.day_kpi["units_scheduled"] += used
+        if not allocations:
+            return
+        orders = {order.id: order for order in self.db.query(ProductionOrder).filter(
+            ProductionOrder.id.in_([order_id for order_id, _, _ in allocations])
+        )}
+        for order_id, units, finished in allocations:
+            order = orders[order_id]
+            if order.status == "pending":
+                order.status = "in_progress"
+                self.log_event("production_started", day, product_id=order.product_id, quantity=order.quantity)
+            order.quantity_done = (order.quantity_done or 0) + units
+            order.expected_completion_date = completion_day(day, finished)
 
-        self.db.commit()
+    def get_scheduler(self) -> ProductionScheduler:
+        """The scheduler with every open order, adding only the orders created since the last call"""
+        if self.scheduler is None:
+            self.scheduler = ProductionScheduler()
+        new_orders = self.db.query(
+            ProductionOrder.id, ProductionOrder.due_date, ProductionOrder.priority, ProductionOrder.quantity,
+            ProductionOrder.quantity_done
+        ).filter(
+            ProductionOrder.id > self.scheduler.last_id,
+            ProductionOrder.status.in_(["pending", "in_progress"])
+        )
+        for order_id, due_day, priority, quantity, done in new_orders:
+            self.scheduler.push(order_id, due_day, priority, quantity - (done or 0))
+        return self.scheduler
 
 
-    def log_event(self, type_: str, sim_date: datetime, detail: str):
-        try:
-            formatted_date = sim_date.strftime("%d/%m/%Y")
-            # Replace all product IDs with names in the detail
-            if "producto" in detail:
-                # Extract the product ID if it exists
-                if "ID" in detail:
-                    product_id = int(detail.split("ID ")[1].split()[0])
-                elif "día" in detail:
-                    detail = detail.replace(str(sim_date), formatted_date)
-                else:
-                    # Handle cases where ID is just a number
-                    words = detail.split()
-                    for i, word in enumerate(words):
-                        if word.isdigit() and i > 0 and words[i-1] == "producto":
-                            product_id = int(word)
-                            break
-                    else:
-                        product_id = None
-
-                if product_id:
-                    # Get the product name
-                    product = self.db.query(Product).filter_by(id=product_id).first()
-                    if product:
-                        # Replace the ID with the name
-                        if "ID" in detail:
-                            detail = detail.replace(f"ID {product_id}", product.name)
-                        else:
-                            detail = detail.replace(f"producto {product_id}", f"producto {product.name}")
-
-            event = Event(
-                type=type_,
-                sim_date=sim_date,
-                detail=detail
-            )
-            self.db.add(event)
-            self.db.commit()
-        except Exception as e:
-            print(f"⚠️ Error al guardar evento: {type_} | Día: {sim_date} | Detalle: {detail}")
-            print(f"Excepción original: {e}")
-            self.db.rollback()
-            raise
+    def log_event(self, type_: str, sim_date: date, detail: str = None, **fields):
+        """
+        Buffer an event with its typed fields (product_id, order_id, quantity,
+        target_day). The detail text is rendered from them when the event is read.
+        """
+        start = time.perf_counter()
+        self.events.emit(type_, sim_date, detail, **fields)
+        self.day_events[type_] += 1
+        if type_ in KPI_COUNTERS:
+            kpi, field = KPI_COUNTERS[type_]
+            self.day_kpi[kpi] += fields[field] if field else 1
+        EVENTS.inc(1, type_)
+        PHASE_SECONDS.observe(time.perf_counter() - start, "log_event")
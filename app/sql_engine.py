@@ -0,0 +1,140 @@
+from datetime import date, timedelta
+from sqlalchemy import case, func, insert, literal, select, update
+from database import DailyPlan, Inventory, InventoryMovement, ProductionOrder, PurchaseOrder
+from replenishment import DEFAULT_MAX_CAPACITY
+from scheduler import completion_day
+from simulator import SimulationEngine
+
+
+class SetBasedSimulationEngine(SimulationEngine):
+    """
+    Database engine whose day step applies the state transitions of each
+    phase with a few set-based statements (UPDATE ... FROM, INSERT ...
+    SELECT) instead of loading and changing the rows one by one. Only the
+    columns the events need come back to Python.
+    """
+    mode = "sql"
+
+    def handle_arrivals(self, day: date):
+        """
+        Receive the purchase orders whose delivery timeout fired. Deliveries
+        of a product are received in order until one does not fit in its
+        inventory; that one and the later ones are rescheduled for the next day.
+        """
+        yield self.env.timeout(0)
+        self.sync_purchases()
+        due, self.due_purchases = self.due_purchases, []
+        if not due:
+            return
+        db = self.db
+        pending = PurchaseOrder.id.in_(due) & (PurchaseOrder.status == "pending")
+
+        # Postponed through the API since they were scheduled
+        postponed = db.execute(select(PurchaseOrder.id, PurchaseOrder.expected_delivery_date).where(
+            pending, PurchaseOrder.expected_delivery_date > day
+        )).all()
+        for order_id, delivery in postponed:
+            self.schedule_delivery(order_id, delivery)
+
+        # A delivery fits if the units due for its product up to it fit in the free capacity
+        running = func.sum(PurchaseOrder.quantity).over(partition_by=PurchaseOrder.product_id, order_by=PurchaseOrder.id)
+        free = func.coalesce(Inventory.max_capacity, DEFAULT_MAX_CAPACITY) - func.coalesce(Inventory.quantity, 0)
+        deliveries = db.execute(
+            select(PurchaseOrder.id, PurchaseOrder.product_id, PurchaseOrder.quantity, PurchaseOrder.supplier_id,
+                   running <= free)
+            .outerjoin(Inventory, Inventory.product_id == PurchaseOrder.product_id)
+            .where(pending, func.coalesce(PurchaseOrder.expected_delivery_date, day) <= day)
+            .order_by(PurchaseOrder.id)
+        ).all()
+        accepted = [order_id for order_id, _, _, _, fits in deliveries if fits]
+        rejected = [order_id for order_id, _, _, _, fits in deliveries if not fits]
+
+        if accepted:
+            received = select(PurchaseOrder.product_id, func.sum(PurchaseOrder.quantity).label("quantity")).where(
+                PurchaseOrder.id.in_(accepted)
+            ).group_by(PurchaseOrder.product_id).subquery()
+            db.execute(
+                update(Inventory).where(Inventory.product_id == received.c.product_id)
+                .values(quantity=func.coalesce(Inventory.quantity, 0) + received.c.quantity)
+                .execution_options(synchronize_session=False)
+            )
+            db.execute(insert(Inventory).from_select(
+                ["product_id", "quantity", "max_capacity"],
+                select(received.c.product_id, received.c.quantity, literal(DEFAULT_MAX_CAPACITY))
+                .where(received.c.product_id.not_in(select(Inventory.product_id)))
+            ))
+            db.execute(
+                update(PurchaseOrder).where(PurchaseOrder.id.in_(accepted)).values(status="delivered")
+                .execution_options(synchronize_session=False)
+            )
+            db.execute(insert(InventoryMovement).from_select(
+                ["product_id", "day", "delta", "cause", "reference_id"],
+                select(PurchaseOrder.product_id, literal(day), PurchaseOrder.quantity, literal("purchase_arrival"),
+                       PurchaseOrder.id).where(PurchaseOrder.id.in_(accepted)).order_by(PurchaseOrder.id)
+            ))
+
+        next_day = day + timedelta(days=1)
+        if rejected:
+            db.execute(
+                update(PurchaseOrder).where(PurchaseOrder.id.in_(rejected)).values(expected_delivery_date=next_day)
+                .execution_options(synchronize_session=False)
+            )
+
+        for order_id, product_id, quantity, supplier_id, fits in deliveries:
+            if fits:
+                self.day_kpi["purchase_spend"] += quantity * self.unit_cost(supplier_id)
+                self.log_event("purchase_arrival", day, product_id=product_id, order_id=order_id, quantity=quantity)
+            else:
+                self.schedule_delivery(order_id, next_day)
+                self.log_event("purchase_rescheduled", day, order_id=order_id, target_day=next_day)
+
+    def execute_production(self, day: date):
+        """
+        Complete the orders whose last units were made yesterday and fulfil
+        their plan lines, then fill today's capacity from the scheduler, with
+        one statement per transition.
+        """
+        yield self.env.timeout(0)
+        db = self.db
+
+        finished = (ProductionOrder.status == "in_progress") & (ProductionOrder.quantity_done >= ProductionOrder.quantity)
+        completed = db.execute(
+            select(ProductionOrder.product_id, ProductionOrder.quantity, DailyPlan.id)
+            .outerjoin(DailyPlan, DailyPlan.id == ProductionOrder.daily_plan_id)
+            .where(finished).order_by(ProductionOrder.id)
+        ).all()
+        if completed:
+            db.execute(
+                update(DailyPlan).where(DailyPlan.id == ProductionOrder.daily_plan_id, finished)
+                .values(status="fulfilled").execution_options(synchronize_session=False)
+            )
+            db.execute(update(ProductionOrder).where(finished).values(status="completed")
+                       .execution_options(synchronize_session=False))
+        for product_id, quantity, plan_id in completed:
+            self.log_event("production_completed", day, product_id=product_id, quantity=quantity)
+            if plan_id is not None:
+                self.log_event("order_fulfilled", day, product_id=product_id, order_id=plan_id, quantity=quantity)
+
+        # Then, give today's capacity to the most urgent open orders
+        allocations, used = self.get_scheduler().dispatch(self.capacity_per_day)
+        self.day_kpi["units_scheduled"] += used
+        if not allocations:
+            return
+        units = {order_id: units for order_id, units, _ in allocations}
+        completion = {order_id: completion_day(day, finished) for order_id, _, finished in allocations}
+        started = {order_id: (product_id, quantity) for order_id, product_id, quantity in db.execute(
+            select(ProductionOrder.id, ProductionOrder.product_id, ProductionOrder.quantity).where(
+                ProductionOrder.id.in_(units), ProductionOrder.status == "pending"
+            )
+        )}
+        db.execute(
+            update(ProductionOrder).where(ProductionOrder.id.in_(units)).values(
+                quantity_done=func.coalesce(ProductionOrder.quantity_done, 0) + case(units, value=ProductionOrder.id),
+                status=case((ProductionOrder.status == "pending", "in_progress"), else_=ProductionOrder.status),
+                expected_completion_date=case(completion, value=ProductionOrder.id),
+            ).execution_options(synchronize_session=False)
+        )
+        for order_id, _, _ in allocations:
+            if order_id in started:
+                product_id, quantity = started[order_id]
+                self.log_event("production_started", day, product_id=product_id, quantity=quantity)
@@ -0,0 +1,80 @@
+import os
+import sys
+import pytest
+
+# The app modules import each other by name, as when uvicorn runs from app/
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+
+TEST_SCENARIO = "pytest"
+
+
+def seed_scenario(path: str):
+    """Create a scenario database at `path` seeded from data/*.json; returns its engine"""
+    from sqlalchemy.orm import sessionmaker
+    from database import create_db_engine
+    from db_init import create_schema, seed_database
+
+    db_engine = create_db_engine(path)
+    create_schema(db_engine)
+    session = sessionmaker(bind=db_engine)()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(os.path.dirname(APP_DIR))  # seed_database reads data/*.json
+        try:
+            seed_database(session)
+        finally:
+            session.close()
+    return db_engine
+
+
+@pytest.fixture
+def db_session(tmp_path):
+    """Session on a freshly seeded scenario database of its own"""
+    from sqlalchemy.orm import sessionmaker
+
+    db_engine = seed_scenario(str(tmp_path / "simulator.db"))
+    session = sessionmaker(bind=db_engine)()
+    yield session
+    session.close()
+    db_engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def client(tmp_path_factory):
+    """
+    API client; routes are called with ?scenario=pytest, a freshly seeded
+    scenario in a scratch directory, so data/ is never touched.
+    """
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    import endpoints
+    from scenarios import registry
+
+    base_dir = tmp_path_factory.mktemp("scenarios")
+    seed_scenario(str(base_dir / f"{TEST_SCENARIO}.db")).dispose()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(registry, "base_dir", str(base_dir))
+        app = FastAPI()
+        app.include_router(endpoints.router)
+        with TestClient(app) as test_client:
+            yield test_client
+        registry.delete(TEST_SCENARIO)
+
+
+@pytest.fixture
+def max_queries(client):
+    """
+    `max_queries("GET", "/app/kpi", 1)` calls the route on the test scenario
+    with X-Profile and fails if it issues more than 1 SQL statement.
+    """
+    from profiler import check_max_queries, get_profile
+
+    def check(method: str, path: str, max_count: int, **kwargs):
+        separator = "&" if "?" in path else "?"
+        response = client.request(method, f"{path}{separator}scenario={TEST_SCENARIO}",
+                                  headers={"X-Profile": "1"}, **kwargs)
+        assert response.status_code < 400, response.text
+        check_max_queries(get_profile(response.headers["X-Profile-Id"]), max_count)
+        return response
+    return check
@@ -0,0 +1,55 @@
+"""
+A day that fails, while simulated or while committed, is rolled back and
+simulated again by the next run as if the failure never happened.
+"""
+from datetime import timedelta
+import pytest
+from database import Event, ProductionOrder, SimulationState
+from memory_engine import InMemorySimulationEngine
+from simulator import SimulationEngine
+from sql_engine import SetBasedSimulationEngine
+
+
+def _fail_once(engine, phase: str):
+    def failing(day):
+        del engine.__dict__[phase]  # the retry runs the real phase
+        raise RuntimeError(f"{phase} falló")
+        yield
+    setattr(engine, phase, failing)
+
+
+def test_failed_day_keeps_open_orders_schedulable(db_session):
+    state = db_session.query(SimulationState).first()
+    order = ProductionOrder(product_id=1, quantity=3, status="pending", creation_date=state.current_day,
+                            expected_completion_date=state.current_day + timedelta(days=1))
+    db_session.add(order)
+    db_session.commit()
+    engine = SimulationEngine(db_session, seed=1, verbose=False)
+    day = engine.current_day
+
+    # Production of the day is dispatched, then replenishment fails
+    _fail_once(engine, "replenish")
+    with pytest.raises(RuntimeError):
+        engine.run_days(1)
+    db_session.rollback()  # as the routes and jobs do after a failed run
+    assert engine.current_day == day
+
+    engine.run_days(1)
+    db_session.refresh(order)
+    assert order.quantity_done == order.quantity
+
+
+@pytest.mark.parametrize("engine_class", [SimulationEngine, SetBasedSimulationEngine, InMemorySimulationEngine])
+def test_failed_day_events_are_written_once(db_session, engine_class):
+    engine = engine_class(db_session, seed=1, verbose=False)
+    day = engine.current_day
+
+    # start_day is buffered before replenishment fails
+    _fail_once(engine, "replenish")
+    with pytest.raises(RuntimeError):
+        engine.run_days(1)
+    db_session.rollback()
+    assert not engine.events.pending and not engine.ledger.movements
+
+    engine.run_days(1)
+    assert db_session.query(Event).filter(Event.type == "start_day", Event.sim_date == day).count() == 1
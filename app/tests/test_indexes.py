@@ -0,0 +1,114 @@
+"""
+Every statement the simulator issues each day, and the filtered dashboard
+reads, must search an index on a database upgraded by the migrations, not
+scan a table. The statements are captured while the code runs, with the
+profiler attaching their EXPLAIN QUERY PLAN, so the checks follow the SQL
+the engines and routes really issue.
+"""
+import re
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from conftest import seed_scenario
+import endpoints
+import profiler
+from migrations import SCHEMA_VERSION, get_schema_version, migrate
+from production import release_production_batch
+from scenarios import registry
+from simulator import SimulationEngine
+from sql_engine import SetBasedSimulationEngine
+
+SCENARIO = "indexes"
+# Master tables read whole on purpose; the BOM graph is loaded once and cached
+WHOLE_TABLES = {"bom", "inventory", "product", "supplier", "simulation_state"}
+# Tables that grow with every simulated day; the captured statements must search each of them
+GROWING_TABLES = {"event", "daily_plan", "production_order", "purchase_order", "inventory_movement", "daily_kpi"}
+# Dashboard reads with the filters the frontend sends, on the days simulated below
+READS = [
+    "/app/events/page?start={day}&end={day}",
+    "/app/events/page?cursor={day}_1",
+    "/app/events/page?type=start_day&start={day}",
+    "/app/inventory/2/history?start={day}&end={end}",
+    "/app/inventory/?as_of={day}",
+    "/app/kpi?start={day}&end={end}",
+    "/app/mrp",
+]
+_TABLE_SCAN = re.compile(r"^SCAN (\w+)")
+_TABLE_SEARCH = re.compile(r"^SEARCH (\w+)")
+
+
+@pytest.fixture(scope="module")
+def migrated_engine(tmp_path_factory):
+    """A seeded database whose indexes were dropped, as in a deployment older than them, and upgraded by migrate()"""
+    base_dir = tmp_path_factory.mktemp("indexes")
+    db_engine = seed_scenario(str(base_dir / f"{SCENARIO}.db"))
+    with db_engine.begin() as conn:
+        indexes = [name for (name,) in conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND (name LIKE 'ix\\_%' ESCAPE '\\' "
+            "OR name LIKE 'ux\\_%' ESCAPE '\\')"
+        ))]
+        for name in indexes:
+            conn.execute(text(f"DROP INDEX {name}"))
+        conn.execute(text("PRAGMA user_version = 0"))
+    assert migrate(db_engine) == SCHEMA_VERSION
+    yield db_engine
+    db_engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def captured(migrated_engine):
+    """(label, statement, plan) of every distinct statement of the simulated days and the dashboard reads"""
+    profiles = []
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(profiler, "SLOW_QUERY_MS", 0)  # plan every statement
+        session = sessionmaker(bind=migrated_engine)()
+        try:
+            for engine_class in (SimulationEngine, SetBasedSimulationEngine):
+                engine = engine_class(session, seed=1, verbose=False)
+                first_day = engine.current_day
+                engine.run_days(3)
+                release_production_batch(session, end_day=engine.current_day)
+                with profiler.profile(f"{engine.mode} days") as current:
+                    engine.run_days(5)
+                profiles.append(current)
+        finally:
+            session.close()
+
+        mp.setattr(registry, "base_dir", str(migrated_engine.url.database).rsplit("/", 1)[0])
+        app = FastAPI()
+        app.include_router(endpoints.router)
+        with TestClient(app) as client:
+            for read in READS:
+                path = read.format(day=first_day, end=engine.current_day)
+                response = client.get(f"{path}{'&' if '?' in path else '?'}scenario={SCENARIO}",
+                                      headers={"X-Profile": "1"})
+                assert response.status_code == 200, response.text
+                profiles.append(profiler.get_profile(response.headers["X-Profile-Id"]))
+        registry.delete(SCENARIO)
+
+    statements = {}
+    for current in profiles:
+        for entry in current.statements:
+            if entry["plan"]:
+                statements.setdefault(profiler.statement_shape(entry["sql"]), (current.label, entry["plan"]))
+    return [(label, sql, plan) for sql, (label, plan) in statements.items()]
+
+
+def test_migrations_reach_the_current_version(migrated_engine):
+    assert get_schema_version(migrated_engine) == SCHEMA_VERSION
+
+
+def test_growing_tables_are_searched(captured):
+    searched = {match.group(1) for _, _, plan in captured for step in plan if (match := _TABLE_SEARCH.match(step))}
+    assert GROWING_TABLES <= searched, f"sin consultas capturadas sobre {sorted(GROWING_TABLES - searched)}"
+
+
+def test_no_growing_table_is_scanned(captured):
+    scans = [
+        f"{label}: {sql}\n    {plan}"
+        for label, sql, plan in captured
+        if any((match := _TABLE_SCAN.match(step)) and match.group(1) not in WHOLE_TABLES for step in plan)
+    ]
+    assert not scans, "recorrido completo de tabla:\n" + "\n".join(scans)
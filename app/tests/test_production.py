@@ -0,0 +1,57 @@
+"""
+Releases carry the requested priority and due date to their production
+orders, and a split order's expected completion follows its progress.
+"""
+from datetime import timedelta
+import pytest
+from database import DailyPlan, Inventory, ProductionOrder
+from memory_engine import InMemorySimulationEngine
+from production import release_production_batch
+from simulator import SimulationEngine
+from sql_engine import SetBasedSimulationEngine
+
+
+@pytest.mark.parametrize("engine_class", [SimulationEngine, SetBasedSimulationEngine, InMemorySimulationEngine])
+def test_split_order_expected_completion_follows_progress(db_session, engine_class):
+    for item in db_session.query(Inventory):
+        item.quantity = 1000
+    db_session.commit()
+    engine = engine_class(db_session, seed=1, verbose=False, capacity_per_day=4)
+    start = engine.current_day
+    plan = DailyPlan(day=start, model="P3D-Classic", quantity=10, status="pending")
+    db_session.add(plan)
+    db_session.commit()
+
+    result = release_production_batch(db_session, plan_ids=[plan.id], order_priority=3)
+    order = db_session.get(ProductionOrder, result["released"][0]["production_order_id"])
+    assert (order.priority, order.due_date) == (3, start)
+
+    # 10 units at 4 a day: units on days 0, 1 and 2, completed on day 3
+    expected = [start + timedelta(days=2), start + timedelta(days=3), start + timedelta(days=3)]
+    for day in expected:
+        engine.run_days(1)
+        db_session.refresh(order)
+        assert order.expected_completion_date == day
+    engine.run_days(1)
+    db_session.refresh(order)
+    assert (order.status, order.expected_completion_date) == ("completed", start + timedelta(days=3))
+
+
+def test_release_reports_the_requested_lines_it_cannot_release(db_session):
+    fulfilled, later = db_session.query(DailyPlan).order_by(DailyPlan.day, DailyPlan.id).limit(2).all()
+    fulfilled.status = "fulfilled"
+    db_session.commit()
+
+    result = release_production_batch(db_session, plan_ids=[fulfilled.id, later.id, 9999],
+                                      end_day=later.day - timedelta(days=1))
+    assert result["released"] == []
+    assert {line["plan_id"]: line["reason"] for line in result["blocked"]} == {
+        fulfilled.id: "Plan line is fulfilled, not pending",
+        later.id: "Plan line outside the requested days",
+        9999: "Plan line not found",
+    }
+
+
+def test_release_needs_ids_or_days(db_session):
+    with pytest.raises(ValueError):
+        release_production_batch(db_session)
@@ -0,0 +1,48 @@
+"""
+SQL statements each route may issue: a budget exceeded means a query went
+into a loop (N+1) or a route started loading more than it needs.
+"""
+import pytest
+from profiler import get_profile
+
+# (method, route, statements at most)
+BUDGETS = [
+    ("GET", "/app/inventory/", 1),
+    ("GET", "/app/inventory/1/history?start=2025-05-01&end=2025-06-30", 3),
+    ("GET", "/app/products/", 1),
+    ("GET", "/app/suppliers/", 1),
+    ("GET", "/app/plan/", 1),
+    ("GET", "/app/production/orders/", 1),
+    ("GET", "/app/purchases/orders/", 1),
+    ("GET", "/app/bom/1", 1),
+    ("GET", "/app/mrp", 6),
+    ("GET", "/app/kpi", 1),
+    ("GET", "/app/events/", 2),
+    ("GET", "/app/events/page", 2),
+    ("GET", "/app/simulator/current-day", 1),
+]
+
+
+@pytest.mark.parametrize("method,path,budget", BUDGETS, ids=[f"{m} {p}" for m, p, _ in BUDGETS])
+def test_route_stays_within_its_query_budget(max_queries, method, path, budget):
+    max_queries(method, path, budget)
+
+
+def test_simulated_day_stays_within_its_query_budget(max_queries):
+    response = max_queries("POST", "/app/simulator/run?days=1", 30)
+    assert "day" in response.json()  # a single-day run
+
+
+def test_select_rows_are_counted(max_queries):
+    response = max_queries("GET", "/app/products/", 1)
+    statements = get_profile(response.headers["X-Profile-Id"]).statements
+    assert [s["rows"] for s in statements] == [len(response.json())]
+
+
+def test_stream_is_profiled_until_it_ends(max_queries):
+    max_queries("POST", "/app/simulator/run?days=1", 30)
+    response = max_queries("GET", "/app/events/stream", 2)
+    current = get_profile(response.headers["X-Profile-Id"])
+    # The events SELECT runs inside the body, after the route returned
+    assert current.statements, "las consultas del cuerpo del stream no se registraron"
+    assert current.statements[0]["rows"] == len(response.text.splitlines()) > 0